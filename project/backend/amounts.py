@@ -0,0 +1,145 @@
+# Locale-aware amount parsing.
+# parse_amounts() converts a whole column of amounts with vectorised (numpy) string
+# ops: the decimal separator is detected once per column ("1.234,56" vs
+# "1,234.56"), and parentheses, leading or trailing minus signs, DR/CR markers,
+# currency symbols/codes (including abbreviations such as "Rs.") and grouping
+# characters are handled. parse_amount() is the scalar equivalent for single values.
+import re
+
+# pandas and numpy are imported on first use to keep application start-up fast
+
+# Markers that make an amount negative (DR: debit on a bank statement); CR and currency codes are just dropped
+_PARENTHESES = r'\(.*\d.*\)'
+_LEADING_MINUS = r'^[^\d]*-\s*[^\d-]*\d'
+_TRAILING_MINUS = r'\d[^\d-]*-[^\d]*$'
+_DEBIT = r'(?<![A-Z])(?:DR|DEBIT)(?![A-Z])'
+_NEGATIVE = re.compile('|'.join((_PARENTHESES, _LEADING_MINUS, _TRAILING_MINUS, _DEBIT)))
+_NOT_NUMERIC = re.compile(r'[^\d.,]')
+# A dot or comma ending an abbreviation ('Rs.', 'Rs.1,200', 'EUR.') is not a separator
+_ABBREVIATION_DOT = re.compile(r'(?<=[A-Za-z])[.,]')
+_PLAIN_NUMBER = re.compile(r'^-?\d+(?:\.\d+)?$')
+# Unicode minus and dashes, and the non-breaking/thin spaces and apostrophes used for grouping
+_TRANSLATE = str.maketrans({'−': '-', '–': '-', '—': '-', ' ': ' ', ' ': ' ', "'": '', '’': ''})
+
+# Values inspected to detect a column's decimal separator
+DETECTION_SAMPLE = 10000
+# Evidence for the decimal separator in a single value
+_COMMA_DECIMAL = (r'\.\d{3},\d+(?:\D*)$', r'^[^.]*,\d{1,2}(?:\D*)$', r'^[^,]*\d\.\d{3}\.\d{3}')
+_DOT_DECIMAL = (r',\d{3}\.\d+(?:\D*)$', r'^[^,]*\.\d{1,2}(?:\D*)$', r'^[^.]*\d,\d{3},\d{3}')
+_COMMA_DECIMAL_RE = [re.compile(pattern) for pattern in _COMMA_DECIMAL]
+_DOT_DECIMAL_RE = [re.compile(pattern) for pattern in _DOT_DECIMAL]
+
+def detect_decimal_separator(values):
+    """'.' or ',' for a column of amount strings, by counting unambiguous values (ties: '.')"""
+    import pandas as pd
+    text = values if isinstance(values, pd.Series) else pd.Series(list(values), dtype=object)
+    text = text[text.map(type) == str]
+    if text.empty:
+        return '.'
+    # An evenly spaced sample is enough to tell the convention of a large column
+    text = text.iloc[::max(1, len(text) // DETECTION_SAMPLE)].str.replace(_ABBREVIATION_DOT.pattern, '', regex=True)
+    comma = sum(int(text.str.contains(pattern, regex=True).sum()) for pattern in _COMMA_DECIMAL)
+    dot = sum(int(text.str.contains(pattern, regex=True).sum()) for pattern in _DOT_DECIMAL)
+    return ',' if comma > dot else '.'
+
+def _value_decimal(text):
+    if any(pattern.search(text) for pattern in _COMMA_DECIMAL_RE):
+        return ','
+    return '.'
+
+def _digits(digits, decimal):
+    """Separators resolved for one value: the last separator wins when both occur, repeated ones are grouping"""
+    dots, commas = digits.count('.'), digits.count(',')
+    if dots and commas:
+        decimal = ',' if digits.rfind(',') > digits.rfind('.') else '.'
+    elif dots > 1:
+        decimal = ','
+    elif commas > 1:
+        decimal = '.'
+    elif commas == 1 and len(digits) - digits.rfind(',') <= 3:
+        # One or two digits after a single separator cannot be grouping
+        decimal = ','
+    elif dots == 1 and len(digits) - digits.rfind('.') <= 3:
+        decimal = '.'
+    if decimal == ',':
+        return digits.replace('.', '').replace(',', '.')
+    return digits.replace(',', '')
+
+def parse_amount(value, decimal=None):
+    """Signed float for one amount ('1.234,56 EUR', '(500.00)', '1,234.56 DR', '$ 12'); None if unparseable.
+
+    decimal is the separator convention of the value's column; detected from the value itself when None.
+    """
+    if isinstance(value, bool) or value is None:
+        return None
+    if isinstance(value, (int, float)):
+        return None if value != value else float(value)
+    text = str(value).translate(_TRANSLATE).strip().upper()
+    if _PLAIN_NUMBER.match(text) and decimal != ',':
+        return float(text)
+    text = _ABBREVIATION_DOT.sub('', text)
+    digits = _NOT_NUMERIC.sub('', text).rstrip('.,')
+    if not digits or not any(character.isdigit() for character in digits):
+        return None
+    try:
+        amount = float(_digits(digits, decimal or _value_decimal(text)))
+    except ValueError:
+        return None
+    return -amount if _NEGATIVE.search(text) else amount
+
+def _parse_text(text, decimal):
+    """Vectorised parse of a Series of stripped amount strings (numpy string ufuncs; regex only for decorated values)"""
+    import numpy as np
+    import pandas as pd
+    values = np.array(text.tolist(), dtype=np.dtypes.StringDType())
+    negative = np.strings.startswith(values, '-')
+    digits = np.strings.lstrip(values, '-')
+    # Values made of digits and separators only skip the regex passes
+    clean = np.strings.isdecimal(np.strings.replace(np.strings.replace(digits, ',', ''), '.', ''))
+    decorated = np.flatnonzero(~clean)
+    if len(decorated):
+        messy = pd.Series(values[decorated]).str.translate(_TRANSLATE).str.replace(_ABBREVIATION_DOT.pattern, '', regex=True)
+        negative[decorated] = messy.str.contains(_NEGATIVE.pattern, case=False, regex=True).to_numpy(dtype=bool)
+        digits[decorated] = messy.str.replace(_NOT_NUMERIC.pattern, '', regex=True).str.rstrip('.,').to_numpy(dtype=str)
+
+    dots, commas = np.strings.count(digits, '.'), np.strings.count(digits, ',')
+    length = np.strings.str_len(digits)
+    last_dot, last_comma = np.strings.rfind(digits, '.'), np.strings.rfind(digits, ',')
+    # Column convention, overridden where the value itself is unambiguous (see _digits)
+    use_comma = np.full(len(values), decimal == ',')
+    use_comma[(dots > 0) & (commas > 0)] = (last_comma > last_dot)[(dots > 0) & (commas > 0)]
+    use_comma[(commas == 0) & (dots > 1)] = True
+    use_comma[(dots == 0) & (commas > 1)] = False
+    use_comma[(dots == 0) & (commas == 1) & (length - last_comma <= 3)] = True
+    use_comma[(commas == 0) & (dots == 1) & (length - last_dot <= 3)] = False
+    number = np.where(use_comma,
+                      np.strings.replace(np.strings.replace(digits, '.', ''), ',', '.'),
+                      np.strings.replace(digits, ',', ''))
+    bare = np.strings.replace(number, '.', '')
+    valid = (np.strings.count(number, '.') <= 1) & (np.strings.str_len(bare) > 0) & np.strings.isdecimal(bare)
+    amounts = np.full(len(values), np.nan)
+    amounts[valid] = number[valid].astype(np.float64)
+    return pd.Series(np.where(negative, -amounts, amounts), index=text.index)
+
+def parse_amounts(values, decimal=None):
+    """Vectorised parse_amount over a column; returns a float Series (NaN where unparseable).
+
+    decimal ('.' or ',') is detected from the column's strings when None.
+    """
+    import numpy as np
+    import pandas as pd
+    series = values if isinstance(values, pd.Series) else pd.Series(list(values), dtype=object)
+    if pd.api.types.is_bool_dtype(series):
+        return pd.Series(np.nan, index=series.index)
+    if pd.api.types.is_numeric_dtype(series):
+        return series.astype(float)
+    types = series.map(type)
+    is_text = types == str
+    result = pd.to_numeric(series.where(~is_text & (types != bool)), errors='coerce').astype(float)
+    if not is_text.any():
+        return result
+    text = series[is_text].str.strip()
+    text = text[text != '']
+    if not text.empty:
+        result.loc[text.index] = _parse_text(text, decimal or detect_decimal_separator(text))
+    return result
@@ -0,0 +1,220 @@
+# Append-only audit log of LLM exchanges and document analyses.
+# record() only puts the entry on a bounded in-memory queue, so request handlers
+# never wait on disk; when the queue is full the entry is dropped and counted. A
+# background thread collects entries for up to AUDIT_LOG_FLUSH_SECONDS, parses
+# JSON responses, and appends each batch as one gzip member to the current
+# segment (audit-<time>-<pid>-<seq>.jsonl.gz). Segments rotate by size and age;
+# a crash loses at most the batch being written. read_records() reads the log
+# back in order and replay_responses() turns it into canned answers for the fake
+# OpenAI server, so captured traffic can drive benchmarks and regression runs.
+import os
+import json
+import gzip
+import time
+import queue
+import atexit
+import hashlib
+import logging
+import threading
+
+import metrics
+
+AUDIT_LOG_ENABLED = os.getenv("AUDIT_LOG_ENABLED", "1") == "1"
+AUDIT_LOG_DIR = os.getenv("AUDIT_LOG_DIR", "audit_logs")
+# Prompts hold the full document text, so they are only kept on request; without them the log
+# still has prompt hashes (enough for replay), responses and timings
+AUDIT_LOG_PROMPTS = os.getenv("AUDIT_LOG_PROMPTS", "0") == "1"
+AUDIT_LOG_QUEUE_SIZE = int(os.getenv("AUDIT_LOG_QUEUE_SIZE", "100000"))
+AUDIT_LOG_BATCH_SIZE = int(os.getenv("AUDIT_LOG_BATCH_SIZE", "500"))
+AUDIT_LOG_FLUSH_SECONDS = float(os.getenv("AUDIT_LOG_FLUSH_SECONDS", "1.0"))
+AUDIT_LOG_SEGMENT_BYTES = int(os.getenv("AUDIT_LOG_SEGMENT_BYTES", str(64 * 1024 * 1024)))
+AUDIT_LOG_SEGMENT_SECONDS = float(os.getenv("AUDIT_LOG_SEGMENT_SECONDS", "3600"))
+AUDIT_LOG_COMPRESSION_LEVEL = int(os.getenv("AUDIT_LOG_COMPRESSION_LEVEL", "6"))
+
+AUDIT_RECORDS = metrics.REGISTRY.counter(
+    "finance_ai_audit_records_total",
+    "Audit log entries by kind and outcome (written, dropped because the queue was full, failed)",
+    ["kind", "outcome"],
+)
+
+def prompt_hash(model, messages):
+    """Stable hash of a chat request (model and messages); the replay key"""
+    payload = json.dumps([model, messages], sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+def _parsed(response):
+    """JSON object in a response (as extract_json_from_response finds it), or None"""
+    start, end = (response or "").find("{"), (response or "").rfind("}")
+    if start < 0 or end < start:
+        return None
+    try:
+        return json.loads(response[start:end + 1])
+    except ValueError:
+        return None
+
+class AuditLog:
+    """Bounded queue of entries drained by a background writer into rotating gzip JSON-lines segments"""
+
+    def __init__(self, directory=AUDIT_LOG_DIR, enabled=AUDIT_LOG_ENABLED, queue_size=AUDIT_LOG_QUEUE_SIZE,
+                 batch_size=AUDIT_LOG_BATCH_SIZE, flush_seconds=AUDIT_LOG_FLUSH_SECONDS,
+                 segment_bytes=AUDIT_LOG_SEGMENT_BYTES, segment_seconds=AUDIT_LOG_SEGMENT_SECONDS):
+        self.directory = directory
+        self.enabled = enabled
+        self.batch_size = batch_size
+        self.flush_seconds = flush_seconds
+        self.segment_bytes = segment_bytes
+        self.segment_seconds = segment_seconds
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._thread = None
+        self._lock = threading.Lock()
+        self._segment = None
+        self._segment_opened = 0.0
+        self._sequence = 0
+        self.written = self.dropped = self.segments = 0
+
+    def _start(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="audit-log-writer", daemon=True)
+                self._thread.start()
+                atexit.register(self.flush)
+
+    def record(self, kind, **fields):
+        """Queue an entry; never blocks (the entry is dropped when the queue is full)"""
+        if not self.enabled:
+            return
+        if self._thread is None:
+            self._start()
+        try:
+            self._queue.put_nowait({"kind": kind, "ts": time.time(), **fields})
+        except queue.Full:
+            self.dropped += 1
+            AUDIT_RECORDS.inc(kind=kind, outcome="dropped")
+
+    def flush(self, timeout=10.0):
+        """Wait until everything queued so far is on disk"""
+        if self._thread is None:
+            return True
+        done = threading.Event()
+        try:
+            self._queue.put(done, timeout=timeout)
+        except queue.Full:
+            return False
+        return done.wait(timeout)
+
+    # --- WRITER THREAD ---
+    def _run(self):
+        while True:
+            batch, markers = [], []
+            item = self._queue.get()
+            deadline = time.monotonic() + self.flush_seconds
+            while True:
+                if isinstance(item, threading.Event):
+                    # A flush() marker: write what was collected so far straight away
+                    markers.append(item)
+                    break
+                batch.append(item)
+                if len(batch) >= self.batch_size:
+                    break
+                try:
+                    item = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+            if batch:
+                self._write(batch)
+            for marker in markers:
+                marker.set()
+
+    def _open_segment(self):
+        os.makedirs(self.directory, exist_ok=True)
+        self._sequence += 1
+        name = f"audit-{time.strftime('%Y%m%dT%H%M%S')}-{os.getpid()}-{self._sequence:04d}.jsonl.gz"
+        self._segment = open(os.path.join(self.directory, name), "ab")
+        self._segment_opened = time.monotonic()
+        self.segments += 1
+
+    def _write(self, batch):
+        lines = []
+        for entry in batch:
+            # Hashing and parsing happen here, off the request path
+            if "messages" in entry:
+                entry["prompt_hash"] = prompt_hash(entry.get("model"), entry["messages"])
+                if not AUDIT_LOG_PROMPTS:
+                    del entry["messages"]
+            if entry.get("response") is not None and "parsed" not in entry:
+                entry["parsed"] = _parsed(entry["response"])
+            lines.append(json.dumps(entry, default=str, ensure_ascii=False))
+        try:
+            if self._segment is not None and (self._segment.tell() >= self.segment_bytes
+                                              or time.monotonic() - self._segment_opened >= self.segment_seconds):
+                self._segment.close()
+                self._segment = None
+            if self._segment is None:
+                self._open_segment()
+            # One gzip member per batch: members concatenate into a valid gzip stream
+            self._segment.write(gzip.compress(("\n".join(lines) + "\n").encode(), compresslevel=AUDIT_LOG_COMPRESSION_LEVEL))
+            self._segment.flush()
+        except OSError as e:
+            logging.warning(f"Audit log write failed: {e}")
+            for entry in batch:
+                AUDIT_RECORDS.inc(kind=entry["kind"], outcome="failed")
+            return
+        self.written += len(batch)
+        for entry in batch:
+            AUDIT_RECORDS.inc(kind=entry["kind"], outcome="written")
+    # --- END WRITER THREAD ---
+
+    def shutdown(self):
+        self.flush()
+        with self._lock:
+            if self._segment is not None:
+                self._segment.close()
+                self._segment = None
+
+    def stats(self):
+        return {
+            "enabled": self.enabled,
+            "directory": self.directory,
+            "queued": self._queue.qsize(),
+            "written": self.written,
+            "dropped": self.dropped,
+            "segments": self.segments,
+        }
+
+audit_log = AuditLog()
+metrics.REGISTRY.gauge(
+    "finance_ai_audit_queue_depth",
+    "Audit log entries waiting for the background writer",
+    callback=lambda: audit_log.stats()["queued"],
+)
+
+# --- REPLAY ---
+def segment_paths(path):
+    """Segment files of a log directory in order (or [path] for a single segment)"""
+    if os.path.isdir(path):
+        return sorted(os.path.join(path, name) for name in os.listdir(path) if name.startswith("audit-") and name.endswith(".jsonl.gz"))
+    return [path]
+
+def read_records(path, kinds=None):
+    """Entries of an audit log directory or segment in order; a segment cut short by a crash ends at its last whole line"""
+    for segment in segment_paths(path):
+        with gzip.open(segment, "rt", encoding="utf-8") as f:
+            try:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        break
+                    if kinds is None or entry.get("kind") in kinds:
+                        yield entry
+            except (EOFError, gzip.BadGzipFile):
+                continue
+
+def replay_responses(path):
+    """prompt hash -> upstream responses in captured order, for FakeOpenAIServer(replay=...)"""
+    responses = {}
+    for entry in read_records(path, kinds={"llm_call"}):
+        if entry.get("outcome") == "ok":
+            responses.setdefault(entry["prompt_hash"], []).append(entry["response"])
+    return responses
+# --- END REPLAY ---
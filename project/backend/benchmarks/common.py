@@ -0,0 +1,95 @@
+# Shared helpers for the benchmark scripts: result files and regression comparison.
+import os
+import sys
+import json
+import platform
+import statistics
+from datetime import datetime
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_DIR = os.getenv("BENCH_RESULTS_DIR", os.path.join(BACKEND_DIR, "benchmarks", "results"))
+
+def environment():
+    """Machine details stored alongside every result so runs are comparable"""
+    return {
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+    }
+
+def summarize(samples):
+    """Latency summary (seconds) for a list of samples"""
+    if not samples:
+        return {"count": 0}
+    ordered = sorted(samples)
+    def pct(p):
+        return ordered[min(len(ordered) - 1, int(round(p / 100.0 * (len(ordered) - 1))))]
+    return {
+        "count": len(ordered),
+        "mean": statistics.fmean(ordered),
+        "min": ordered[0],
+        "p50": pct(50),
+        "p95": pct(95),
+        "p99": pct(99),
+        "max": ordered[-1],
+    }
+
+def save_results(name, data, path=None):
+    """Write a result document to benchmarks/results/<name>-<timestamp>.json"""
+    document = {
+        "benchmark": name,
+        "created_at": datetime.now().isoformat(),
+        "environment": environment(),
+        "results": data,
+    }
+    if path is None:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        path = os.path.join(RESULTS_DIR, f"{name}-{datetime.now().strftime('%Y%m%d-%H%M%S')}.json")
+    with open(path, "w") as f:
+        json.dump(document, f, indent=2)
+    return path
+
+def load_results(path):
+    with open(path) as f:
+        return json.load(f)
+
+# Configuration and bookkeeping values that are not performance metrics
+IGNORED_SECTIONS = {"settings", "status_counts", "environment", "fake_llm", "llm_requests", "escalation_rate"}
+IGNORED_FIELDS = {"count", "requests", "rows", "pages", "warm_up", "lines", "balanced", "issues_found", "reviewed_rows", "llm_requests", "duplicate_rows", "candidate_pairs", "near_hits", "matches", "tokens", "exact_matches", "partial_payments"}
+
+def _flatten(prefix, value, out):
+    if isinstance(value, dict):
+        for key, inner in value.items():
+            _flatten(f"{prefix}.{key}" if prefix else str(key), inner, out)
+    elif isinstance(value, (int, float)) and not isinstance(value, bool):
+        out[prefix] = float(value)
+    return out
+
+def compare(baseline, current, threshold=0.10):
+    """Compare two result documents; returns rows for every numeric metric.
+
+    Metrics whose name ends in a latency/duration unit are regressions when they
+    grow by more than threshold; throughput metrics when they shrink by more.
+    """
+    old = _flatten("", baseline.get("results", baseline), {})
+    new = _flatten("", current.get("results", current), {})
+    rows = []
+    for key in sorted(set(old) & set(new)):
+        parts = key.split(".")
+        if set(parts) & IGNORED_SECTIONS or parts[-1] in IGNORED_FIELDS:
+            continue
+        before, after = old[key], new[key]
+        change = (after - before) / before if before else 0.0
+        higher_is_better = any(token in key for token in ("per_second", "throughput", "accuracy", "hit_rate"))
+        regressed = change < -threshold if higher_is_better else change > threshold
+        rows.append({"metric": key, "baseline": before, "current": after, "change": change, "regressed": regressed})
+    return rows
+
+def print_comparison(rows):
+    regressions = 0
+    for row in rows:
+        flag = "REGRESSION" if row["regressed"] else ""
+        regressions += row["regressed"]
+        print(f"{row['metric']:<60} {row['baseline']:>14.6g} {row['current']:>14.6g} {row['change']:>+8.1%} {flag}")
+    print(f"{regressions} regression(s) out of {len(rows)} metrics")
+    return regressions
@@ -0,0 +1,350 @@
+"""Reproducible synthetic document corpus for the benchmarks.
+
+    python -m benchmarks.corpus --out /tmp/finance-corpus [--seed 7] [--sizes small,medium,large]
+
+Everything is generated offline from a seeded RNG: digital (text) PDFs, scanned
+image-only PDFs, PNG receipts (plus phone-photo JPEGs of them), DOCX, CSV and
+XLSX bank exports and digital PDF bank statements. A manifest.json records each file's ground-truth text and final
+total so OCR accuracy and amount extraction can be scored. Transaction lists of
+1k..1M rows are produced in memory by synthetic_transactions(), and ledgers of
+invoices, bills and the bank transactions that pay them by synthetic_ledger().
+"""
+import os
+import json
+import random
+import argparse
+from datetime import date, timedelta
+
+VENDORS = [
+    "Acme Supplies BV", "Northwind Traders", "AWS EMEA SARL", "Contoso Office", "Globex Logistics",
+    "Initech Software", "Umbrella Facilities", "Stark Industrial", "Wayne Catering", "Hooli Cloud",
+]
+CUSTOMERS = ["Tyrell Corp", "Cyberdyne Systems", "Soylent Foods", "Oscorp Retail", "Vandelay Imports"]
+ITEMS = ["Consulting hours", "Office chairs", "Cloud hosting", "Printer toner", "Freight", "Licences", "Catering", "Repairs"]
+CATEGORIES = ["bank-transactions", "invoices", "bills", "inventory", "item-restocks", "manual-journals", "general-ledgers", "general-entries"]
+DASHBOARD_CATEGORIES = ["Cash Balance", "Revenue", "Expenses", "Net Burn"]
+
+# (pages per PDF, line items per document, rows per bank export)
+SIZES = {
+    "small": (1, 5, 50),
+    "medium": (3, 25, 1000),
+    "large": (10, 80, 20000),
+}
+
+def _random_date(rng, start=date(2024, 1, 1), days=365):
+    return start + timedelta(days=rng.randrange(days))
+
+def make_invoice(rng, line_items, number):
+    """Invoice text lines plus the ground-truth grand total"""
+    vendor = rng.choice(VENDORS)
+    customer = rng.choice(CUSTOMERS)
+    issued = _random_date(rng)
+    lines = [
+        f"INVOICE #{number:06d}",
+        f"From: {vendor}",
+        f"Bill to: {customer}",
+        f"Date: {issued.isoformat()}",
+        f"Due date: {(issued + timedelta(days=30)).isoformat()}",
+        "",
+    ]
+    subtotal = 0.0
+    for _ in range(line_items):
+        quantity = rng.randint(1, 20)
+        price = round(rng.uniform(5, 500), 2)
+        amount = round(quantity * price, 2)
+        subtotal += amount
+        lines.append(f"{rng.choice(ITEMS):<20} {quantity:>3} x {price:>9.2f} = {amount:>10.2f}")
+    subtotal = round(subtotal, 2)
+    tax = round(subtotal * 0.21, 2)
+    total = round(subtotal + tax, 2)
+    lines += ["", f"Subtotal: {subtotal:.2f}", f"VAT 21%: {tax:.2f}", f"Total: {total:.2f}"]
+    return {"lines": lines, "total": total, "vendor": vendor, "date": issued.isoformat()}
+
+def bank_export_rows(rng, rows):
+    balance = round(rng.uniform(1000, 50000), 2)
+    out = []
+    day = date(2024, 1, 1)
+    for i in range(rows):
+        day += timedelta(days=rng.random() < 0.3)
+        amount = round(rng.uniform(1, 5000), 2)
+        debit = rng.random() < 0.6
+        balance = round(balance - amount if debit else balance + amount, 2)
+        out.append({
+            "Date": day.isoformat(),
+            "Description": f"{rng.choice(VENDORS if debit else CUSTOMERS)} REF{rng.randrange(10**6):06d}",
+            "Debit": amount if debit else None,
+            "Credit": None if debit else amount,
+            "Balance": balance,
+        })
+    return out
+
+def _pdf_escape(text):
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+def _write_pdf(path, streams):
+    """Write a minimal PDF with one content stream per A4 page (Helvetica as /F1)"""
+    objects = []
+    page_ids = []
+    font_id = 3
+    objects.append(None)  # 1: catalog, filled below
+    objects.append(None)  # 2: pages tree, filled below
+    objects.append(b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>")
+    for stream in streams:
+        objects.append(b"<< /Length %d >>\nstream\n" % len(stream) + stream + b"\nendstream")
+        content_id = len(objects)
+        objects.append(
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] "
+            f"/Resources << /Font << /F1 {font_id} 0 R >> >> /Contents {content_id} 0 R >>".encode()
+        )
+        page_ids.append(len(objects))
+    objects[0] = b"<< /Type /Catalog /Pages 2 0 R >>"
+    objects[1] = f"<< /Type /Pages /Kids [{' '.join(f'{i} 0 R' for i in page_ids)}] /Count {len(page_ids)} >>".encode()
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += f"{number} 0 obj\n".encode() + body + b"\nendobj\n"
+    xref = len(out)
+    out += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode()
+    for offset in offsets:
+        out += f"{offset:010d} 00000 n \n".encode()
+    out += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode()
+    with open(path, "wb") as f:
+        f.write(out)
+
+def write_text_pdf(path, pages):
+    """Write a minimal digital PDF (Helvetica text) with one list of lines per page"""
+    streams = []
+    for lines in pages:
+        ops = ["BT", "/F1 10 Tf", "12 TL", "50 800 Td"]
+        for line in lines:
+            ops.append(f"({_pdf_escape(line)}) Tj T*")
+        ops.append("ET")
+        streams.append("\n".join(ops).encode("latin-1", "replace"))
+    _write_pdf(path, streams)
+
+# Helvetica advance widths (1/1000 em) of the characters in formatted amounts
+_HELVETICA_WIDTHS = {",": 278, ".": 278, "-": 333}
+
+def _text_width(text, font_size):
+    return sum(_HELVETICA_WIDTHS.get(character, 556) for character in text) * font_size / 1000
+
+# Statement columns: (header, x, right-aligned)
+STATEMENT_COLUMNS = [("Date", 40, False), ("Description", 105, False), ("Paid out", 400, True),
+                     ("Paid in", 475, True), ("Balance", 555, True)]
+
+def write_statement_pdf(path, rows, rows_per_page=40, seed=7):
+    """Write a digital bank statement: positioned table columns, right-aligned amounts,
+    wrapped descriptions, brought/carried forward balances and a page footer"""
+    rng = random.Random(seed)
+    font_size = 8
+    pages = [rows[i:i + rows_per_page] for i in range(0, len(rows), rows_per_page)] or [[]]
+    streams = []
+    balance = rows[0]["Balance"] + (rows[0]["Debit"] or 0) - (rows[0]["Credit"] or 0) if rows else 0.0
+
+    for number, page_rows in enumerate(pages, start=1):
+        ops = [f"BT /F1 {font_size} Tf"]
+        def cell(text, x, y, right=False):
+            if right:
+                x -= _text_width(text, font_size)
+            ops.append(f"1 0 0 1 {x:.2f} {y:.2f} Tm ({_pdf_escape(text)}) Tj")
+        y = 800
+        cell("Example Bank - Current account statement", 40, y)
+        cell(f"Account NL00EXAM0123456789    Page {number} of {len(pages)}", 40, y - 12)
+        y -= 40
+        for header, x, right in STATEMENT_COLUMNS:
+            cell(header, x, y, right)
+        y -= 14
+        cell("Balance brought forward", 105, y)
+        cell(f"{balance:,.2f}", 555, y, True)
+        for row in page_rows:
+            y -= 14
+            cell(row["Date"], 40, y)
+            cell(row["Description"], 105, y)
+            if row["Debit"] is not None:
+                cell(f"{row['Debit']:,.2f}", 400, y, True)
+            if row["Credit"] is not None:
+                cell(f"{row['Credit']:,.2f}", 475, y, True)
+            cell(f"{row['Balance']:,.2f}", 555, y, True)
+            balance = row["Balance"]
+            if rng.random() < 0.2:
+                y -= 10
+                cell(f"Card 4{rng.randrange(10**3):03d} ref {rng.randrange(10**8):08d}", 105, y)
+        y -= 14
+        cell("Balance carried forward", 105, y)
+        cell(f"{balance:,.2f}", 555, y, True)
+        cell("Example Bank N.V. is authorised by the central bank.", 40, 40)
+        ops.append("ET")
+        streams.append("\n".join(ops).encode("latin-1", "replace"))
+    _write_pdf(path, streams)
+
+def render_lines(rng, lines, width=1240, line_height=34, font_size=24, noise=True, skew=True):
+    """Render text lines to a 'scanned' grayscale image (150 dpi A4 width)"""
+    from PIL import Image, ImageDraw, ImageFont
+    font = ImageFont.load_default(size=font_size)
+    height = max(400, 120 + line_height * len(lines))
+    image = Image.new("L", (width, height), 255)
+    draw = ImageDraw.Draw(image)
+    for i, line in enumerate(lines):
+        draw.text((80, 60 + i * line_height), line, fill=0, font=font)
+    if noise:
+        pixels = image.load()
+        for _ in range(width * height // 400):
+            pixels[rng.randrange(width), rng.randrange(height)] = rng.randrange(120, 255)
+    if skew:
+        image = image.rotate(rng.uniform(-1.5, 1.5), expand=False, fillcolor=255)
+    return image
+
+def phone_photo(image, scale=3, margin=600, angle=2.5):
+    """Make a scan look like a phone photo: upscaled, on a grey background, rotated"""
+    from PIL import Image
+    page = image.resize((image.width * scale, image.height * scale))
+    photo = Image.new("L", (page.width + 2 * margin, page.height + 2 * margin), 200)
+    photo.paste(page, (margin, margin))
+    return photo.rotate(angle, fillcolor=200)
+
+def _paginate(lines, pages):
+    per_page = max(1, -(-len(lines) // pages))
+    return [lines[i:i + per_page] for i in range(0, len(lines), per_page)][:pages] or [[]]
+
+def generate_corpus(out_dir, seed=7, sizes=("small", "medium")):
+    """Write the corpus to out_dir and return the manifest"""
+    import pandas as pd
+    from docx import Document
+
+    rng = random.Random(seed)
+    os.makedirs(out_dir, exist_ok=True)
+    manifest = {"seed": seed, "files": []}
+
+    def record(name, kind, size, text, total=None, pages=1, **extra):
+        manifest["files"].append({
+            "file": name, "kind": kind, "size": size, "pages": pages,
+            "extension": os.path.splitext(name)[1], "text": text, "total": total, **extra,
+        })
+
+    number = 1000
+    for size in sizes:
+        pages, line_items, rows = SIZES[size]
+
+        number += 1
+        invoice = make_invoice(rng, line_items, number)
+        name = f"digital-invoice-{size}.pdf"
+        write_text_pdf(os.path.join(out_dir, name), _paginate(invoice["lines"], pages))
+        record(name, "digital_pdf", size, "\n".join(invoice["lines"]), invoice["total"], pages, vendor=invoice["vendor"])
+
+        number += 1
+        invoice = make_invoice(rng, line_items, number)
+        name = f"scanned-invoice-{size}.pdf"
+        images = [render_lines(rng, chunk) for chunk in _paginate(invoice["lines"], pages)]
+        images[0].save(os.path.join(out_dir, name), "PDF", resolution=150, save_all=True, append_images=images[1:])
+        record(name, "scanned_pdf", size, "\n".join(invoice["lines"]), invoice["total"], len(images), vendor=invoice["vendor"])
+
+        number += 1
+        receipt = make_invoice(rng, min(line_items, 15), number)
+        name = f"receipt-{size}.png"
+        receipt_image = render_lines(rng, receipt["lines"])
+        receipt_image.save(os.path.join(out_dir, name))
+        record(name, "receipt_png", size, "\n".join(receipt["lines"]), receipt["total"], vendor=receipt["vendor"])
+        name = f"receipt-photo-{size}.jpg"
+        phone_photo(receipt_image).save(os.path.join(out_dir, name), quality=85)
+        record(name, "receipt_photo", size, "\n".join(receipt["lines"]), receipt["total"], vendor=receipt["vendor"])
+
+        number += 1
+        invoice = make_invoice(rng, line_items, number)
+        name = f"invoice-{size}.docx"
+        document = Document()
+        for line in invoice["lines"]:
+            document.add_paragraph(line)
+        document.save(os.path.join(out_dir, name))
+        record(name, "docx", size, "\n".join(line for line in invoice["lines"] if line.strip()), invoice["total"], vendor=invoice["vendor"])
+
+        frame = pd.DataFrame(bank_export_rows(rng, rows))
+        name = f"bank-export-{size}.csv"
+        frame.to_csv(os.path.join(out_dir, name), index=False)
+        record(name, "bank_csv", size, None, rows=rows)
+        name = f"bank-export-{size}.xlsx"
+        frame.to_excel(os.path.join(out_dir, name), index=False)
+        record(name, "bank_xlsx", size, None, rows=rows)
+        name = f"bank-statement-{size}.pdf"
+        write_statement_pdf(os.path.join(out_dir, name), frame.to_dict("records"), seed=seed)
+        record(name, "statement_pdf", size, None, pages=-(-rows // 40), rows=rows)
+
+    with open(os.path.join(out_dir, "manifest.json"), "w") as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
+
+def load_manifest(corpus_dir):
+    with open(os.path.join(corpus_dir, "manifest.json")) as f:
+        return json.load(f)
+
+def synthetic_transactions(count, seed=7):
+    """Transaction dicts shaped like the frontend's TransactionData"""
+    rng = random.Random(seed + count)
+    start = date(2024, 1, 1)
+    out = []
+    for i in range(count):
+        category = rng.choice(CATEGORIES)
+        out.append({
+            "id": f"t{i}",
+            "date": (start + timedelta(days=rng.randrange(365))).isoformat(),
+            "description": f"{rng.choice(VENDORS)} {rng.choice(ITEMS)} #{rng.randrange(10**5)}",
+            "amount": round(rng.lognormvariate(5, 1.2), 2),
+            "category": category,
+            "type": "credit" if rng.random() < 0.45 else "debit",
+            "dashboardCategory": rng.choice(DASHBOARD_CATEGORIES),
+            "vendor": rng.choice(VENDORS),
+        })
+    return out
+
+def synthetic_ledger(count, seed=7):
+    """count invoices and bills plus bank transactions paying them; returns (transactions, bank id -> document id).
+
+    Most documents are paid in full a few days to two months later, some in two or three
+    instalments and the rest not at all; unrelated bank transactions are mixed in.
+    """
+    rng = random.Random(seed + count)
+    transactions, truth = [], {}
+    def bank(party, amount, day, credit):
+        bank_id = f"b{len(transactions)}"
+        transactions.append({
+            "id": bank_id, "date": day.isoformat(), "description": f"{party.upper()} REF{rng.randrange(10**8):08d}",
+            "amount": amount, "category": "bank-transactions", "type": "credit" if credit else "debit",
+        })
+        return bank_id
+    for number in range(count):
+        invoice = rng.random() < 0.5
+        party = rng.choice(CUSTOMERS if invoice else VENDORS)
+        amount = round(rng.lognormvariate(6, 1.2), 2)
+        issued = _random_date(rng)
+        document_id = f"{'inv' if invoice else 'bill'}{number}"
+        transactions.append({
+            "id": document_id, "date": issued.isoformat(), "description": f"{rng.choice(ITEMS)} #{number}",
+            "amount": amount, "category": "invoices" if invoice else "bills", "type": "credit" if invoice else "debit",
+            "vendor": party,
+        })
+        roll = rng.random()
+        if roll < 0.6:
+            truth[bank(party, amount, issued + timedelta(days=rng.randrange(60)), invoice)] = document_id
+        elif roll < 0.75:
+            parts = rng.randint(2, 3)
+            first = round(amount / parts, 2)
+            for part in range(parts):
+                paid = first if part < parts - 1 else round(amount - first * (parts - 1), 2)
+                truth[bank(party, paid, issued + timedelta(days=15 * (part + 1) + rng.randrange(5)), invoice)] = document_id
+    for _ in range(count // 3):
+        bank(rng.choice(["Payroll", "Card settlement", "Tax office", "Office rent"]), round(rng.lognormvariate(6, 1.2), 2),
+             _random_date(rng), rng.random() < 0.3)
+    rng.shuffle(transactions)
+    return transactions, truth
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--out", required=True)
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--sizes", default="small,medium,large")
+    args = parser.parse_args()
+    manifest = generate_corpus(args.out, args.seed, args.sizes.split(","))
+    print(f"Wrote {len(manifest['files'])} files to {args.out}")
+
+if __name__ == "__main__":
+    main()
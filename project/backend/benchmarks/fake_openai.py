@@ -0,0 +1,259 @@
+"""Deterministic local stand-in for the OpenAI chat completions API.
+
+    python -m benchmarks.fake_openai --port 8765 --latency-ms 300 [--jitter-ms 50] [--error-rate 0.01]
+                                     [--replay audit_logs/]
+
+Point the backend at it with OPENAI_BASE_URL=http://127.0.0.1:8765/v1 and any
+OPENAI_API_KEY. Answers are derived from the prompt (the same prompt always gets
+the same answer), so the document, amount, classification and notes code paths
+all receive well-formed responses. Latency, jitter, 5xx and 429 rates are
+configurable, also at runtime through FakeOpenAIServer.configure(); model_latency_ms
+gives individual models (e.g. a cheaper cascade tier) their own latency.
+With replay (audit_log.replay_responses() of a captured audit log) a request whose
+model and messages were captured gets the recorded upstream responses in turn, so
+production traffic can be re-run; other requests get the derived answers.
+"""
+import os
+import re
+import json
+import time
+import zlib
+import random
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+DASHBOARD_CATEGORIES = ["Cash Balance", "Revenue", "Expenses", "Net Burn"]
+
+def _find(pattern, text, default=None):
+    matches = re.findall(pattern, text, flags=re.IGNORECASE)
+    return matches[-1] if matches else default
+
+def _amount(text):
+    value = _find(r"(?:grand total|total due|amount due|total)\s*:?\s*\$?([0-9][0-9,]*\.?[0-9]*)", text)
+    return float(value.replace(",", "")) if value else 0.0
+
+def answer(messages):
+    """Canned, deterministic reply for a chat request"""
+    system = " ".join(m.get("content", "") for m in messages if m.get("role") == "system")
+    user = " ".join(m.get("content", "") for m in messages if m.get("role") == "user")
+    lowered = system.lower()
+    if "classification expert" in lowered:
+        text = user.lower()
+        if any(word in text for word in ("invoice", "sale", "payment received", "customer")):
+            return "Revenue"
+        if any(word in text for word in ("bill", "rent", "supplies", "purchase", "expense")):
+            return "Expenses"
+        # Consistent per payee: ids, dates and amounts do not change the answer
+        return DASHBOARD_CATEGORIES[zlib.crc32(re.sub(r"\d+", "", user).encode()) % len(DASHBOARD_CATEGORIES)]
+    if "amount extraction specialist" in lowered:
+        amount = _amount(user)
+        return json.dumps({
+            "final_amount": amount,
+            "confidence": 0.95 if amount else 0,
+            "amount_type": "Total" if amount else "Not Found",
+            "extraction_notes": "fake-llm: last total line",
+        })
+    if "document analyzer" in lowered:
+        amount = _amount(user)
+        return json.dumps({
+            "category": "bills" if "bill to" not in user.lower() and "invoice" not in user.lower() else "invoices",
+            "extractedData": {
+                "amount": amount,
+                "date": _find(r"date:\s*(\d{4}-\d{2}-\d{2})", user, "2024-01-01"),
+                "due_date": _find(r"due date:\s*(\d{4}-\d{2}-\d{2})", user, "2024-01-31"),
+                "description": (_find(r"(INVOICE #\d+)", user, "Document")),
+                "vendor": _find(r"from:\s*([^\n]+?)\s*(?:bill to:|date:|$)", user, "Unknown"),
+                "payment_terms": "Net 30",
+                "final_amount_confidence": 0.9,
+                "amount_breakdown": {},
+            },
+            "confidence": 0.9,
+        })
+    if "financial analyst" in lowered:
+        return "EXECUTIVE SUMMARY\n- fake-llm professional notes.\n\nRECOMMENDATIONS\n- None."
+    if "validat" in lowered:
+        return json.dumps({"issues": [], "corrections": [], "summary": {"total_issues": 0}})
+    if "of a bank statement" in user.lower():
+        return json.dumps({"transactions": _statement_rows(user)})
+    return "{}"
+
+def _statement_rows(text):
+    """Rows of a statement page given as column-separated text: the balance change decides debit or credit"""
+    rows, balance = [], None
+    for line in text.splitlines():
+        cells = [cell.strip() for cell in line.strip().split("    ") if cell.strip()]
+        numbers = [float(cell.replace(",", "")) for cell in cells if re.fullmatch(r"-?[0-9][0-9,]*\.[0-9]{2}", cell)]
+        if "brought forward" in line.lower() and numbers:
+            balance = numbers[-1]
+        elif len(cells) >= 3 and re.fullmatch(r"\d{4}-\d{2}-\d{2}", cells[0]) and len(numbers) >= 2:
+            amount, new_balance = numbers[-2], numbers[-1]
+            debit = balance is not None and new_balance < balance
+            rows.append({"date": cells[0], "description": cells[1], "debit": amount if debit else None,
+                         "credit": None if debit else amount, "balance": new_balance})
+            balance = new_balance
+    return rows
+
+class FakeOpenAIServer:
+    """Threaded fake API server; use as a context manager or start()/stop()"""
+
+    def __init__(self, host="127.0.0.1", port=0, latency_ms=0.0, jitter_ms=0.0, error_rate=0.0,
+                 rate_limit_rate=0.0, seed=7, canned=None, model_latency_ms=None, replay=None):
+        self.host = host
+        self.port = port
+        self.seed = seed
+        self.canned = canned or {}
+        # prompt hash -> captured responses, handed out in turn (verification samples get different ones)
+        self.replay = replay or {}
+        self._replay_turns = {}
+        self.model_latency_ms = {}
+        self.configure(latency_ms=latency_ms, jitter_ms=jitter_ms, error_rate=error_rate, rate_limit_rate=rate_limit_rate,
+                       model_latency_ms=model_latency_ms or {})
+        self._rng = random.Random(seed)
+        self._rng_lock = threading.Lock()
+        self._server = None
+        self._thread = None
+        self.stats = {"requests": 0, "errors": 0, "rate_limited": 0, "replayed": 0}
+        self._stats_lock = threading.Lock()
+
+    def configure(self, **settings):
+        for key in ("latency_ms", "jitter_ms", "error_rate", "rate_limit_rate"):
+            if key in settings:
+                setattr(self, key, float(settings[key]))
+        if "model_latency_ms" in settings:
+            self.model_latency_ms = {model: float(latency) for model, latency in settings["model_latency_ms"].items()}
+
+    @property
+    def base_url(self):
+        return f"http://{self.host}:{self.port}/v1"
+
+    def _count(self, key):
+        with self._stats_lock:
+            self.stats[key] += 1
+
+    def _draw(self):
+        with self._rng_lock:
+            return self._rng.random(), self._rng.uniform(-1, 1)
+
+    def _replayed(self, model, messages):
+        from audit_log import prompt_hash
+        key = prompt_hash(model, messages)
+        responses = self.replay.get(key)
+        if not responses:
+            return None
+        with self._stats_lock:
+            turn = self._replay_turns.get(key, 0)
+            self._replay_turns[key] = turn + 1
+            self.stats["replayed"] += 1
+        return responses[turn % len(responses)]
+
+    def reply(self, payload):
+        """(status, headers, body) for one chat completion request"""
+        self._count("requests")
+        roll, jitter = self._draw()
+        latency_ms = self.model_latency_ms.get(payload.get("model"), self.latency_ms)
+        time.sleep(max(0.0, latency_ms + jitter * self.jitter_ms) / 1000.0)
+        if roll < self.rate_limit_rate:
+            self._count("rate_limited")
+            return 429, {"retry-after": "1"}, {"error": {"message": "Rate limit reached (fake)", "type": "rate_limit_exceeded"}}
+        if roll < self.rate_limit_rate + self.error_rate:
+            self._count("errors")
+            return 500, {}, {"error": {"message": "Internal error (fake)", "type": "server_error"}}
+        messages = payload.get("messages", [])
+        prompt = json.dumps(messages)
+        content = next((reply for key, reply in self.canned.items() if key in prompt), None)
+        if content is None and self.replay:
+            content = self._replayed(payload.get("model"), messages)
+        if content is None:
+            content = answer(messages)
+        prompt_tokens = len(prompt) // 4
+        completion_tokens = max(1, len(content) // 4)
+        return 200, {}, {
+            "id": f"chatcmpl-fake-{zlib.crc32(prompt.encode()):08x}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": payload.get("model", "gpt-4"),
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+            "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                      "total_tokens": prompt_tokens + completion_tokens},
+        }
+
+    def start(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_POST(self):
+                length = int(self.headers.get("content-length") or 0)
+                payload = json.loads(self.rfile.read(length) or b"{}")
+                if not self.path.rstrip("/").endswith("/chat/completions"):
+                    status, headers, body = 404, {}, {"error": {"message": "not found"}}
+                else:
+                    status, headers, body = fake.reply(payload)
+                data = json.dumps(body).encode()
+                self.send_response(status)
+                self.send_header("content-type", "application/json")
+                self.send_header("content-length", str(len(data)))
+                for key, value in headers.items():
+                    self.send_header(key, value)
+                self.end_headers()
+                try:
+                    self.wfile.write(data)
+                except (BrokenPipeError, ConnectionResetError):
+                    # The client gave up (deadline or a hedged duplicate won)
+                    pass
+
+            def log_message(self, *args):
+                pass
+
+        self._server = ThreadingHTTPServer((self.host, self.port), Handler)
+        self._server.daemon_threads = True
+        self.port = self._server.server_address[1]
+        self._thread = threading.Thread(target=self._server.serve_forever, name="fake-openai", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+def use_fake_openai(server):
+    """Point this process's OpenAI SDK at server (call before the first LLM request)"""
+    os.environ["OPENAI_BASE_URL"] = server.base_url
+    os.environ.setdefault("OPENAI_API_KEY", "fake-key")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    parser.add_argument("--jitter-ms", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--replay", help="audit log directory or segment whose captured responses to serve")
+    args = parser.parse_args()
+    replay = None
+    if args.replay:
+        from audit_log import replay_responses
+        replay = replay_responses(args.replay)
+    server = FakeOpenAIServer(args.host, args.port, args.latency_ms, args.jitter_ms, args.error_rate,
+                              args.rate_limit_rate, args.seed, replay=replay).start()
+    print(f"Fake OpenAI API listening on {server.base_url}" + (f" (replaying {len(replay)} captured prompts)" if replay else ""))
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.stop()
+
+if __name__ == "__main__":
+    main()
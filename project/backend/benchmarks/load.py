@@ -0,0 +1,216 @@
+"""Concurrent load harness: replay a traffic mix against the app and report p50/p95/p99.
+
+    python -m benchmarks.load --mix analyze_document:50,classify_transaction:200 --duration 30
+                              [--llm-latency-ms 800 --llm-error-rate 0.01 --llm-429-rate 0.02]
+                              [--uvicorn --workers 4] [--env OCR_MAX_WORKERS=8] [--label cache-on]
+                              [--compare results/load-....json]
+
+Each mix entry is scenario:users[:think_ms]; every virtual user loops sending
+that scenario's request until the duration is over (closed-loop traffic). The app
+runs in-process through httpx's ASGI transport by default, or as a local uvicorn
+server with --uvicorn (needed to compare worker counts). The stub LLM is the fake
+OpenAI server with injected latency, 5xx and 429 rates. --env settings are applied
+to the app process and stored with the results so deployments can be compared.
+"""
+import os
+import sys
+import time
+import random
+import asyncio
+import argparse
+import tempfile
+import subprocess
+from collections import defaultdict
+
+from benchmarks.common import BACKEND_DIR, summarize, save_results, load_results, compare, print_comparison
+from benchmarks.corpus import generate_corpus, load_manifest, synthetic_transactions, VENDORS, ITEMS
+from benchmarks.fake_openai import FakeOpenAIServer
+from benchmarks.startup import free_port
+
+class Scenarios:
+    """Request builders for each scenario; each returns (method, path, httpx kwargs)"""
+
+    def __init__(self, corpus_dir, statement_rows, seed=7):
+        self.rng = random.Random(seed)
+        manifest = load_manifest(corpus_dir)
+        self.documents = [
+            os.path.join(corpus_dir, entry["file"]) for entry in manifest["files"]
+            if entry["kind"] in ("digital_pdf", "docx") or (entry["kind"] == "bank_csv" and entry["size"] == "small")
+        ]
+        self.statement_transactions = synthetic_transactions(statement_rows)
+
+    def analyze_document(self):
+        path = self.rng.choice(self.documents)
+        with open(path, "rb") as f:
+            content = f.read()
+        return "POST", "/analyze-document/", {"files": {"file": (os.path.basename(path), content)}}
+
+    def classify_transaction(self):
+        description = f"{self.rng.choice(VENDORS)} {self.rng.choice(ITEMS)} #{self.rng.randrange(10**4)}"
+        return "POST", "/classify-transaction/", {"json": {"description": description}}
+
+    def extract_final_amount(self):
+        return "POST", "/extract-final-amount/", {"json": {"text": f"Subtotal: 100.00\nTotal: {self.rng.randrange(100, 10**5)}.00"}}
+
+    def generate_financial_statements(self):
+        return "POST", "/generate-financial-statements/", {"json": self.statement_transactions}
+
+    def validate_payments(self):
+        return "POST", "/validate-payments/", {"json": self.statement_transactions}
+
+    def health(self):
+        return "GET", "/health", {}
+
+def parse_mix(spec):
+    mix = []
+    for part in spec.split(","):
+        fields = part.split(":")
+        mix.append({"scenario": fields[0], "users": int(fields[1]), "think_ms": float(fields[2]) if len(fields) > 2 else 0.0})
+    return mix
+
+async def virtual_user(client, scenarios, entry, deadline, records):
+    build = getattr(scenarios, entry["scenario"])
+    while time.perf_counter() < deadline:
+        method, path, kwargs = build()
+        started = time.perf_counter()
+        try:
+            response = await client.request(method, path, **kwargs)
+            status = response.status_code
+        except Exception as e:
+            status = f"exception:{type(e).__name__}"
+        records.append((entry["scenario"], status, time.perf_counter() - started, time.perf_counter()))
+        if entry["think_ms"]:
+            await asyncio.sleep(entry["think_ms"] / 1000.0)
+
+async def run_load(base_url, transport, scenarios, mix, duration, timeout):
+    import httpx
+    records = []
+    users = sum(entry["users"] for entry in mix)
+    limits = httpx.Limits(max_connections=users, max_keepalive_connections=users)
+    async with httpx.AsyncClient(base_url=base_url, transport=transport, timeout=timeout, limits=limits) as client:
+        started = time.perf_counter()
+        deadline = started + duration
+        tasks = [
+            asyncio.create_task(virtual_user(client, scenarios, entry, deadline, records))
+            for entry in mix for _ in range(entry["users"])
+        ]
+        await asyncio.gather(*tasks)
+        elapsed = time.perf_counter() - started
+    return records, elapsed
+
+def report(records, elapsed):
+    by_scenario = defaultdict(list)
+    for record in records:
+        by_scenario[record[0]].append(record)
+    out = {}
+    for scenario, rows in sorted(by_scenario.items()):
+        latencies = [row[2] for row in rows]
+        statuses = [row[1] for row in rows]
+        errors = sum(1 for s in statuses if not isinstance(s, int) or s >= 500)
+        throttled = sum(1 for s in statuses if s == 429)
+        out[scenario] = {
+            "requests": len(rows),
+            "throughput_per_second": len(rows) / elapsed if elapsed else 0.0,
+            "latency_seconds": summarize(latencies),
+            "error_rate": errors / len(rows),
+            "rate_429": throttled / len(rows),
+            "status_counts": {str(k): statuses.count(k) for k in sorted(set(statuses), key=str)},
+        }
+    all_latencies = [row[2] for row in records]
+    out["_total"] = {
+        "requests": len(records),
+        "throughput_per_second": len(records) / elapsed if elapsed else 0.0,
+        "latency_seconds": summarize(all_latencies),
+    }
+    return out
+
+def wait_for_server(url, timeout=60.0):
+    import urllib.request
+    started = time.perf_counter()
+    while time.perf_counter() - started < timeout:
+        try:
+            with urllib.request.urlopen(f"{url}/health", timeout=1):
+                return
+        except OSError:
+            time.sleep(0.05)
+    raise RuntimeError("uvicorn did not come up")
+
+def print_report(results):
+    print(f"{'scenario':<32} {'req':>7} {'req/s':>8} {'p50':>8} {'p95':>8} {'p99':>8} {'err':>6} {'429':>6}")
+    for scenario, row in results.items():
+        latency = row["latency_seconds"]
+        print(f"{scenario:<32} {row['requests']:>7} {row['throughput_per_second']:>8.2f} "
+              f"{latency.get('p50', 0):>8.3f} {latency.get('p95', 0):>8.3f} {latency.get('p99', 0):>8.3f} "
+              f"{row.get('error_rate', 0):>6.1%} {row.get('rate_429', 0):>6.1%}")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--mix", default="analyze_document:50,classify_transaction:200")
+    parser.add_argument("--duration", type=float, default=30.0)
+    parser.add_argument("--timeout", type=float, default=120.0)
+    parser.add_argument("--corpus", help="existing corpus directory (generated when omitted)")
+    parser.add_argument("--statement-rows", type=int, default=1000)
+    parser.add_argument("--llm-latency-ms", type=float, default=800.0)
+    parser.add_argument("--llm-jitter-ms", type=float, default=200.0)
+    parser.add_argument("--llm-error-rate", type=float, default=0.0)
+    parser.add_argument("--llm-429-rate", type=float, default=0.0)
+    parser.add_argument("--uvicorn", action="store_true", help="run the app as a local uvicorn server")
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn worker processes (with --uvicorn)")
+    parser.add_argument("--env", action="append", default=[], help="KEY=VALUE setting for the app (repeatable)")
+    parser.add_argument("--label", default="", help="free-form name for this deployment setting")
+    parser.add_argument("--compare", help="previous load result file to compare against")
+    parser.add_argument("--output", help="write results here instead of benchmarks/results/")
+    args = parser.parse_args()
+
+    corpus_dir = args.corpus or tempfile.mkdtemp(prefix="finance-corpus-")
+    if not os.path.exists(os.path.join(corpus_dir, "manifest.json")):
+        generate_corpus(corpus_dir, sizes=["small"])
+    mix = parse_mix(args.mix)
+    scenarios = Scenarios(corpus_dir, args.statement_rows)
+    app_env = dict(item.split("=", 1) for item in args.env)
+
+    with FakeOpenAIServer(latency_ms=args.llm_latency_ms, jitter_ms=args.llm_jitter_ms,
+                          error_rate=args.llm_error_rate, rate_limit_rate=args.llm_429_rate) as fake:
+        app_env.setdefault("OPENAI_BASE_URL", fake.base_url)
+        app_env.setdefault("OPENAI_API_KEY", "fake-key")
+        app_env.setdefault("TRACING_ENABLED", "0")
+        if args.uvicorn:
+            port = free_port()
+            proc = subprocess.Popen(
+                [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--workers", str(args.workers), "--log-level", "warning"],
+                cwd=BACKEND_DIR, env={**os.environ, **app_env}, stdout=subprocess.DEVNULL,
+            )
+            try:
+                base_url = f"http://127.0.0.1:{port}"
+                wait_for_server(base_url)
+                records, elapsed = asyncio.run(run_load(base_url, None, scenarios, mix, args.duration, args.timeout))
+            finally:
+                proc.terminate()
+                proc.wait(timeout=30)
+        else:
+            import httpx
+            os.environ.update(app_env)
+            import main as backend
+            transport = httpx.ASGITransport(app=backend.app)
+            records, elapsed = asyncio.run(run_load("http://app", transport, scenarios, mix, args.duration, args.timeout))
+        llm_stats = dict(fake.stats)
+
+    results = report(records, elapsed)
+    print_report(results)
+    document = {
+        "endpoints": results,
+        "settings": {
+            "label": args.label, "mix": mix, "duration": args.duration, "mode": "uvicorn" if args.uvicorn else "asgi",
+            "workers": args.workers if args.uvicorn else 1, "env": {k: v for k, v in app_env.items() if k != "OPENAI_API_KEY"},
+            "llm": {"latency_ms": args.llm_latency_ms, "jitter_ms": args.llm_jitter_ms,
+                    "error_rate": args.llm_error_rate, "rate_429": args.llm_429_rate},
+        },
+        "llm_requests": llm_stats,
+    }
+    path = save_results("load", document, args.output)
+    print(f"Saved {path}")
+    if args.compare:
+        sys.exit(1 if print_comparison(compare(load_results(args.compare), load_results(path))) else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,588 @@
+"""Backend benchmark suite: throughput and latency of the main pipeline functions.
+
+    python -m benchmarks.run [--corpus /tmp/finance-corpus] [--rows 1000,10000,100000]
+                             [--llm-latency-ms 50] [--repeat 3] [--compare results/run-....json]
+                             [--replay audit_logs/]
+
+Generates the synthetic corpus (or reuses --corpus), starts the fake OpenAI server
+and measures extract_text, Tesseract OCR (baseline, preprocessed and on the
+persistent worker pool), analyze_document, generate_financial_statements (single
+and multi-entity batches), journal posting, validate_payments, amount parsing,
+bank-statement table extraction, the classification label cache, the LLM model
+cascade, document search and bank reconciliation. OCR benchmarks are marked
+skipped when tesseract (or tesserocr) and poppler are not installed or the engine
+does not initialise; a benchmark that raises is recorded as an error and the run
+continues. Results are saved as JSON under
+benchmarks/results/ and can be compared against an earlier run for regressions.
+--replay serves the LLM responses captured in an audit log for prompts it contains
+(see audit_log.py); the run itself writes no audit log and keeps its search index
+in memory.
+"""
+import os
+import sys
+import time
+import shutil
+import asyncio
+import difflib
+import argparse
+import tempfile
+import traceback
+
+from benchmarks.common import summarize, save_results, load_results, compare, print_comparison
+from benchmarks.corpus import CATEGORIES, generate_corpus, load_manifest, make_invoice, synthetic_ledger, synthetic_transactions
+from benchmarks.fake_openai import FakeOpenAIServer, use_fake_openai
+
+OCR_KINDS = ("scanned_pdf", "receipt_png", "receipt_photo")
+
+# Tesseract backend settings compared by bench_ocr
+OCR_VARIANTS = {
+    # Raw images, fixed 150 dpi, both languages, one tesseract process per page (the earlier behaviour)
+    "baseline": {"preprocess": False, "languages": "eng+nld", "dpi": 150, "engine": "pytesseract", "worker_pool": None},
+    # Preprocessed images, DPI from page size, language picked per document
+    "preprocessed": {"preprocess": True, "languages": "auto", "dpi": None, "engine": "pytesseract", "worker_pool": None},
+    # The same, recognised in-process by the persistent worker pool
+    "worker_pool": {"preprocess": True, "languages": "auto", "dpi": None, "engine": "tesserocr"},
+}
+
+def char_accuracy(expected, actual):
+    """Similarity of OCR output to the ground truth, whitespace-normalised (0..1)"""
+    if not expected:
+        return None
+    expected = " ".join(expected.split())
+    actual = " ".join((actual or "").split())
+    return difflib.SequenceMatcher(None, expected, actual, autojunk=False).ratio()
+
+def engine_available(engine):
+    """Whether the engine actually initialises here, not just whether it is installed"""
+    from ocr_workers import tesseract_binary_available, tesserocr_available
+    if engine == "tesserocr":
+        return tesserocr_available()
+    return tesseract_binary_available()
+
+def ocr_available(kind="scanned_pdf"):
+    """Whether this kind of document can be OCR'd here (PDFs also need poppler)"""
+    if kind == "scanned_pdf" and shutil.which("pdftoppm") is None:
+        return False
+    return engine_available("tesserocr") or engine_available("pytesseract")
+
+async def timed(repeat, func, *args):
+    samples, result = [], None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = await func(*args)
+        samples.append(time.perf_counter() - started)
+    return samples, result
+
+def failure(name, error):
+    traceback.print_exception(error)
+    print(f"{name} failed: {error!r}", file=sys.stderr)
+    return {"error": f"{type(error).__name__}: {error}"}
+
+def guarded(name, bench, *args):
+    """Run one benchmark, recording an exception as its result instead of ending the run"""
+    try:
+        return bench(*args)
+    except Exception as e:
+        return failure(name, e)
+
+async def guarded_async(name, bench, *args):
+    try:
+        return await bench(*args)
+    except Exception as e:
+        return failure(name, e)
+
+def throughput(samples, units=1):
+    total = sum(samples)
+    return units * len(samples) / total if total else None
+
+async def bench_extract_text(main, corpus_dir, manifest, repeat):
+    results = {}
+    for entry in manifest["files"]:
+        if entry["kind"] in OCR_KINDS and not ocr_available(entry["kind"]):
+            results[entry["file"]] = {"skipped": "tesseract/poppler not installed"}
+            continue
+        path = os.path.join(corpus_dir, entry["file"])
+        samples, text = await timed(repeat, main.extract_text, path, entry["extension"])
+        results[entry["file"]] = {
+            "latency_seconds": summarize(samples),
+            "docs_per_second": throughput(samples),
+            "pages_per_second": throughput(samples, entry["pages"]),
+            "char_accuracy": char_accuracy(entry["text"], text),
+        }
+    return results
+
+async def bench_ocr(main, corpus_dir, manifest, repeat):
+    if not ocr_available("receipt_png"):
+        return {"skipped": "no working tesseract engine (missing binary or language data)"}
+    tesseract = main.ocr_registry.get("tesseract")
+    names = {name for settings in OCR_VARIANTS.values() for name in settings}
+    saved = {name: getattr(tesseract, name) for name in names}
+    results = {}
+    try:
+        for variant, settings in OCR_VARIANTS.items():
+            for name, value in {**saved, **settings}.items():
+                setattr(tesseract, name, value)
+            if not engine_available(tesseract.engine):
+                results[variant] = {"skipped": f"{tesseract.engine} engine unavailable"}
+                continue
+            if tesseract.worker_pool is not None:
+                # Exclude process start-up and model loading from the page timings
+                try:
+                    tesseract.worker_pool.warm_up(engine=tesseract.engine)
+                except Exception as e:
+                    results[variant] = failure(f"ocr/{variant}", e)
+                    continue
+            results[variant] = {}
+            for entry in manifest["files"]:
+                if entry["kind"] not in OCR_KINDS:
+                    continue
+                if not ocr_available(entry["kind"]):
+                    results[variant][entry["file"]] = {"skipped": "poppler not installed"}
+                    continue
+                path = os.path.join(corpus_dir, entry["file"])
+                try:
+                    samples, text = await timed(repeat, tesseract.recognize, path, entry["extension"], entry["pages"])
+                except Exception as e:
+                    results[variant][entry["file"]] = failure(f"ocr/{variant}/{entry['file']}", e)
+                    continue
+                results[variant][entry["file"]] = {
+                    "latency_seconds": summarize(samples),
+                    "pages_per_second": throughput(samples, entry["pages"]),
+                    "char_accuracy": char_accuracy(entry["text"], text),
+                }
+    finally:
+        for name, value in saved.items():
+            setattr(tesseract, name, value)
+    return results
+
+def bench_analyze_document(main, corpus_dir, manifest, repeat):
+    from fastapi.testclient import TestClient
+    client = TestClient(main.app)
+    results = {}
+    for entry in manifest["files"]:
+        if entry["total"] is None:
+            continue
+        if entry["kind"] in OCR_KINDS and not ocr_available(entry["kind"]):
+            results[entry["file"]] = {"skipped": "tesseract/poppler not installed"}
+            continue
+        path = os.path.join(corpus_dir, entry["file"])
+        samples, correct = [], 0
+        for _ in range(repeat):
+            with open(path, "rb") as f:
+                started = time.perf_counter()
+                response = client.post("/analyze-document/", files={"file": (entry["file"], f)})
+                samples.append(time.perf_counter() - started)
+            if response.status_code == 200:
+                amount = response.json().get("extractedData", {}).get("amount")
+                correct += amount is not None and abs(float(amount) - entry["total"]) < 0.01
+        results[entry["file"]] = {
+            "latency_seconds": summarize(samples),
+            "docs_per_second": throughput(samples),
+            "amount_accuracy": correct / repeat,
+        }
+    return results
+
+def bench_statement_tables(main, corpus_dir, manifest, repeat):
+    results = {}
+    for entry in manifest["files"]:
+        if entry["kind"] != "statement_pdf":
+            continue
+        path = os.path.join(corpus_dir, entry["file"])
+        samples, transactions, failed = [], [], []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            page_transactions, failed, _ = main.statement_tables.extract_statement(path, entry["pages"])
+            samples.append(time.perf_counter() - started)
+            transactions = [record for records in page_transactions for record in records]
+        results[entry["file"]] = {
+            "latency_seconds": summarize(samples),
+            "pages_per_second": throughput(samples, entry["pages"]),
+            "rows_per_second": throughput(samples, entry["rows"]),
+            "row_accuracy": len(transactions) / entry["rows"],
+            "llm_pages": len(failed),
+        }
+    return results
+
+async def bench_statements(main, rows, repeat):
+    results = {}
+    for count in rows:
+        transactions = synthetic_transactions(count)
+        build = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            main.build_financial_statements(transactions)
+            build.append(time.perf_counter() - started)
+        samples, _ = await timed(repeat, main.generate_financial_statements, transactions)
+        results[str(count)] = {
+            "build_seconds": summarize(build),
+            "endpoint_seconds": summarize(samples),
+            "rows_per_second": throughput(build, count),
+        }
+    return results
+
+# Entities per batch in bench_entity_statements
+BENCH_ENTITIES = 500
+
+def bench_entity_statements(main, rows, repeat):
+    """Batch statements for BENCH_ENTITIES entities: the grouped pass against one build per entity"""
+    results = {}
+    for count in rows:
+        transactions = synthetic_transactions(count)
+        for i, transaction in enumerate(transactions):
+            transaction["entity_id"] = f"entity-{i % BENCH_ENTITIES}"
+        grouped, separate = [], []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            main.build_entity_statements(transactions, "entity_id", True)
+            grouped.append(time.perf_counter() - started)
+            # Baseline: split by entity, then one build per entity
+            started = time.perf_counter()
+            groups = {}
+            for transaction in transactions:
+                groups.setdefault(transaction["entity_id"], []).append(transaction)
+            for entity_transactions in groups.values():
+                main.build_financial_statements(entity_transactions)
+            separate.append(time.perf_counter() - started)
+        results[str(count)] = {
+            "latency_seconds": summarize(grouped),
+            "per_entity_builds_seconds": summarize(separate),
+            "rows_per_second": throughput(grouped, count),
+            "entities_per_second": throughput(grouped, len(groups)),
+        }
+    return results
+
+def bench_posting(main, rows, repeat):
+    results = {}
+    for count in rows:
+        transactions = synthetic_transactions(count)
+        samples, lines = [], None
+        for _ in range(repeat):
+            started = time.perf_counter()
+            lines, _ = main.POSTING_RULES.post(transactions)
+            samples.append(time.perf_counter() - started)
+        results[str(count)] = {
+            "latency_seconds": summarize(samples),
+            "rows_per_second": throughput(samples, count),
+            "lines": len(lines),
+            "balanced": abs(float(lines["debit"].sum() - lines["credit"].sum())) < 0.01,
+        }
+    return results
+
+async def bench_validate_payments(main, rows, repeat):
+    results = {}
+    for count in rows:
+        transactions = synthetic_transactions(count)
+        samples, _ = await timed(repeat, main.validate_payments, transactions)
+        results[str(count)] = {"latency_seconds": summarize(samples), "rows_per_second": throughput(samples, count)}
+    return results
+
+def bench_duplicates(main, rows, repeat):
+    results = {}
+    for count in rows:
+        transactions = synthetic_transactions(count)
+        # Re-import 1% of the rows as they would arrive from an overlapping export
+        for transaction in transactions[::100]:
+            transactions.append({**transaction, "id": f"{transaction['id']}-again", "description": transaction["description"].upper()})
+        samples, stats = [], None
+        for _ in range(repeat):
+            started = time.perf_counter()
+            _, stats = main.find_duplicates(transactions)
+            samples.append(time.perf_counter() - started)
+        results[str(count)] = {
+            "latency_seconds": summarize(samples),
+            "rows_per_second": throughput(samples, len(transactions)),
+            "duplicate_rows": stats["duplicate_rows"],
+            "candidate_pairs": stats["candidate_pairs"],
+        }
+    return results
+
+# The same amounts as exported by different sources
+AMOUNT_FORMATS = {
+    "plain": lambda amount: f"{amount:.2f}",
+    "us": lambda amount: f"{amount:,.2f}",
+    "eu": lambda amount: f"{amount:,.2f}".replace(",", "_").replace(".", ",").replace("_", "."),
+    "statement": lambda amount: f"${abs(amount):,.2f} {'DR' if amount < 0 else 'CR'}",
+}
+
+def bench_amounts(main, rows, repeat):
+    from amounts import parse_amounts
+    results = {}
+    for count in rows:
+        amounts = [transaction["amount"] if transaction["type"] == "credit" else -transaction["amount"]
+                   for transaction in synthetic_transactions(count)]
+        for name, format_amount in AMOUNT_FORMATS.items():
+            values = [format_amount(amount) for amount in amounts]
+            samples, parsed = [], None
+            for _ in range(repeat):
+                started = time.perf_counter()
+                parsed = parse_amounts(values)
+                samples.append(time.perf_counter() - started)
+            results[f"{name}/{count}"] = {
+                "latency_seconds": summarize(samples),
+                "rows_per_second": throughput(samples, count),
+                "exact": bool((parsed.round(2) == [round(amount, 2) for amount in amounts]).all()),
+            }
+    return results
+
+async def bench_validate_and_correct(main, rows, repeat):
+    results = {}
+    for count in rows:
+        transactions = synthetic_transactions(count)
+        samples, result = await timed(repeat, main.validate_and_correct_data, transactions)
+        results[str(count)] = {
+            "latency_seconds": summarize(samples),
+            "rows_per_second": throughput(samples, count),
+            "issues_found": result["issues_found"],
+            "reviewed_rows": result["review"]["reviewed_rows"],
+            "llm_requests": result["review"]["requests"],
+        }
+    return results
+
+# Upper bound on classify calls per size; every miss costs LLM round trips
+LABEL_CACHE_MAX_ROWS = 1000
+# Share of cache hits re-classified to measure agreement (audits share the LLM rate limits)
+LABEL_CACHE_BENCH_AUDIT_RATE = 0.2
+# Suffixes banks append to the same payee's descriptions
+DESCRIPTION_SUFFIXES = ["", "", " ONLINE", " SEPA", " CARD PAYMENT", " NL"]
+
+async def bench_label_cache(main, rows, repeat, fake):
+    """Classification of transaction descriptions through the near-duplicate label cache"""
+    import random
+    cache = main.classification_cache
+    saved_rate = cache.audit_rate
+    results = {}
+    try:
+        cache.audit_rate = LABEL_CACHE_BENCH_AUDIT_RATE
+        for count in rows:
+            count = min(count, LABEL_CACHE_MAX_ROWS)
+            rng = random.Random(count)
+            descriptions = [transaction["description"] + rng.choice(DESCRIPTION_SUFFIXES)
+                            for transaction in synthetic_transactions(count)]
+            samples = []
+            for _ in range(repeat):
+                cache.clear()
+                cache.exact_hits = cache.near_hits = cache.misses = cache.agreed = cache.disagreed = 0
+                requests = fake.stats["requests"]
+                started = time.perf_counter()
+                # Sequential, like a stream of incoming transactions
+                for description in descriptions:
+                    await main.classify_financial_category(description)
+                samples.append(time.perf_counter() - started)
+                classify_requests = fake.stats["requests"] - requests
+                await asyncio.gather(*list(main._label_audits))
+            stats = cache.stats()
+            results[str(count)] = {
+                "latency_seconds": summarize(samples),
+                "rows_per_second": throughput(samples, count),
+                "hit_rate": stats["hit_rate"],
+                "near_hits": stats["near_hits"],
+                "llm_requests": classify_requests,
+                "agreement": stats["agreement"],
+            }
+    finally:
+        cache.audit_rate = saved_rate
+        cache.clear()
+    return results
+
+# Upper bound on texts per size for the cascade benchmark (each one is several LLM round trips)
+CASCADE_MAX_ROWS = 200
+# Latency of the cheap tier relative to --llm-latency-ms
+CASCADE_CHEAP_LATENCY_FACTOR = 0.25
+
+async def bench_model_cascade(main, rows, repeat, fake):
+    """Classification and final-amount extraction through the model cascade against the strongest tier alone"""
+    import model_cascade
+    from llm_scheduler import TokenBucket
+    saved_enabled, saved_latency = model_cascade.LLM_CASCADE_ENABLED, dict(fake.model_latency_ms)
+    # The fake server has no rate limits; without this, RPM pacing (not the models) sets the pace
+    scheduler = main.LLM_SCHEDULER
+    saved_buckets = scheduler.requests, scheduler.tokens
+    scheduler.requests, scheduler.tokens = TokenBucket(1e9), TokenBucket(1e12)
+    cheap_models = model_cascade.LLM_MODEL_TIERS[:-1]
+    fake.configure(model_latency_ms={**saved_latency, **{model: fake.latency_ms * CASCADE_CHEAP_LATENCY_FACTOR for model in cheap_models}})
+
+    async def answers(descriptions, documents):
+        labels = await asyncio.gather(*(main.classify_with_openai(text) for text in descriptions))
+        amounts = await asyncio.gather(*(main.extract_final_amount_with_openai(text) for text in documents))
+        return labels + [result["final_amount"] for result in amounts]
+
+    results = {}
+    try:
+        for count in rows:
+            count = min(count, CASCADE_MAX_ROWS)
+            transactions = synthetic_transactions(count)
+            descriptions = [transaction["description"] for transaction in transactions]
+            # Every tenth document has no total line, so its amount comes back with zero confidence
+            documents = [f"{transaction['description']}\nDate: {transaction['date']}" + ("" if i % 10 == 0 else f"\nTotal: {transaction['amount']}")
+                         for i, transaction in enumerate(transactions)]
+            cascade, strongest = [], []
+            for _ in range(repeat):
+                model_cascade.LLM_CASCADE_ENABLED = True
+                model_cascade.cascade_stats.reset()
+                started = time.perf_counter()
+                cascade_answers = await answers(descriptions, documents)
+                cascade.append(time.perf_counter() - started)
+                stats = model_cascade.cascade_stats.stats()["tasks"]
+                model_cascade.LLM_CASCADE_ENABLED = False
+                started = time.perf_counter()
+                strongest_answers = await answers(descriptions, documents)
+                strongest.append(time.perf_counter() - started)
+            first_tier = {task: task_stats["models"].get(task_stats["tiers"][0], {}) for task, task_stats in stats.items()}
+            results[str(count)] = {
+                "latency_seconds": summarize(cascade),
+                "strongest_tier_seconds": summarize(strongest),
+                "rows_per_second": throughput(cascade, 2 * count),
+                "answer_accuracy": sum(a == b for a, b in zip(cascade_answers, strongest_answers)) / len(cascade_answers),
+                "escalation_rate": {task: tier.get("escalation_rate", 0.0) for task, tier in first_tier.items()},
+            }
+    finally:
+        model_cascade.LLM_CASCADE_ENABLED = saved_enabled
+        model_cascade.cascade_stats.reset()
+        fake.configure(model_latency_ms=saved_latency)
+        scheduler.requests, scheduler.tokens = saved_buckets
+    return results
+
+SEARCH_QUERIES_PER_RUN = 20
+SEARCH_QUERIES = {
+    "keyword": {"query": "consulting hours"},
+    "vendor": {"vendor": "initech"},
+    "amount_range": {"amount_min": 1000, "amount_max": 5000, "sort": "-amount"},
+    "date_range": {"date_from": "2024-03-01", "date_to": "2024-03-31"},
+    "combined": {"query": "freight", "vendor": "initech", "amount_min": 1000, "date_from": "2024-03-01", "date_to": "2024-03-31"},
+    "deep_page": {"category": "invoices", "page": 200},
+}
+
+def bench_search(rows, repeat):
+    """Document search index: indexing rate and query latency at each corpus size"""
+    import random
+    from search_index import SearchIndex
+    results = {}
+    for count in rows:
+        rng = random.Random(count)
+        documents = []
+        for number in range(count):
+            invoice = make_invoice(rng, rng.randint(2, 8), number)
+            documents.append((f"{number:064x}", f"invoice-{number}.pdf", "\n".join(invoice["lines"]), {
+                "category": rng.choice(CATEGORIES),
+                "extractedData": {"amount": invoice["total"], "date": invoice["date"], "vendor": invoice["vendor"],
+                                  "description": invoice["lines"][0]},
+            }))
+        index = SearchIndex(path="")
+        started = time.perf_counter()
+        for document in documents:
+            index.add(*document)
+        indexing = time.perf_counter() - started
+        queries = {}
+        for name, query in SEARCH_QUERIES.items():
+            samples, found = [], None
+            for _ in range(repeat * SEARCH_QUERIES_PER_RUN):
+                started = time.perf_counter()
+                found = index.search(**query)
+                samples.append(time.perf_counter() - started)
+            queries[name] = {"latency_seconds": summarize(samples), "matches": found["total"]}
+        results[str(count)] = {
+            "documents_per_second": count / indexing if indexing else 0.0,
+            "tokens": index.stats()["tokens"],
+            "queries": queries,
+        }
+    return results
+
+def bench_reconciliation(rows, repeat):
+    """Bank reconciliation of synthetic ledgers: rate, and share of payments applied to their document or its party"""
+    from reconciliation import reconcile
+    results = {}
+    for count in rows:
+        transactions, truth = synthetic_ledger(count)
+        samples, matched, stats = [], None, None
+        for _ in range(repeat):
+            started = time.perf_counter()
+            _, matched, stats = reconcile(transactions)
+            samples.append(time.perf_counter() - started)
+        row_of = {transaction["id"]: row for row, transaction in enumerate(transactions)}
+        # Instalments go to the oldest open document of the party, which need not be the one they were issued for
+        correct = sum(matched[row_of[payment]] >= 0 and transactions[matched[row_of[payment]]]["vendor"] == transactions[row_of[document]]["vendor"]
+                      for payment, document in truth.items())
+        results[str(count)] = {
+            "latency_seconds": summarize(samples),
+            "rows_per_second": throughput(samples, len(transactions)),
+            "accuracy": correct / len(truth) if truth else 0.0,
+            "exact_matches": stats["exact_matches"],
+            "partial_payments": stats["partial_payments"],
+        }
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--corpus", help="existing corpus directory (generated when omitted)")
+    parser.add_argument("--sizes", default="small,medium", help="corpus sizes to generate")
+    parser.add_argument("--rows", default="1000,10000,100000", help="transaction list sizes, up to 1000000")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--llm-latency-ms", type=float, default=20.0)
+    parser.add_argument("--only", help="comma-separated subset: extract_text,ocr,analyze_document,statements,posting,validate_payments,validate_and_correct,duplicates,amounts,statement_tables,label_cache,entity_statements,model_cascade,search,reconciliation")
+    parser.add_argument("--compare", help="previous result file to compare against (non-zero exit on regression)")
+    parser.add_argument("--output", help="write results here instead of benchmarks/results/")
+    parser.add_argument("--replay", help="audit log directory or segment whose captured LLM responses the fake server serves")
+    args = parser.parse_args()
+
+    os.environ.setdefault("TRACING_ENABLED", "0")
+    os.environ.setdefault("AUDIT_LOG_ENABLED", "0")
+    os.environ.setdefault("SEARCH_INDEX_PATH", "")
+    corpus_dir = args.corpus or tempfile.mkdtemp(prefix="finance-corpus-")
+    if not os.path.exists(os.path.join(corpus_dir, "manifest.json")):
+        generate_corpus(corpus_dir, sizes=args.sizes.split(","))
+    manifest = load_manifest(corpus_dir)
+    rows = [int(n) for n in args.rows.split(",") if n]
+    selected = set(args.only.split(",")) if args.only else {"extract_text", "ocr", "analyze_document", "statements", "posting", "validate_payments", "validate_and_correct", "duplicates", "amounts", "statement_tables", "label_cache", "entity_statements", "model_cascade", "search", "reconciliation"}
+
+    replay = None
+    if args.replay:
+        from audit_log import replay_responses
+        replay = replay_responses(args.replay)
+    with FakeOpenAIServer(latency_ms=args.llm_latency_ms, replay=replay) as fake:
+        use_fake_openai(fake)
+        import main as backend
+
+        async def run_async():
+            out = {}
+            if "extract_text" in selected:
+                out["extract_text"] = await guarded_async("extract_text", bench_extract_text, backend, corpus_dir, manifest, args.repeat)
+            if "ocr" in selected:
+                out["ocr"] = await guarded_async("ocr", bench_ocr, backend, corpus_dir, manifest, args.repeat)
+            if "statements" in selected:
+                out["generate_financial_statements"] = await guarded_async("generate_financial_statements", bench_statements, backend, rows, args.repeat)
+            if "entity_statements" in selected:
+                out["entity_statements"] = guarded("entity_statements", bench_entity_statements, backend, rows, args.repeat)
+            if "posting" in selected:
+                out["posting"] = guarded("posting", bench_posting, backend, rows, args.repeat)
+            if "validate_payments" in selected:
+                out["validate_payments"] = await guarded_async("validate_payments", bench_validate_payments, backend, rows, args.repeat)
+            if "duplicates" in selected:
+                out["duplicates"] = guarded("duplicates", bench_duplicates, backend, rows, args.repeat)
+            if "amounts" in selected:
+                out["amounts"] = guarded("amounts", bench_amounts, backend, rows, args.repeat)
+            if "label_cache" in selected:
+                out["label_cache"] = await guarded_async("label_cache", bench_label_cache, backend, rows, args.repeat, fake)
+            if "model_cascade" in selected:
+                out["model_cascade"] = await guarded_async("model_cascade", bench_model_cascade, backend, rows, args.repeat, fake)
+            if "search" in selected:
+                out["search"] = guarded("search", bench_search, rows, args.repeat)
+            if "reconciliation" in selected:
+                out["reconciliation"] = guarded("reconciliation", bench_reconciliation, rows, args.repeat)
+            if "validate_and_correct" in selected:
+                out["validate_and_correct"] = await guarded_async("validate_and_correct", bench_validate_and_correct, backend, rows, args.repeat)
+            return out
+
+        results = asyncio.run(run_async())
+        if "statement_tables" in selected:
+            results["statement_tables"] = guarded("statement_tables", bench_statement_tables, backend, corpus_dir, manifest, args.repeat)
+        if "analyze_document" in selected:
+            results["analyze_document"] = guarded("analyze_document", bench_analyze_document, backend, corpus_dir, manifest, args.repeat)
+        results["fake_llm"] = {"latency_ms": args.llm_latency_ms, **fake.stats}
+
+    path = save_results("run", results, args.output)
+    print(f"Saved {path}")
+    if args.compare:
+        sys.exit(1 if print_comparison(compare(load_results(args.compare), load_results(path))) else 0)
+
+if __name__ == "__main__":
+    main()
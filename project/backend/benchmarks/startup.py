@@ -0,0 +1,93 @@
+"""Startup benchmark: import time of main.py and time until the server answers.
+
+    python -m benchmarks.startup [--runs 5] [--warm-up] [--compare results/startup-....json]
+
+Run from project/backend. OPENAI_API_KEY is removed from the child environment
+to check that the app starts without it.
+"""
+import os
+import re
+import sys
+import json
+import time
+import socket
+import argparse
+import subprocess
+import urllib.request
+
+from benchmarks.common import BACKEND_DIR, summarize, save_results, load_results, compare, print_comparison
+
+def child_env(warm_up=False):
+    env = dict(os.environ)
+    env.pop("OPENAI_API_KEY", None)
+    env["WARM_UP_ON_STARTUP"] = "1" if warm_up else "0"
+    return env
+
+def measure_import(runs):
+    code = "import time; t = time.perf_counter(); import main; print(time.perf_counter() - t)"
+    samples = []
+    for _ in range(runs):
+        out = subprocess.run([sys.executable, "-c", code], cwd=BACKEND_DIR, env=child_env(),
+                             capture_output=True, text=True, check=True)
+        samples.append(float(out.stdout.strip().splitlines()[-1]))
+    return samples
+
+def top_imports(limit=15):
+    """Slowest modules imported directly by main, by cumulative time (python -X importtime)"""
+    out = subprocess.run([sys.executable, "-X", "importtime", "-c", "import main"], cwd=BACKEND_DIR,
+                         env=child_env(), capture_output=True, text=True, check=True)
+    rows = []
+    for line in out.stderr.splitlines():
+        match = re.match(r"import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s+)(\S+)", line)
+        if match:
+            rows.append({"module": match.group(4), "cumulative_seconds": int(match.group(2)) / 1e6,
+                         "depth": (len(match.group(3)) - 1) // 2})
+    rows = [row for row in rows if row["depth"] == 1]
+    return sorted(rows, key=lambda row: row["cumulative_seconds"], reverse=True)[:limit]
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def measure_first_response(warm_up, timeout=60.0):
+    """Seconds from launching uvicorn until /health answers 200"""
+    port = free_port()
+    started = time.perf_counter()
+    proc = subprocess.Popen([sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--log-level", "warning"],
+                            cwd=BACKEND_DIR, env=child_env(warm_up))
+    try:
+        while time.perf_counter() - started < timeout:
+            try:
+                with urllib.request.urlopen(f"http://127.0.0.1:{port}/health", timeout=1) as response:
+                    if response.status == 200:
+                        return time.perf_counter() - started
+            except OSError:
+                time.sleep(0.01)
+        raise RuntimeError("server did not answer /health in time")
+    finally:
+        proc.terminate()
+        proc.wait(timeout=10)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--warm-up", action="store_true", help="start the server with WARM_UP_ON_STARTUP=1")
+    parser.add_argument("--compare", help="previous startup result file to compare against")
+    parser.add_argument("--output", help="write results here instead of benchmarks/results/")
+    args = parser.parse_args()
+
+    results = {
+        "import_seconds": summarize(measure_import(args.runs)),
+        "first_response_seconds": summarize([measure_first_response(args.warm_up) for _ in range(args.runs)]),
+        "top_imports": {row["module"]: row["cumulative_seconds"] for row in top_imports()},
+        "warm_up": args.warm_up,
+    }
+    path = save_results("startup", results, args.output)
+    print(json.dumps(results, indent=2))
+    print(f"Saved {path}")
+    if args.compare:
+        sys.exit(1 if print_comparison(compare(load_results(args.compare), load_results(path))) else 0)
+
+if __name__ == "__main__":
+    main()
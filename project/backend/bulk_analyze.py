@@ -0,0 +1,347 @@
+"""Offline bulk analysis: the /analyze-document/ pipeline over a directory or archive.
+
+    python bulk_analyze.py SOURCE [SOURCE ...] --output results.jsonl
+                           [--format jsonl|parquet] [--workers 4] [--batch-size 8]
+                           [--checkpoint results.jsonl.checkpoint] [--retry-failed] [--full-text]
+
+SOURCE is a directory (walked recursively), a zip or tar archive, or a single
+document. Documents are sent in batches to spawned worker processes, each of which
+imports the backend once and analyses its batch concurrently; the LLM rate limits
+(LLM_RPM, LLM_TPM) are shared out between the workers. Results are written
+as they arrive: JSON lines appended to --output, or Parquet part files in the
+--output directory (needs pyarrow). A checkpoint manifest (JSON lines, keyed by the
+SHA-256 of the file) records every finished document once its result has been
+written, so an interrupted run resumes where it stopped; unchanged files (same
+name, size and modification time) are skipped without being read again. A document
+whose result was written just before an interruption may appear twice in the output.
+Ctrl-C drops the queued batches, writes the ones in progress and prints the summary.
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import signal
+import hashlib
+import zipfile
+import tarfile
+import argparse
+import tempfile
+import multiprocessing
+import multiprocessing.util
+from concurrent.futures import ProcessPoolExecutor, Future, FIRST_COMPLETED, wait
+
+# Formats extract_text() understands
+DOCUMENT_EXTENSIONS = (".pdf", ".docx", ".csv", ".xlsx", ".png", ".jpg", ".jpeg")
+# Rows per Parquet part file
+PARQUET_ROWS_PER_PART = int(os.getenv("BULK_PARQUET_ROWS_PER_PART", "1000"))
+
+# --- INPUT ---
+def _supported(name):
+    return os.path.splitext(name)[1].lower() in DOCUMENT_EXTENSIONS
+
+def iter_documents(source):
+    """(name, size, mtime, read) for every supported document in a directory, archive or single file.
+
+    read() returns the bytes and must be called before the next item (tar members are streamed).
+    """
+    if os.path.isdir(source):
+        for root, dirs, files in os.walk(source):
+            dirs.sort()
+            for file in sorted(files):
+                path = os.path.join(root, file)
+                if _supported(file):
+                    stat = os.stat(path)
+                    yield path, stat.st_size, stat.st_mtime, lambda path=path: open(path, "rb").read()
+    elif os.path.isfile(source) and _supported(source):
+        # Checked before the archives: .docx and .xlsx files are zip files too
+        stat = os.stat(source)
+        yield source, stat.st_size, stat.st_mtime, lambda: open(source, "rb").read()
+    elif zipfile.is_zipfile(source):
+        with zipfile.ZipFile(source) as archive:
+            for info in archive.infolist():
+                if not info.is_dir() and _supported(info.filename):
+                    yield f"{source}::{info.filename}", info.file_size, time.mktime(info.date_time + (0, 0, -1)), lambda info=info: archive.read(info)
+    elif tarfile.is_tarfile(source):
+        with tarfile.open(source) as archive:
+            for member in archive:
+                if member.isfile() and _supported(member.name):
+                    yield f"{source}::{member.name}", member.size, member.mtime, lambda member=member: archive.extractfile(member).read()
+    else:
+        raise SystemExit(f"Not a directory, zip/tar archive or supported document: {source}")
+# --- END INPUT ---
+
+# --- WORKERS ---
+_backend = None
+_loop = None
+
+def _backend_loop():
+    """The backend module and a long-lived event loop of this process, created on first use"""
+    global _backend, _loop
+    if _backend is None:
+        import main
+        _backend, _loop = main, asyncio.new_event_loop()
+        # A pool worker joins its children on exit before the executors' own exit hooks run,
+        # so the backend's process pools (OCR, statement pages) are stopped first, waiting
+        multiprocessing.util.Finalize(None, main.stop_ocr_workers, args=(True,), exitpriority=100)
+    return _backend, _loop
+
+async def _analyze(backend, name, digest, content, full_text):
+    record = {"file": name, "sha256": digest, "size": len(content), "status": "ok", "error": None}
+    extension = os.path.splitext(name)[1].lower()
+    started = time.perf_counter()
+    try:
+        with tempfile.NamedTemporaryFile(delete=False, suffix=extension) as tmp:
+            tmp.write(content)
+        result = await backend.analyze_saved_document(tmp.name, extension, content, os.path.basename(name), full_text)
+    except Exception as e:
+        result = None
+        record.update(status="error", error=str(getattr(e, "detail", None) or e))
+    extracted = (result or {}).get("extractedData") or {}
+    record.update(
+        category=(result or {}).get("category"),
+        dashboard_category=(result or {}).get("dashboardCategory"),
+        amount=extracted.get("amount"),
+        date=extracted.get("date"),
+        seconds=time.perf_counter() - started,
+        processed_at=(result or {}).get("processed_at"),
+        result=result,
+    )
+    return record
+
+async def _analyze_all(backend, batch, full_text):
+    return await asyncio.gather(*(_analyze(backend, name, digest, content, full_text) for name, digest, content in batch))
+
+def _init_worker(rpm, tpm):
+    # Ctrl-C reaches the whole process group; the parent decides what to finish
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    # The LLM rate limits are per API key, so every worker's scheduler gets its share
+    os.environ["LLM_RPM"], os.environ["LLM_TPM"] = str(rpm), str(tpm)
+
+def analyze_batch(batch, full_text=False):
+    """Records for a batch of (name, sha256, content), analysed concurrently in this process"""
+    backend, loop = _backend_loop()
+    return loop.run_until_complete(_analyze_all(backend, batch, full_text))
+# --- END WORKERS ---
+
+# --- OUTPUT ---
+class JsonlWriter:
+    """Appends one JSON line per record; every write is flushed, so the records are persisted immediately"""
+
+    def __init__(self, path):
+        self._file = open(path, "a", encoding="utf-8")
+
+    def write(self, records):
+        for record in records:
+            self._file.write(json.dumps(record, default=str) + "\n")
+        self._file.flush()
+        return records
+
+    def close(self):
+        self._file.close()
+        return []
+
+class ParquetWriter:
+    """Part files part-NNNNN.parquet in a directory, one per PARQUET_ROWS_PER_PART records; the result is a JSON column"""
+
+    def __init__(self, path, rows_per_part=PARQUET_ROWS_PER_PART):
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError:
+            raise SystemExit("Parquet output needs pyarrow (pip install pyarrow); use --format jsonl otherwise")
+        self._pa, self._pq = pyarrow, pyarrow.parquet
+        self._schema = pyarrow.schema([
+            ("file", pyarrow.string()), ("sha256", pyarrow.string()), ("size", pyarrow.int64()), ("status", pyarrow.string()),
+            ("error", pyarrow.string()), ("category", pyarrow.string()), ("dashboard_category", pyarrow.string()),
+            ("amount", pyarrow.float64()), ("date", pyarrow.string()), ("seconds", pyarrow.float64()),
+            ("processed_at", pyarrow.string()), ("result", pyarrow.string()),
+        ])
+        self.path = path
+        self.rows_per_part = rows_per_part
+        os.makedirs(path, exist_ok=True)
+        self._part = sum(name.startswith("part-") and name.endswith(".parquet") for name in os.listdir(path))
+        self._pending = []
+
+    def _row(self, record):
+        row = dict(record, result=json.dumps(record["result"], default=str) if record["result"] is not None else None)
+        try:
+            row["amount"] = float(row["amount"]) if row["amount"] is not None else None
+        except (TypeError, ValueError):
+            row["amount"] = None
+        for field in ("error", "category", "dashboard_category", "date", "processed_at"):
+            row[field] = str(row[field]) if row[field] is not None else None
+        return row
+
+    def _flush(self):
+        records, self._pending = self._pending, []
+        if records:
+            table = self._pa.Table.from_pylist([self._row(record) for record in records], schema=self._schema)
+            part = os.path.join(self.path, f"part-{self._part:05d}.parquet")
+            # Written under a temporary name so a part file is either complete or absent
+            self._pq.write_table(table, part + ".tmp")
+            os.replace(part + ".tmp", part)
+            self._part += 1
+        return records
+
+    def write(self, records):
+        self._pending.extend(records)
+        return self._flush() if len(self._pending) >= self.rows_per_part else []
+
+    def close(self):
+        return self._flush()
+
+class Checkpoint:
+    """Append-only manifest of finished documents: sha256 -> status, plus (name, size, mtime) -> sha256"""
+
+    def __init__(self, path):
+        self.path = path
+        self.status = {}
+        self.by_stat = {}
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        # A line cut short by an interruption
+                        continue
+                    self._remember(entry)
+        self._file = open(path, "a", encoding="utf-8")
+
+    def _remember(self, entry):
+        # A later "ok" for the same hash (a retried failure) wins over an earlier error
+        if self.status.get(entry["sha256"]) != "ok":
+            self.status[entry["sha256"]] = entry["status"]
+        self.by_stat[(entry["file"], entry["size"], entry["mtime"])] = entry["sha256"]
+
+    def record(self, records, stats):
+        for record in records:
+            size, mtime = stats[record["file"]]
+            entry = {"sha256": record["sha256"], "file": record["file"], "size": size, "mtime": mtime, "status": record["status"]}
+            self._file.write(json.dumps(entry) + "\n")
+            self._remember(entry)
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def close(self):
+        self._file.close()
+# --- END OUTPUT ---
+
+def _percentile(samples, pct):
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * pct / 100.0))] if samples else 0.0
+
+def run(sources, output, fmt="jsonl", workers=1, batch_size=8, checkpoint_path=None, retry_failed=False, full_text=False):
+    """Analyse every document under sources and write the results; returns the throughput summary"""
+    writer = ParquetWriter(output) if fmt == "parquet" else JsonlWriter(output)
+    checkpoint = Checkpoint(checkpoint_path or output.rstrip("/") + ".checkpoint")
+    skip = {"ok"} if retry_failed else {"ok", "error"}
+    pool = None
+    if workers > 0:
+        from llm_scheduler import LLM_RPM, LLM_TPM
+        pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"),
+                                   initializer=_init_worker, initargs=(LLM_RPM / workers, LLM_TPM / workers))
+    summary = {"processed": 0, "ok": 0, "failed": 0, "skipped": 0, "duplicates": 0, "bytes": 0, "interrupted": False}
+    latencies, stats, queued, batch, in_flight = [], {}, set(), [], set()
+    started = time.perf_counter()
+
+    def finish(records):
+        persisted = writer.write(records)
+        checkpoint.record(persisted, stats)
+        for record in records:
+            summary["processed"] += 1
+            summary["ok" if record["status"] == "ok" else "failed"] += 1
+            summary["bytes"] += record["size"]
+            latencies.append(record["seconds"])
+
+    def drain(limit):
+        nonlocal in_flight
+        while len(in_flight) > limit:
+            done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                finish(future.result())
+
+    def submit():
+        nonlocal batch
+        if pool is None:
+            future = Future()
+            future.set_result(analyze_batch(batch, full_text))
+        else:
+            future = pool.submit(analyze_batch, batch, full_text)
+        in_flight.add(future)
+        batch = []
+        # Two batches per worker keep every worker busy without reading the whole source into memory
+        drain(2 * max(1, workers))
+
+    try:
+        for source in sources:
+            for name, size, mtime, read in iter_documents(source):
+                digest = checkpoint.by_stat.get((name, size, mtime))
+                if digest is None or checkpoint.status.get(digest) not in skip:
+                    content = read()
+                    digest = hashlib.sha256(content).hexdigest()
+                if checkpoint.status.get(digest) in skip:
+                    summary["skipped"] += 1
+                    continue
+                if digest in queued:
+                    summary["duplicates"] += 1
+                    continue
+                queued.add(digest)
+                stats[name] = (size, mtime)
+                batch.append((name, digest, content))
+                if len(batch) >= batch_size:
+                    submit()
+        if batch:
+            submit()
+        drain(0)
+    except KeyboardInterrupt:
+        # Queued batches are dropped; the ones already running are finished and written
+        print("Interrupted: writing the batches in progress, then stopping", file=sys.stderr)
+        for future in in_flight:
+            future.cancel()
+        in_flight = {future for future in in_flight if not future.cancelled()}
+        drain(0)
+        summary["interrupted"] = True
+    finally:
+        if pool is not None:
+            pool.shutdown(wait=True, cancel_futures=True)
+        checkpoint.record(writer.close(), stats)
+        checkpoint.close()
+
+    elapsed = time.perf_counter() - started
+    summary.update(
+        seconds=elapsed,
+        documents_per_second=summary["processed"] / elapsed if elapsed else 0.0,
+        megabytes_per_second=summary["bytes"] / 1e6 / elapsed if elapsed else 0.0,
+        p50_seconds=_percentile(latencies, 50),
+        p95_seconds=_percentile(latencies, 95),
+    )
+    return summary
+
+def print_summary(summary):
+    print(f"Processed {summary['processed']} documents ({summary['ok']} ok, {summary['failed']} failed) in {summary['seconds']:.1f}s: "
+          f"{summary['documents_per_second']:.2f} documents/s, {summary['megabytes_per_second']:.2f} MB/s")
+    print(f"Skipped {summary['skipped']} finished in an earlier run and {summary['duplicates']} duplicate files")
+    print(f"Per document: p50 {summary['p50_seconds']:.2f}s, p95 {summary['p95_seconds']:.2f}s")
+    if summary["interrupted"]:
+        print("Interrupted: run the same command again to resume")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("sources", nargs="+", help="directories, zip/tar archives or documents")
+    parser.add_argument("--output", required=True, help="JSONL file, or directory of Parquet part files")
+    parser.add_argument("--format", choices=("jsonl", "parquet"), help="default: parquet when --output ends in .parquet, else jsonl")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="worker processes (0: analyse in this process)")
+    parser.add_argument("--batch-size", type=int, default=8, help="documents per batch, analysed concurrently by one worker")
+    parser.add_argument("--checkpoint", help="checkpoint manifest (default: OUTPUT.checkpoint)")
+    parser.add_argument("--retry-failed", action="store_true", help="re-run documents that failed in an earlier run")
+    parser.add_argument("--full-text", action="store_true", help="OCR every page of scanned PDFs (no early stop)")
+    args = parser.parse_args()
+    fmt = args.format or ("parquet" if args.output.rstrip("/").endswith(".parquet") else "jsonl")
+    summary = run(args.sources, args.output, fmt, args.workers, max(1, args.batch_size), args.checkpoint, args.retry_failed, args.full_text)
+    print_summary(summary)
+    sys.exit(130 if summary["interrupted"] else 1 if summary["failed"] else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,350 @@
+# Deterministic transaction validation for /validate-and-correct-data/.
+# rule_check() runs vectorised pandas rules over the whole ledger (dates, amounts,
+# types, dashboard categories, per-category outliers, duplicates, running
+# balances) and applies the corrections a rule can decide on its own. Only rows
+# whose findings need judgement are handed to the LLM, split by review_chunks()
+# into token-bounded batches; merge_corrections() folds the answers back by id.
+import os
+import re
+import json
+from datetime import date
+
+from amounts import parse_amount, parse_amounts
+
+# pandas and numpy are imported on first use to keep application start-up fast
+
+VALIDATION_OUTLIER_Z = float(os.getenv("VALIDATION_OUTLIER_Z", "5"))
+# Categories need this many rows before outliers are judged against their spread
+VALIDATION_OUTLIER_MIN_ROWS = int(os.getenv("VALIDATION_OUTLIER_MIN_ROWS", "10"))
+# Prompt token budget for the rows in one LLM review request
+VALIDATION_CHUNK_TOKENS = int(os.getenv("VALIDATION_CHUNK_TOKENS", "3000"))
+# Upper bound on rows sent for LLM review per request (highest severity first)
+VALIDATION_MAX_REVIEW_ROWS = int(os.getenv("VALIDATION_MAX_REVIEW_ROWS", "500"))
+
+CATEGORIES = {
+    'bank-transactions', 'invoices', 'bills', 'inventory', 'item-restocks',
+    'manual-journals', 'general-ledgers', 'general-entries',
+}
+TYPES = {'credit', 'debit'}
+DASHBOARD_CATEGORIES = {'Revenue', 'Expenses', 'Cash Balance', 'Net Burn'}
+# dashboardCategory values consistent with a category, and the one suggested when it is not
+EXPECTED_DASHBOARD = {
+    'invoices': ({'Revenue', 'Cash Balance'}, 'Revenue'),
+    'bills': ({'Expenses', 'Net Burn'}, 'Expenses'),
+}
+# Findings that need judgement; rows carrying one go to the LLM
+REVIEW_ISSUES = {'future_date', 'category_mismatch', 'dashboard_mismatch', 'amount_outlier', 'negative_amount', 'possible_duplicate'}
+CORRECTABLE_FIELDS = {'date', 'description', 'amount', 'type', 'category', 'dashboardCategory'}
+SEVERITY_RANK = {'high': 0, 'medium': 1, 'low': 2}
+REVIEW_COLUMNS = ['id', 'date', 'description', 'amount', 'category', 'type', 'dashboardCategory']
+
+def _text(frame, column):
+    return frame[column].fillna('').astype(str).str.strip()
+
+def parse_dates(raw):
+    """Vectorised ISO date parsing; only the remaining non-ISO strings are parsed one by one"""
+    import pandas as pd
+    parsed = pd.to_datetime(raw, errors='coerce', format='ISO8601')
+    retry = parsed.isna() & (raw != '')
+    if retry.any():
+        parsed[retry] = pd.to_datetime(raw[retry], errors='coerce', format='mixed')
+    return parsed.dt.normalize()
+
+def load_frame(transactions):
+    """DataFrame of the validated fields, with parsed dates and numeric amounts"""
+    import pandas as pd
+    frame = pd.DataFrame.from_records(transactions)
+    # Keep ids as given (a missing id would turn integer ids into floats)
+    frame['id'] = pd.Series([transaction.get('id') for transaction in transactions], dtype=object)
+    for column in REVIEW_COLUMNS:
+        if column not in frame:
+            frame[column] = None
+    frame['raw_date'] = _text(frame, 'date')
+    frame['parsed_date'] = parse_dates(frame['raw_date'])
+    frame['numeric_amount'] = parse_amounts(frame['amount'])
+    frame['type_key'] = _text(frame, 'type').str.lower()
+    frame['category_key'] = _text(frame, 'category').str.lower()
+    frame['dashboard'] = _text(frame, 'dashboardCategory')
+    return frame
+
+class Findings:
+    """Issues and rule corrections collected by the vectorised rules"""
+
+    def __init__(self, frame):
+        self.frame = frame
+        self.issues = []
+        self.corrections = []
+        self._columns = {}
+
+    def column(self, name):
+        """Column values as an array (cached; per-row DataFrame access is slow)"""
+        if name not in self._columns:
+            self._columns[name] = self.frame[name].to_numpy() if name in self.frame else None
+        return self._columns[name]
+
+    def flag(self, mask, issue_type, severity, describe, fix=None):
+        """Record an issue for every row where mask is set.
+
+        describe(row) builds the description; fix(row) returns (field, new_value, action) or None.
+        """
+        import numpy as np
+        rows = np.flatnonzero(np.asarray(mask, dtype=bool))
+        for row, transaction_id in zip(rows, self.column('id')[rows]):
+            row = int(row)
+            correction = fix(row) if fix else None
+            issue = {
+                "type": issue_type,
+                "severity": severity,
+                "transaction_id": _plain(transaction_id),
+                "row": row,
+                "description": describe(row),
+                "suggested_correction": {"notes": correction_notes(correction)},
+            }
+            self.issues.append(issue)
+            if correction is not None:
+                field, new_value, action = correction
+                values = self.column(field)
+                old_value = values[row] if values is not None and action != 'added_reference' else None
+                self.corrections.append(correction_entry(issue["transaction_id"], row, field, old_value, new_value, action,
+                                                         issue["description"], "rule"))
+        return rows
+
+def correction_notes(correction):
+    if correction is None:
+        return "Review manually"
+    field, new_value, action = correction
+    if action == 'removed_duplicate':
+        return "Remove the duplicate"
+    return f"Set {field} to {new_value}"
+
+def correction_entry(transaction_id, row, field, old_value, new_value, action, notes, source):
+    entry = {
+        "transaction_id": _plain(transaction_id),
+        "row": row,
+        "action": action,
+        "field": field,
+        "old_value": _plain(old_value),
+        "new_value": _plain(new_value),
+        "description": notes,
+        "source": source,
+    }
+    if field == 'amount':
+        entry["old_amount"], entry["new_amount"] = entry["old_value"], entry["new_value"]
+    return entry
+
+def _plain(value):
+    """numpy scalars and NaN -> JSON-friendly Python values"""
+    if hasattr(value, 'item'):
+        value = value.item()
+    if isinstance(value, float) and value != value:
+        return None
+    return value
+
+def rule_check(transactions, today=None):
+    """Run the deterministic rules; returns (frame, issues, corrections)"""
+    import numpy as np
+    import pandas as pd
+    frame = load_frame(transactions)
+    today = pd.Timestamp(today or date.today())
+    findings = Findings(frame)
+    amounts = frame['numeric_amount']
+
+    # References: every row needs an id for corrections to be merged back
+    missing_id = _text(frame, 'id') == ''
+    if missing_id.any():
+        frame.loc[missing_id, 'id'] = [f"row-{row}" for row in np.flatnonzero(missing_id.to_numpy())]
+    findings.flag(missing_id, 'missing_reference', 'low', lambda row: "Transaction has no id",
+                  lambda row: ('id', frame['id'].iat[row], 'added_reference'))
+    findings.flag(_text(frame, 'description') == '', 'missing_reference', 'low',
+                  lambda row: "Transaction has no description")
+
+    # Dates
+    missing_date = frame['raw_date'] == ''
+    findings.flag(missing_date, 'missing_date', 'high', lambda row: "Transaction has no date")
+    findings.flag(~missing_date & frame['parsed_date'].isna(), 'invalid_date', 'high',
+                  lambda row: f"Unreadable date '{frame['raw_date'].iat[row]}'")
+    findings.flag(frame['parsed_date'] > today, 'future_date', 'medium',
+                  lambda row: f"Date {frame['parsed_date'].iat[row].date()} is in the future")
+
+    # Amounts: a negative may be a sign-encoded debit or a refund/reversal, so it is reviewed, not flipped
+    findings.flag(amounts.isna(), 'amount_error', 'high',
+                  lambda row: f"Amount '{frame['amount'].iat[row]}' is not a number")
+    findings.flag(amounts == 0, 'amount_error', 'medium', lambda row: "Amount is zero")
+    negative = amounts < 0
+    findings.flag(negative, 'negative_amount', 'medium', lambda row: f"Negative amount {amounts.iat[row]}")
+
+    # Category and type
+    findings.flag(~frame['category_key'].isin(CATEGORIES), 'category_mismatch', 'medium',
+                  lambda row: f"Unknown category '{frame['category'].iat[row]}'")
+    invalid_type = ~frame['type_key'].isin(TYPES)
+    findings.flag(invalid_type, 'category_mismatch', 'high',
+                  lambda row: f"Type '{frame['type'].iat[row]}' is neither credit nor debit",
+                  lambda row: ('type', 'debit' if amounts.iat[row] < 0 else 'credit', 'other'))
+    findings.flag(negative & (frame['type_key'] == 'credit'), 'category_mismatch', 'medium',
+                  lambda row: "Negative amount recorded as a credit",
+                  lambda row: ('type', 'debit', 'other'))
+
+    # Dashboard category consistent with the document category
+    dashboard = frame['dashboard']
+    findings.flag((dashboard != '') & ~dashboard.isin(DASHBOARD_CATEGORIES), 'dashboard_mismatch', 'low',
+                  lambda row: f"Unknown dashboard category '{dashboard.iat[row]}'")
+    for category, (allowed, suggested) in EXPECTED_DASHBOARD.items():
+        findings.flag((frame['category_key'] == category) & dashboard.isin(DASHBOARD_CATEGORIES) & ~dashboard.isin(allowed),
+                      'dashboard_mismatch', 'low',
+                      lambda row, category=category: f"Dashboard category '{dashboard.iat[row]}' for {category}",
+                      lambda row, suggested=suggested: ('dashboardCategory', suggested, 'other'))
+
+    # Outliers: robust z-score of log amounts within each category (median / MAD)
+    magnitude = np.log10(amounts.abs().where(amounts != 0))
+    groups = magnitude.groupby(frame['category_key'])
+    median = groups.transform('median')
+    mad = (magnitude - median).abs().groupby(frame['category_key']).transform('median')
+    sized = groups.transform('count') >= VALIDATION_OUTLIER_MIN_ROWS
+    robust_z = (magnitude - median).abs() / (1.4826 * mad.where(mad > 0))
+    findings.flag(sized & (robust_z > VALIDATION_OUTLIER_Z), 'amount_outlier', 'medium',
+                  lambda row: f"Amount {amounts.iat[row]:,.2f} is unusual for {frame['category_key'].iat[row]} "
+                              f"(typical {10 ** median.iat[row]:,.2f})")
+
+    # Exact duplicates (same date, description, amount, type and category). A repeat of the same id
+    # is a re-import and is removed; with a different id it may be a second real purchase, so it is reviewed
+    key = ['raw_date', 'description', 'numeric_amount', 'type_key', 'category_key']
+    duplicate = frame.duplicated(subset=key, keep='first')
+    ids = frame['id'].astype(str)
+    first_id = ids.groupby([frame[column] for column in key], dropna=False, sort=False).transform('first')
+    same_id = duplicate & (ids == first_id)
+    findings.flag(same_id, 'duplicate', 'medium', lambda row: "Duplicate of an earlier transaction with the same id",
+                  lambda row: ('id', frame['id'].iat[row], 'removed_duplicate'))
+    findings.flag(duplicate & ~same_id, 'possible_duplicate', 'medium',
+                  lambda row: f"Same date, description, amount, type and category as transaction {first_id.iat[row]}")
+
+    # Running balances, when supplied, must move by the signed amount
+    if 'running_balance' in frame:
+        signed = amounts.abs() * np.where(frame['type_key'] == 'debit', -1.0, 1.0)
+        balance = parse_amounts(frame['running_balance'])
+        expected = balance.shift(1) + signed
+        wrong = balance.notna() & expected.notna() & ((balance - expected).abs() > 0.005)
+        findings.flag(wrong, 'balance_error', 'high',
+                      lambda row: f"Running balance {balance.iat[row]:,.2f} should be {expected.iat[row]:,.2f}",
+                      lambda row: ('running_balance', round(float(expected.iat[row]), 2), 'recalculated_balance'))
+    return frame, findings.issues, findings.corrections
+
+def review_rows(frame, issues, limit=VALIDATION_MAX_REVIEW_ROWS):
+    """Rows needing LLM review, highest severity first, with their rule findings attached.
+
+    Returns (records, positions: str(id) -> frame row, rows left out by the limit).
+    """
+    flagged, duplicates = {}, set()
+    for issue in issues:
+        if issue["type"] in REVIEW_ISSUES:
+            flagged.setdefault(issue["row"], []).append(issue)
+        elif issue["type"] == 'duplicate':
+            duplicates.add(issue["row"])
+    # Duplicates are removed anyway
+    for row in duplicates:
+        flagged.pop(row, None)
+    ordered = sorted(flagged, key=lambda row: min(SEVERITY_RANK[issue["severity"]] for issue in flagged[row]))
+    records, positions = [], {}
+    for row in ordered[:limit]:
+        record = {column: _plain(frame[column].iat[row]) for column in REVIEW_COLUMNS}
+        record["findings"] = [issue["description"] for issue in flagged[row]]
+        records.append(record)
+        positions[str(record["id"])] = row
+    return records, positions, max(0, len(ordered) - limit)
+
+def category_context(frame):
+    """Per-category row count and median amount, so the LLM can judge outliers"""
+    stats = frame.groupby('category_key')['numeric_amount'].agg(['count', 'median'])
+    return {category: {"rows": int(row['count']), "median_amount": round(float(row['median']), 2)}
+            for category, row in stats.iterrows() if row['count']}
+
+def review_chunks(rows, max_tokens=VALIDATION_CHUNK_TOKENS):
+    """Split review rows into batches whose JSON stays within max_tokens (about 4 characters per token)"""
+    chunks, current, used = [], [], 0
+    for row in rows:
+        cost = len(json.dumps(row, default=str)) // 4 + 1
+        if current and used + cost > max_tokens:
+            chunks.append(current)
+            current, used = [], 0
+        current.append(row)
+        used += cost
+    if current:
+        chunks.append(current)
+    return chunks
+
+def coerce_value(field, value):
+    """A corrected value in the field's type (AI answers are often strings); None when it cannot be read"""
+    import pandas as pd
+    if field == 'amount':
+        return parse_amount(value)
+    if field == 'date':
+        parsed = parse_dates(pd.Series([str(value or '').strip()], dtype=object)).iat[0]
+        return None if pd.isna(parsed) else parsed.date().isoformat()
+    if field == 'type':
+        value = str(value or '').strip().lower()
+        return value if value in TYPES else None
+    return value
+
+def merge_corrections(transactions, frame, corrections):
+    """Apply corrections by transaction id; returns the corrected transactions (duplicates removed)"""
+    rows = {}
+    for row, transaction_id in enumerate(frame['id'].tolist()):
+        rows.setdefault(transaction_id, row)
+    changes, removed = {}, set()
+    for correction in corrections:
+        row = correction.get("row")
+        if row is None:
+            row = rows.get(correction.get("transaction_id"))
+        if row is None:
+            continue
+        if correction["action"] == 'removed_duplicate':
+            removed.add(row)
+        else:
+            changes.setdefault(row, {})[correction["field"]] = correction["new_value"]
+    ids = frame['id'].tolist()
+    corrected = []
+    for row, transaction in enumerate(transactions):
+        if row in removed:
+            continue
+        if row in changes or transaction.get('id') != ids[row]:
+            transaction = {**transaction, 'id': ids[row], **changes.get(row, {})}
+        corrected.append(transaction)
+    return corrected
+
+def parse_review(response, positions, frame):
+    """LLM review answer -> (issues, corrections) limited to the reviewed ids and correctable fields"""
+    match = re.search(r'\{[\s\S]*\}', response or '')
+    try:
+        answer = json.loads(match.group(0)) if match else None
+    except ValueError:
+        answer = None
+    if not isinstance(answer, dict):
+        return [], []
+    issues, corrections = [], []
+    for issue in answer.get("issues") or []:
+        row = positions.get(str(issue.get("transaction_id"))) if isinstance(issue, dict) else None
+        if row is None:
+            continue
+        issues.append({
+            "type": issue.get("type") or "other",
+            "severity": issue.get("severity") if issue.get("severity") in SEVERITY_RANK else "medium",
+            "transaction_id": _plain(frame['id'].iat[row]),
+            "row": row,
+            "description": issue.get("description") or "",
+            "suggested_correction": {"notes": issue.get("suggested_correction") or issue.get("notes") or ""},
+            "source": "ai",
+        })
+    for correction in answer.get("corrections") or []:
+        if not isinstance(correction, dict) or correction.get("field") not in CORRECTABLE_FIELDS:
+            continue
+        row = positions.get(str(correction.get("transaction_id")))
+        if row is None:
+            continue
+        field = correction["field"]
+        # Merged values must keep the field's type (an amount answered as "1,250.00" would break the totals)
+        new_value = coerce_value(field, correction.get("new_value"))
+        if new_value is None:
+            continue
+        action = "updated_amount" if field == "amount" else "other"
+        corrections.append(correction_entry(frame['id'].iat[row], row, field, frame[field].iat[row], new_value,
+                                            action, correction.get("reason") or correction.get("notes") or "", "ai"))
+    return issues, corrections
@@ -0,0 +1,277 @@
+# Duplicate transaction and document detection.
+# find_duplicates() clusters a transaction list in two passes: exact matches on a
+# hash of the normalised (date, amount, vendor, description), then fuzzy matches
+# found through a blocking index (amount buckets x a sliding date window) so that
+# string similarity is only computed for the few candidate pairs inside a block.
+# DuplicateIndex applies the same rules incrementally to documents at upload.
+import os
+import re
+import time
+import difflib
+import hashlib
+import threading
+from collections import OrderedDict
+
+import metrics
+from amounts import parse_amount, parse_amounts
+from data_validation import parse_dates
+
+# pandas and numpy are imported on first use to keep application start-up fast
+
+DUPLICATE_DATE_WINDOW_DAYS = int(os.getenv("DUPLICATE_DATE_WINDOW_DAYS", "3"))
+DUPLICATE_AMOUNT_TOLERANCE = float(os.getenv("DUPLICATE_AMOUNT_TOLERANCE", "0.01"))
+DUPLICATE_MIN_SIMILARITY = float(os.getenv("DUPLICATE_MIN_SIMILARITY", "0.85"))
+# Neighbours compared per row inside a block; bounds the work on dense blocks (e.g. many equal subscriptions)
+DUPLICATE_MAX_BLOCK_SCAN = int(os.getenv("DUPLICATE_MAX_BLOCK_SCAN", "64"))
+DUPLICATE_INDEX_MAX_DOCUMENTS = int(os.getenv("DUPLICATE_INDEX_MAX_DOCUMENTS", "50000"))
+
+VENDOR_FIELDS = ('vendor', 'customer', 'supplier', 'vendor_customer', 'payee', 'payer')
+
+DUPLICATES_FOUND = metrics.REGISTRY.counter(
+    "finance_ai_duplicates_found_total",
+    "Duplicate transactions or documents detected",
+    ["source", "match"],
+)
+
+_NON_WORD = re.compile(r'[^0-9a-z]+')
+_REFERENCE = re.compile(r'\d{3,}')
+
+def normalise_text(value):
+    return _NON_WORD.sub(' ', str(value or '').lower()).strip()
+
+def vendor_of(record):
+    for field in VENDOR_FIELDS:
+        if record.get(field):
+            return record[field]
+    return ''
+
+def similarity(a, b, threshold=DUPLICATE_MIN_SIMILARITY):
+    """Similarity of two normalised texts in [0, 1]; 0 when below threshold or the reference numbers differ"""
+    if a == b:
+        return 1.0
+    references_a, references_b = set(_REFERENCE.findall(a)), set(_REFERENCE.findall(b))
+    # Differing invoice or reference numbers mark distinct transactions, however similar the rest
+    if references_a and references_b and not references_a & references_b:
+        return 0.0
+    matcher = difflib.SequenceMatcher(None, a, b, autojunk=False)
+    if matcher.real_quick_ratio() < threshold or matcher.quick_ratio() < threshold:
+        return 0.0
+    return matcher.ratio()
+
+def _frame(records):
+    """Normalised matching columns for a list of transaction dicts"""
+    import numpy as np
+    import pandas as pd
+    frame = pd.DataFrame({
+        'id': pd.Series([record.get('id') for record in records], dtype=object),
+        'date': [record.get('date') for record in records],
+        'amount': [record.get('amount') for record in records],
+        'vendor': [vendor_of(record) for record in records],
+        'description': [record.get('description') for record in records],
+    })
+    missing_id = frame['id'].isna()
+    if missing_id.any():
+        frame.loc[missing_id, 'id'] = [f"row-{row}" for row in np.flatnonzero(missing_id.to_numpy())]
+    dates = parse_dates(frame['date'].fillna('').astype(str).str.strip())
+    frame['day'] = (dates - pd.Timestamp('1970-01-01')).dt.days.fillna(-1).astype(np.int64)
+    amounts = parse_amounts(frame['amount']).abs()
+    frame['cents'] = (amounts * 100).round().fillna(-1).astype(np.int64)
+    text = frame['vendor'].fillna('').astype(str) + ' ' + frame['description'].fillna('').astype(str)
+    frame['text'] = text.str.lower().str.replace(_NON_WORD.pattern, ' ', regex=True).str.strip()
+    return frame
+
+def _candidate_pairs(day, cents, tolerance_cents, window_days, max_scan):
+    """(left, right) row arrays within the amount tolerance and date window, found via sorted blocks"""
+    import numpy as np
+    usable = np.flatnonzero((day >= 0) & (cents >= 0))
+    width = 2 * tolerance_cents + 1
+    # Two grids offset by half a bucket: any pair within the tolerance shares a bucket in one of them
+    offsets = (0, width // 2) if width > 1 else (0,)
+    lefts, rights = [], []
+    for offset in offsets:
+        bucket = (cents + offset) // width
+        order = usable[np.lexsort((day[usable], bucket[usable]))]
+        bucket_sorted, day_sorted = bucket[order], day[order]
+        for step in range(1, max_scan + 1):
+            if step >= len(order):
+                break
+            near = (bucket_sorted[step:] == bucket_sorted[:-step]) & (day_sorted[step:] - day_sorted[:-step] <= window_days)
+            if not near.any():
+                break
+            positions = np.flatnonzero(near)
+            lefts.append(order[positions])
+            rights.append(order[positions + step])
+    if not lefts:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+    left, right = np.concatenate(lefts), np.concatenate(rights)
+    keep = np.abs(cents[left] - cents[right]) <= tolerance_cents
+    pairs = np.unique(np.stack([np.minimum(left, right), np.maximum(left, right)])[:, keep], axis=1)
+    return pairs[0], pairs[1]
+
+class _Clusters:
+    """Union-find over row numbers"""
+
+    def __init__(self):
+        self.parent = {}
+
+    def find(self, row):
+        parent = self.parent.setdefault(row, row)
+        if parent != row:
+            parent = self.parent[row] = self.find(parent)
+        return parent
+
+    def union(self, a, b):
+        a, b = self.find(a), self.find(b)
+        if a != b:
+            self.parent[max(a, b)] = min(a, b)
+
+def find_duplicates(records, date_window_days=DUPLICATE_DATE_WINDOW_DAYS, amount_tolerance=DUPLICATE_AMOUNT_TOLERANCE,
+                    min_similarity=DUPLICATE_MIN_SIMILARITY, max_block_scan=DUPLICATE_MAX_BLOCK_SCAN):
+    """Duplicate clusters in a transaction list; returns (clusters, stats).
+
+    Each cluster lists the ids of rows describing the same transaction, oldest row first ("keep").
+    """
+    import numpy as np
+    import pandas as pd
+    started = time.perf_counter()
+    frame = _frame(records)
+    clusters = _Clusters()
+
+    # Exact: identical normalised (day, amount, text); unparseable dates compare as raw text
+    raw_date = frame['date'].fillna('').astype(str).str.strip().where(frame['day'] < 0, '')
+    keys = pd.util.hash_pandas_object(pd.DataFrame({'day': frame['day'], 'raw': raw_date, 'cents': frame['cents'], 'text': frame['text']}),
+                                      index=False).to_numpy()
+    first = pd.Series(np.arange(len(frame))).groupby(keys).transform('min').to_numpy()
+    exact_rows = np.flatnonzero(first != np.arange(len(frame)))
+    for row, representative in zip(exact_rows.tolist(), first[exact_rows].tolist()):
+        clusters.union(representative, row)
+
+    # Fuzzy: one representative per exact group, compared only with its block neighbours
+    day = np.where(first == np.arange(len(frame)), frame['day'].to_numpy(), -1)
+    left, right = _candidate_pairs(day, frame['cents'].to_numpy(), int(round(amount_tolerance * 100)),
+                                   date_window_days, max_block_scan)
+    texts = frame['text'].to_numpy()
+    scores = {}
+    fuzzy_pairs = 0
+    for a, b in zip(left.tolist(), right.tolist()):
+        score = similarity(texts[a], texts[b], min_similarity)
+        if score >= min_similarity:
+            fuzzy_pairs += 1
+            clusters.union(a, b)
+            scores[(a, b)] = score
+
+    groups = {}
+    for row in list(clusters.parent):
+        groups.setdefault(clusters.find(row), []).append(row)
+    fuzzy_roots = {}
+    for (a, b), score in scores.items():
+        root = clusters.find(a)
+        fuzzy_roots[root] = min(score, fuzzy_roots.get(root, 1.0))
+    ids = frame['id'].tolist()
+    output = []
+    for root, rows in groups.items():
+        if len(rows) < 2:
+            continue
+        rows.sort()
+        match = 'fuzzy' if root in fuzzy_roots else 'exact'
+        output.append({
+            "keep": ids[rows[0]],
+            "ids": [ids[row] for row in rows],
+            "duplicate_ids": [ids[row] for row in rows[1:]],
+            "match": match,
+            "similarity": round(fuzzy_roots.get(root, 1.0), 3),
+            "amount": round(float(frame['cents'].iat[rows[0]]) / 100, 2),
+            "dates": sorted({str(frame['date'].iat[row]) for row in rows}),
+        })
+        DUPLICATES_FOUND.inc(len(rows) - 1, source="batch", match=match)
+    output.sort(key=lambda cluster: -len(cluster["ids"]))
+    stats = {
+        "rows": len(frame),
+        "clusters": len(output),
+        "duplicate_rows": sum(len(cluster["ids"]) - 1 for cluster in output),
+        "exact_clusters": sum(1 for cluster in output if cluster["match"] == 'exact'),
+        "fuzzy_clusters": sum(1 for cluster in output if cluster["match"] == 'fuzzy'),
+        "candidate_pairs": int(len(left)),
+        "fuzzy_pairs": fuzzy_pairs,
+        "seconds": round(time.perf_counter() - started, 3),
+    }
+    return output, stats
+
+class DuplicateIndex:
+    """Incremental duplicate check for uploaded documents (file hash + extracted transaction)"""
+
+    def __init__(self, max_documents=DUPLICATE_INDEX_MAX_DOCUMENTS, date_window_days=DUPLICATE_DATE_WINDOW_DAYS,
+                 amount_tolerance=DUPLICATE_AMOUNT_TOLERANCE, min_similarity=DUPLICATE_MIN_SIMILARITY):
+        self.max_documents = max_documents
+        self.date_window_days = date_window_days
+        self.tolerance_cents = int(round(amount_tolerance * 100))
+        self.min_similarity = min_similarity
+        self._documents = OrderedDict()
+        self._blocks = {}
+        self._lock = threading.Lock()
+
+    def _key(self, extracted):
+        """(day, cents, text) of an extracted transaction, or None without a usable date and amount"""
+        from datetime import date
+        amount = parse_amount(extracted.get('amount'))
+        try:
+            day = date.fromisoformat(str(extracted.get('date'))[:10]).toordinal()
+            cents = int(round(abs(amount) * 100))
+        except (TypeError, ValueError, OverflowError):
+            return None
+        text = (normalise_text(vendor_of(extracted)) + ' ' + normalise_text(extracted.get('description'))).strip()
+        return day, cents, text
+
+    def _buckets(self, cents):
+        width = 2 * self.tolerance_cents + 1
+        return {cents // width, (cents + width // 2) // width}
+
+    def check(self, content, filename, extracted):
+        """Earlier documents this upload duplicates ([] if none); the upload is then added to the index"""
+        digest = hashlib.sha256(content).hexdigest()
+        key = self._key(extracted or {})
+        matches = []
+        with self._lock:
+            previous = self._documents.get(digest)
+            if previous is not None:
+                matches.append({"match": "exact", "filename": previous["filename"], "uploaded_at": previous["uploaded_at"], "similarity": 1.0})
+            elif key is not None:
+                day, cents, text = key
+                seen = set()
+                for bucket in self._buckets(cents):
+                    for other in self._blocks.get(bucket, ()):
+                        other_day, other_cents, other_text = other["key"]
+                        if other["digest"] in seen or abs(other_day - day) > self.date_window_days or abs(other_cents - cents) > self.tolerance_cents:
+                            continue
+                        seen.add(other["digest"])
+                        score = similarity(text, other_text, self.min_similarity)
+                        if score >= self.min_similarity:
+                            matches.append({"match": "fuzzy", "filename": other["filename"], "uploaded_at": other["uploaded_at"],
+                                            "similarity": round(score, 3)})
+            if previous is None:
+                self._add(digest, filename, key)
+        for match in matches:
+            DUPLICATES_FOUND.inc(source="upload", match=match["match"])
+        return matches
+
+    def _add(self, digest, filename, key):
+        from datetime import datetime
+        entry = {"digest": digest, "filename": filename, "uploaded_at": datetime.now().isoformat(), "key": key}
+        self._documents[digest] = entry
+        if key is not None:
+            for bucket in self._buckets(key[1]):
+                self._blocks.setdefault(bucket, []).append(entry)
+        while len(self._documents) > self.max_documents:
+            _, evicted = self._documents.popitem(last=False)
+            if evicted["key"] is not None:
+                for bucket in self._buckets(evicted["key"][1]):
+                    block = self._blocks.get(bucket, [])
+                    if evicted in block:
+                        block.remove(evicted)
+                    if not block:
+                        self._blocks.pop(bucket, None)
+
+    def stats(self):
+        return {"documents": len(self._documents), "blocks": len(self._blocks), "max_documents": self.max_documents}
+
+document_index = DuplicateIndex()
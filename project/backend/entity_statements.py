@@ -0,0 +1,225 @@
+# Grouped statement totals for many entities at once.
+# group_totals() computes main.statement_totals() for every entity in a tagged
+# transaction list in one vectorised pass: the columns are extracted once,
+# entities and categories are factorised, and every account total is a
+# bincount over entity codes. Very large inputs are partitioned by entity
+# (balanced by row count) across a process pool; workers receive compact numpy
+# columns, not the transaction dicts, so the hand-off stays cheap. A consolidated
+# roll-up is the sum of the entity totals. Invoices and bills are settled by
+# the bank transactions reconciled against them within the same entity
+# (reconciliation.reconcile, run on each partition's columns, so it scales with
+# the pool too). Deferred professional notes are tracked in NotesJobs.
+import os
+import time
+import uuid
+import threading
+import multiprocessing
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+
+from amounts import parse_amounts
+from duplicates import vendor_of
+from reconciliation import reconcile
+
+# pandas and numpy are imported on first use to keep application start-up fast
+
+ENTITY_STATEMENT_WORKERS = int(os.getenv("ENTITY_STATEMENT_WORKERS", str(os.cpu_count() or 2)))
+# Inputs up to this many rows are grouped in the calling thread
+ENTITY_STATEMENT_PARALLEL_ROWS = int(os.getenv("ENTITY_STATEMENT_PARALLEL_ROWS", "500000"))
+ENTITY_NOTES_MAX_JOBS = int(os.getenv("ENTITY_NOTES_MAX_JOBS", "100"))
+UNASSIGNED_ENTITY = "unassigned"
+
+# Order of the account totals in the grouped arrays (keys of main.statement_totals())
+TOTALS = ("cash_balance", "revenue", "expenses", "cogs", "operating_expenses", "other_income", "other_expenses",
+          "accounts_receivable", "accounts_payable", "inventory_assets", "fixed_assets", "long_term_debt")
+GENERAL_CATEGORIES = ("manual-journals", "general-ledgers", "general-entries")
+
+# --- GROUPED TOTALS (worker processes, or the calling thread) ---
+def _inventory(codes, delta, entity_count):
+    """Inventory per entity: running sum of delta floored at zero after every row, as statement_totals() does.
+
+    A running sum floored at zero ends at total - min(0, lowest prefix sum), so no per-row loop is needed.
+    """
+    import numpy as np
+    rows = np.flatnonzero(delta)
+    result = np.zeros(entity_count)
+    if not len(rows):
+        return result
+    order = rows[np.argsort(codes[rows], kind="stable")]
+    sorted_codes, sorted_delta = codes[order], delta[order]
+    starts = np.flatnonzero(np.r_[True, sorted_codes[1:] != sorted_codes[:-1]])
+    running = np.cumsum(sorted_delta)
+    before_group = np.repeat(running[starts] - sorted_delta[starts], np.diff(np.r_[starts, len(order)]))
+    prefix = running - before_group
+    lowest = np.minimum.reduceat(prefix, starts)
+    totals = np.add.reduceat(sorted_delta, starts)
+    result[sorted_codes[starts]] = totals - np.minimum(0.0, lowest)
+    return result
+
+def partition_totals(codes, categories, category_names, credit, amounts, dates, descriptions, vendors, entity_count):
+    """Account totals (entity x TOTALS) plus per-category row counts and amount sums (entity x category).
+
+    Receivables and payables are what reconciling the partition's bank transactions against its
+    invoices and bills (inside each entity) leaves unpaid.
+    """
+    import numpy as np
+    index = {name: code for code, name in enumerate(category_names)}
+    # Just the fields reconcile() reads, rebuilt from the columns
+    paid = reconcile([{"category": category_names[category], "type": "credit" if is_credit else "debit", "amount": amount,
+                       "date": date, "description": description, "vendor": vendor}
+                      for category, is_credit, amount, date, description, vendor
+                      in zip(categories.tolist(), credit.tolist(), amounts.tolist(), dates, descriptions, vendors)],
+                     groups=codes)[0]
+    def rows(*names):
+        return np.isin(categories, [index[name] for name in names if name in index])
+    def total(weights):
+        return np.bincount(codes, weights=weights, minlength=entity_count)
+    debit = ~credit
+    invoices, bills, bank = rows("invoices"), rows("bills"), rows("bank-transactions")
+    inventory, restocks, general = rows("inventory"), rows("item-restocks"), rows(*GENERAL_CATEGORIES)
+    a = amounts
+    zero = np.zeros_like(a)
+    columns = {
+        "cash_balance": total(np.select(
+            [(bank | inventory | general) & credit, (bank | inventory | general) & debit, restocks & debit],
+            [a, -a, -a], zero)),
+        "revenue": total(np.where(invoices | (inventory & credit), a, zero)),
+        "expenses": total(np.where(bills, a, zero)),
+        "cogs": total(np.where((inventory | restocks) & debit, a, zero)),
+        "operating_expenses": total(np.where(general & debit & (a > 500), a, zero)),
+        "other_income": total(np.where(general & credit & (a > 1000), a, zero)),
+        "other_expenses": total(np.where(general & debit & (a <= 500), a, zero)),
+        "accounts_receivable": total(np.where(invoices, a - paid, zero)),
+        "accounts_payable": total(np.where(bills, a - paid, zero)),
+        "inventory_assets": _inventory(codes, np.select([inventory & debit, inventory & credit, restocks], [a, -0.8 * a, a], zero), entity_count),
+        "fixed_assets": total(np.where(rows("fixed-assets"), a, zero)),
+        "long_term_debt": total(np.where(rows("long-term-debt"), a, zero)),
+    }
+    cells = codes.astype(np.int64) * len(category_names) + categories
+    shape = (entity_count, len(category_names))
+    counts = np.bincount(cells, minlength=shape[0] * shape[1]).reshape(shape)
+    sums = np.bincount(cells, weights=a, minlength=shape[0] * shape[1]).reshape(shape)
+    return np.column_stack([columns[name] for name in TOTALS]), counts, sums
+# --- END GROUPED TOTALS ---
+
+_executor = None
+_executor_lock = threading.Lock()
+
+def executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            # spawn for the same reason as the OCR workers: never fork the running server
+            _executor = ProcessPoolExecutor(max_workers=ENTITY_STATEMENT_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+        return _executor
+
+def shutdown(wait=False):
+    global _executor
+    with _executor_lock:
+        pool, _executor = _executor, None
+    if pool is not None:
+        pool.shutdown(wait=wait, cancel_futures=True)
+
+def _partitions(codes, entity_count, parts):
+    """Entity code -> partition, balancing row counts (largest entities first)"""
+    import numpy as np
+    sizes = np.bincount(codes, minlength=entity_count)
+    loads = np.zeros(parts)
+    assignment = np.empty(entity_count, dtype=np.int64)
+    for entity in np.argsort(-sizes, kind="stable"):
+        part = int(np.argmin(loads))
+        assignment[entity] = part
+        loads[part] += sizes[entity]
+    return assignment
+
+def group_totals(transactions, entity_field="entity_id"):
+    """Per-entity statement totals of a tagged transaction list.
+
+    Returns (entities, totals, summaries): entity names in first-seen order, a list of
+    statement_totals()-style dicts and per-entity {category: {'count', 'total'}} summaries.
+    Rows without an entity id are grouped under UNASSIGNED_ENTITY.
+    """
+    import numpy as np
+    import pandas as pd
+    entity_ids = pd.Series([transaction.get(entity_field) for transaction in transactions], dtype=object)
+    entity_ids = entity_ids.where(entity_ids.notna() & (entity_ids != ""), UNASSIGNED_ENTITY).astype(str)
+    codes, entities = pd.factorize(entity_ids)
+    # Summary keys as generate_financial_statements builds them: a missing category is "other"
+    categories, category_names = pd.factorize(pd.Series([transaction.get("category", "other") for transaction in transactions], dtype=object).fillna(""))
+    credit = np.array([transaction.get("type", "debit") == "credit" for transaction in transactions], dtype=bool)
+    # Inferred dtype: all-numeric amounts take parse_amounts' numeric fast path
+    amounts = parse_amounts(pd.Series([transaction.get("amount", 0) for transaction in transactions])).fillna(0.0).to_numpy()
+    category_names = [str(name) for name in category_names]
+    entity_count = len(entities)
+    # What reconcile() needs besides the columns above; its payments only settle documents of their own entity
+    dates = np.array([transaction.get("date") for transaction in transactions], dtype=object)
+    descriptions = np.array([transaction.get("description") for transaction in transactions], dtype=object)
+    vendors = np.array([vendor_of(transaction) for transaction in transactions], dtype=object)
+
+    parts = min(ENTITY_STATEMENT_WORKERS, entity_count)
+    if len(transactions) <= ENTITY_STATEMENT_PARALLEL_ROWS or parts <= 1:
+        totals, counts, sums = partition_totals(codes, categories, category_names, credit, amounts, dates, descriptions, vendors, entity_count)
+    else:
+        assignment = _partitions(codes, entity_count, parts)
+        futures = []
+        for part in range(parts):
+            rows = np.flatnonzero(assignment[codes] == part)
+            members, local = np.unique(codes[rows], return_inverse=True)
+            futures.append((members, executor().submit(
+                partition_totals, local, categories[rows], category_names, credit[rows], amounts[rows], dates[rows], descriptions[rows], vendors[rows], len(members))))
+        totals = np.zeros((entity_count, len(TOTALS)))
+        counts = np.zeros((entity_count, len(category_names)), dtype=np.int64)
+        sums = np.zeros((entity_count, len(category_names)))
+        for members, future in futures:
+            totals[members], counts[members], sums[members] = future.result()
+
+    total_dicts = [dict(zip(TOTALS, map(float, row))) for row in totals]
+    summaries = [{category_names[column]: {"count": int(counts[entity, column]), "total": float(sums[entity, column])}
+                  for column in np.flatnonzero(counts[entity])} for entity in range(entity_count)]
+    return [str(entity) for entity in entities], total_dicts, summaries
+
+def consolidate(totals, summaries):
+    """Roll-up of several entities: account totals and category summaries summed (no intercompany eliminations)"""
+    combined = {name: sum(entity[name] for entity in totals) for name in TOTALS}
+    categories = {}
+    for summary in summaries:
+        for category, values in summary.items():
+            merged = categories.setdefault(category, {"count": 0, "total": 0.0})
+            merged["count"] += values["count"]
+            merged["total"] += values["total"]
+    return combined, categories
+
+class NotesJobs:
+    """Deferred per-entity professional notes, filled in by background tasks; the oldest jobs are dropped"""
+
+    def __init__(self, max_jobs=ENTITY_NOTES_MAX_JOBS):
+        self.max_jobs = max_jobs
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+
+    def create(self, entities):
+        job_id = uuid.uuid4().hex
+        with self._lock:
+            self._jobs[job_id] = {"status": "running", "created_at": time.time(), "notes": {entity: None for entity in entities}}
+            while len(self._jobs) > self.max_jobs:
+                self._jobs.popitem(last=False)
+        return job_id
+
+    def complete(self, job_id, entity, notes):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return
+            job["notes"][entity] = notes
+            if all(value is not None for value in job["notes"].values()):
+                job["status"] = "completed"
+
+    def get(self, job_id):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return None
+            done = sum(value is not None for value in job["notes"].values())
+            return {**job, "notes": dict(job["notes"]), "completed": done, "total": len(job["notes"])}
+
+notes_jobs = NotesJobs()
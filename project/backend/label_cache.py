@@ -0,0 +1,233 @@
+# Near-duplicate label cache for transaction descriptions.
+# Descriptions are canonicalised (dates, amounts, reference ids and other numbers
+# masked, case and whitespace normalised) so "AWS INVOICE #88213 10/03" and
+# "AWS INVOICE #88214 11/03" share one key. A canonical key seen before reuses
+# its label directly; otherwise a MinHash signature of the key's character
+# shingles is looked up in an LSH band index, and the label of the most similar
+# earlier description is reused when the estimated Jaccard similarity reaches
+# LABEL_CACHE_THRESHOLD and both carry the same direction markers (sign, CR/DR,
+# refund). A sample of hits is re-classified in the background to
+# measure how often the reused label agrees with a fresh one.
+import os
+import re
+import zlib
+import random
+import threading
+from collections import OrderedDict
+
+import metrics
+
+# numpy is imported on first use to keep application start-up fast
+
+LABEL_CACHE_ENABLED = os.getenv("LABEL_CACHE_ENABLED", "1") == "1"
+LABEL_CACHE_THRESHOLD = float(os.getenv("LABEL_CACHE_THRESHOLD", "0.8"))
+LABEL_CACHE_MAX_ENTRIES = int(os.getenv("LABEL_CACHE_MAX_ENTRIES", "100000"))
+# Only short texts (descriptions) are cached; whole documents always go to the LLM
+LABEL_CACHE_MAX_CHARS = int(os.getenv("LABEL_CACHE_MAX_CHARS", "300"))
+# Fraction of cache hits also classified by the LLM to measure agreement
+LABEL_CACHE_AUDIT_RATE = float(os.getenv("LABEL_CACHE_AUDIT_RATE", "0.05"))
+# MinHash permutations = bands x rows per band; 16 x 4 finds pairs at 0.8 similarity with >99.9% probability
+LABEL_CACHE_BANDS = int(os.getenv("LABEL_CACHE_BANDS", "16"))
+LABEL_CACHE_BAND_ROWS = int(os.getenv("LABEL_CACHE_BAND_ROWS", "4"))
+SHINGLE_SIZE = 4
+# The dashboard labels; any other model output is returned to the caller but never cached
+LABELS = ("Cash Balance", "Revenue", "Expenses", "Net Burn")
+_LABEL_KEYS = {label.lower(): label for label in LABELS}
+
+LABEL_CACHE_LOOKUPS = metrics.REGISTRY.counter(
+    "finance_ai_label_cache_lookups_total",
+    "Classification label cache lookups by result (exact canonical match, near duplicate, miss)",
+    ["result"],
+)
+LABEL_CACHE_AUDITS = metrics.REGISTRY.counter(
+    "finance_ai_label_cache_audits_total",
+    "Cached labels re-classified by the LLM, by whether the fresh label agreed",
+    ["outcome"],
+)
+
+# --- CANONICALISATION ---
+_MONTH = r"(?:jan|feb|mar|apr|may|jun|jul|aug|sep|sept|oct|nov|dec)[a-z]*\.?"
+_MASKS = [
+    # Dates with a year or month name: 2024-03-10, 10/03/2024, 10.03.24, 10 Mar 2024, Mar 10, 2024
+    (re.compile(rf"\b\d{{4}}[-/.]\d{{1,2}}[-/.]\d{{1,2}}\b|\b\d{{1,2}}[-/.]\d{{1,2}}[-/.]\d{{2,4}}\b"
+                rf"|\b\d{{1,2}}\s*{_MONTH}(?:\s*\d{{2,4}})?\b|\b{_MONTH}\s*\d{{1,2}}(?:,?\s*\d{{4}})?\b"), " <date> "),
+    # Amounts: a currency marker or two decimals; the sign is kept, it says which way the money moved
+    (re.compile(r"-?\s*(?:[$€£¥₹]|\b(?:usd|eur|gbp|inr|rs)\b\.?)\s*-?\d[\d,.]*|-?\b\d{1,3}(?:[,.\s]\d{3})*[.,]\d{2}\b"),
+     lambda match: " <minus> <amount> " if "-" in match.group(0) else " <amount> "),
+    # Day and month without a year: 10/03
+    (re.compile(r"\b\d{1,2}/\d{1,2}\b"), " <date> "),
+    # Reference ids: #-prefixed tokens and tokens mixing letters and digits
+    (re.compile(r"#\s*[\w-]+|\b(?=[a-z-]*\d)(?=[\d-]*[a-z])[a-z\d]+(?:-[a-z\d]+)*\b"), " <ref> "),
+    (re.compile(r"\d+"), " <num> "),
+]
+_NON_WORD = re.compile(r"[^\w<>]+")
+# Words that tell which way money moved; Revenue and Expenses hinge on them, so a near-duplicate
+# description is only reused when it carries the same ones
+DIRECTION_MARKERS = {
+    "cr": "in", "credit": "in", "credited": "in", "deposit": "in",
+    "dr": "out", "debit": "out", "debited": "out", "withdrawal": "out", "<minus>": "out",
+    "refund": "refund", "refunded": "refund", "reversal": "refund", "reversed": "refund", "chargeback": "refund",
+}
+
+def normalise_label(label):
+    """The dashboard label a model answer names ('revenue', ' "Revenue" ', 'Revenue.'), or None"""
+    return _LABEL_KEYS.get(" ".join(str(label or "").strip().strip("\"'`.").split()).lower())
+
+def canonicalize(text):
+    """Description with dates, amounts, reference ids and numbers masked; lower case, single spaces"""
+    text = (text or "").lower()
+    for pattern, mask in _MASKS:
+        text = pattern.sub(mask, text)
+    return " ".join(_NON_WORD.sub(" ", text).split())
+
+def direction(key):
+    """Direction markers (in, out, refund) of a canonical key"""
+    return frozenset(DIRECTION_MARKERS[word] for word in key.split() if word in DIRECTION_MARKERS)
+# --- END CANONICALISATION ---
+
+class MinHasher:
+    """MinHash signatures over character shingles (universal hashing of crc32 shingle hashes)"""
+
+    PRIME = 4294967311  # smallest prime above 2**32
+
+    def __init__(self, permutations, seed=7):
+        import numpy as np
+        rng = np.random.default_rng(seed)
+        self.a = rng.integers(1, self.PRIME, permutations, dtype=np.uint64)
+        self.b = rng.integers(0, self.PRIME, permutations, dtype=np.uint64)
+
+    def signature(self, text):
+        import numpy as np
+        padded = f" {text} "
+        shingles = {padded[i:i + SHINGLE_SIZE] for i in range(max(1, len(padded) - SHINGLE_SIZE + 1))}
+        hashes = np.fromiter((zlib.crc32(shingle.encode()) for shingle in shingles), dtype=np.uint64, count=len(shingles))
+        # (a * x + b) stays below 2**64 for 32-bit x, a and b
+        return ((np.outer(hashes, self.a) + self.b) % self.PRIME).min(axis=0)
+
+class LabelCache:
+    """Labels by canonical description, with MinHash/LSH lookup of near-duplicate descriptions"""
+
+    def __init__(self, threshold=LABEL_CACHE_THRESHOLD, max_entries=LABEL_CACHE_MAX_ENTRIES, bands=LABEL_CACHE_BANDS,
+                 band_rows=LABEL_CACHE_BAND_ROWS, audit_rate=LABEL_CACHE_AUDIT_RATE, enabled=LABEL_CACHE_ENABLED):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.bands = bands
+        self.band_rows = band_rows
+        self.audit_rate = audit_rate
+        self.enabled = enabled
+        self._hasher = None
+        # canonical key -> (label, signature); least recently used first
+        self._entries = OrderedDict()
+        self._buckets = {}
+        self._lock = threading.Lock()
+        self.exact_hits = self.near_hits = self.misses = 0
+        self.agreed = self.disagreed = 0
+
+    def _signature(self, key):
+        if self._hasher is None:
+            self._hasher = MinHasher(self.bands * self.band_rows)
+        return self._hasher.signature(key)
+
+    def _band_keys(self, signature):
+        rows = self.band_rows
+        return [(band, signature[band * rows:(band + 1) * rows].tobytes()) for band in range(self.bands)]
+
+    def cacheable(self, text):
+        return self.enabled and bool(text) and len(text) <= LABEL_CACHE_MAX_CHARS
+
+    def lookup(self, text):
+        """(label, similarity) reused for text, or None on a miss"""
+        if not self.cacheable(text):
+            return None
+        key = canonicalize(text)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.exact_hits += 1
+                LABEL_CACHE_LOOKUPS.inc(result="exact")
+                return entry[0], 1.0
+        signature = self._signature(key)
+        markers = direction(key)
+        with self._lock:
+            candidates = {candidate for band_key in self._band_keys(signature) for candidate in self._buckets.get(band_key, ())}
+            best, best_similarity = None, 0.0
+            for candidate in candidates:
+                if direction(candidate) != markers:
+                    continue
+                similarity = float((self._entries[candidate][1] == signature).mean())
+                if similarity > best_similarity:
+                    best, best_similarity = candidate, similarity
+            if best is None or best_similarity < self.threshold:
+                self.misses += 1
+                LABEL_CACHE_LOOKUPS.inc(result="miss")
+                return None
+            self._entries.move_to_end(best)
+            self.near_hits += 1
+            LABEL_CACHE_LOOKUPS.inc(result="near")
+            return self._entries[best][0], best_similarity
+
+    def store(self, text, label):
+        label = normalise_label(label)
+        if not self.cacheable(text) or label is None:
+            return
+        key = canonicalize(text)
+        signature = self._signature(key)
+        with self._lock:
+            if key in self._entries:
+                self._entries[key] = (label, self._entries[key][1])
+                self._entries.move_to_end(key)
+                return
+            self._entries[key] = (label, signature)
+            for band_key in self._band_keys(signature):
+                self._buckets.setdefault(band_key, set()).add(key)
+            while len(self._entries) > self.max_entries:
+                evicted, (_, evicted_signature) = self._entries.popitem(last=False)
+                for band_key in self._band_keys(evicted_signature):
+                    bucket = self._buckets.get(band_key)
+                    if bucket is not None:
+                        bucket.discard(evicted)
+                        if not bucket:
+                            del self._buckets[band_key]
+
+    def should_audit(self):
+        return random.random() < self.audit_rate
+
+    def record_audit(self, text, cached_label, fresh_label):
+        """Count whether a reused label matched a fresh classification; the fresh label replaces it"""
+        if normalise_label(fresh_label) is None:
+            return
+        agreed = normalise_label(cached_label) == normalise_label(fresh_label)
+        with self._lock:
+            if agreed:
+                self.agreed += 1
+            else:
+                self.disagreed += 1
+        LABEL_CACHE_AUDITS.inc(outcome="agree" if agreed else "disagree")
+        if not agreed:
+            self.store(text, fresh_label)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._buckets.clear()
+
+    def stats(self):
+        with self._lock:
+            hits = self.exact_hits + self.near_hits
+            audits = self.agreed + self.disagreed
+            return {
+                "enabled": self.enabled,
+                "hits": hits,
+                "exact_hits": self.exact_hits,
+                "near_hits": self.near_hits,
+                "misses": self.misses,
+                "hit_rate": hits / (hits + self.misses) if hits + self.misses else 0.0,
+                "size": len(self._entries),
+                "threshold": self.threshold,
+                "audits": audits,
+                "agreement": self.agreed / audits if audits else None,
+            }
+
+classification_cache = LabelCache()
+metrics.REGISTRY.register_cache("classification_labels", classification_cache.stats)
@@ -0,0 +1,234 @@
+# Tail-latency controls for upstream LLM calls: per-call deadlines, exponential
+# backoff with full jitter on retryable errors, hedged duplicates once a call has
+# run past the observed p95, and a circuit breaker that fails fast (so callers can
+# switch to a local fast path or answer 503 + Retry-After) while upstream is down.
+import os
+import time
+import random
+import asyncio
+import threading
+from collections import deque
+
+import metrics
+
+LLM_CALL_TIMEOUT_S = float(os.getenv("LLM_CALL_TIMEOUT_S", "30"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "3"))
+LLM_BACKOFF_BASE_S = float(os.getenv("LLM_BACKOFF_BASE_S", "0.5"))
+LLM_BACKOFF_CAP_S = float(os.getenv("LLM_BACKOFF_CAP_S", "8"))
+LLM_HEDGING_ENABLED = os.getenv("LLM_HEDGING_ENABLED", "1") == "1"
+LLM_HEDGE_MIN_SAMPLES = int(os.getenv("LLM_HEDGE_MIN_SAMPLES", "20"))
+LLM_BREAKER_FAILURES = int(os.getenv("LLM_BREAKER_FAILURES", "5"))
+LLM_BREAKER_COOLDOWN_S = float(os.getenv("LLM_BREAKER_COOLDOWN_S", "30"))
+
+RETRIES = metrics.REGISTRY.counter(
+    "finance_ai_llm_retries_total",
+    "LLM attempts retried after a retryable error",
+    ["task", "reason"],
+)
+HEDGES = metrics.REGISTRY.counter(
+    "finance_ai_llm_hedges_total",
+    "Hedged duplicate LLM requests launched and won",
+    ["task", "outcome"],
+)
+BREAKER_REJECTIONS = metrics.REGISTRY.counter(
+    "finance_ai_llm_breaker_rejections_total",
+    "LLM calls rejected immediately because the circuit was open",
+    ["task"],
+)
+DEGRADED_RESPONSES = metrics.REGISTRY.counter(
+    "finance_ai_llm_degraded_responses_total",
+    "Responses served from a local fast path while the LLM circuit was open",
+    ["task"],
+)
+
+class CircuitOpenError(Exception):
+    def __init__(self, retry_after):
+        super().__init__(f"LLM circuit open, retry after {retry_after:.0f}s")
+        self.retry_after = retry_after
+
+def is_retryable(error):
+    """Timeouts, connection errors, 408/409/429 and 5xx are worth retrying"""
+    if isinstance(error, asyncio.TimeoutError):
+        return True
+    if type(error).__name__ in ("APITimeoutError", "APIConnectionError"):
+        return True
+    status = getattr(error, "status_code", None)
+    return status in (408, 409, 429) or (status is not None and status >= 500)
+
+def retry_after_seconds(error):
+    headers = getattr(getattr(error, "response", None), "headers", None) or {}
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+def backoff_delay(attempt, base=LLM_BACKOFF_BASE_S, cap=LLM_BACKOFF_CAP_S):
+    """Exponential backoff with full jitter"""
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+class LatencyTracker:
+    """Rolling window of successful call latencies per task, for the hedge delay"""
+
+    def __init__(self, window=200):
+        self._samples = {}
+        self._window = window
+        self._lock = threading.Lock()
+
+    def record(self, task, seconds):
+        with self._lock:
+            self._samples.setdefault(task, deque(maxlen=self._window)).append(seconds)
+
+    def percentile(self, task, pct):
+        with self._lock:
+            samples = sorted(self._samples.get(task, ()))
+        if len(samples) < LLM_HEDGE_MIN_SAMPLES:
+            return None
+        return samples[min(len(samples) - 1, int(len(samples) * pct / 100.0))]
+
+class CircuitBreaker:
+    """Opens after `failure_threshold` consecutive retryable failures; half-opens after cooldown"""
+
+    def __init__(self, failure_threshold=LLM_BREAKER_FAILURES, cooldown_seconds=LLM_BREAKER_COOLDOWN_S):
+        self.failure_threshold = failure_threshold
+        self.cooldown_seconds = cooldown_seconds
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self._probe_in_flight = False
+        self._lock = threading.Lock()
+
+    def retry_after(self):
+        return max(0.0, self.opened_at + self.cooldown_seconds - time.monotonic())
+
+    def allow(self):
+        with self._lock:
+            if self.state == "closed":
+                return True
+            if self.state == "open" and self.retry_after() <= 0:
+                self.state = "half_open"
+            if self.state == "half_open" and not self._probe_in_flight:
+                # Let a single probe through to test whether upstream recovered
+                self._probe_in_flight = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.state = "closed"
+            self.failures = 0
+            self._probe_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._probe_in_flight = False
+            if self.state == "half_open" or self.failures >= self.failure_threshold:
+                self.state = "open"
+                self.opened_at = time.monotonic()
+
+    def release_probe(self):
+        with self._lock:
+            self._probe_in_flight = False
+
+    def snapshot(self):
+        return {"state": self.state, "consecutive_failures": self.failures, "retry_after_seconds": self.retry_after() if self.state != "closed" else 0.0}
+
+LATENCY = LatencyTracker()
+BREAKER = CircuitBreaker()
+
+metrics.REGISTRY.gauge("finance_ai_llm_circuit_open", "1 while the LLM circuit breaker is open or half-open",
+                       callback=lambda: 0 if BREAKER.state == "closed" else 1)
+
+async def _hedged(call, task, hedge_after, started):
+    """Run call(); if it has not finished hedge_after seconds after it reached upstream, race a duplicate.
+
+    started is set when the first call gets past the local scheduler, so queue wait never triggers a hedge.
+    """
+    attempts = [asyncio.ensure_future(call())]
+    try:
+        if hedge_after is None:
+            return await attempts[0]
+        waiter = asyncio.ensure_future(started.wait())
+        try:
+            await asyncio.wait([attempts[0], waiter], return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            waiter.cancel()
+        if attempts[0].done():
+            return attempts[0].result()
+        done, _ = await asyncio.wait(attempts, timeout=hedge_after)
+        if done:
+            return attempts[0].result()
+        HEDGES.inc(task=task, outcome="launched")
+        attempts.append(asyncio.ensure_future(call()))
+        pending = set(attempts)
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for attempt in done:
+                if attempt.exception() is None:
+                    if attempt is attempts[1]:
+                        HEDGES.inc(task=task, outcome="won")
+                    return attempt.result()
+        # Both failed: surface the original request's error
+        return attempts[0].result()
+    finally:
+        for attempt in attempts:
+            if not attempt.done():
+                attempt.cancel()
+
+async def _unscheduled(call):
+    return await call()
+
+async def call_with_resilience(call, task="general", timeout=None, max_retries=None, latency_key=None, schedule=None):
+    """Run the coroutine factory call() with deadline, retries, hedging and the circuit breaker.
+
+    schedule(upstream) runs each upstream request (the first, a hedge or a retry) once local
+    rate limits allow, e.g. through LLM_SCHEDULER.submit; the deadline, the hedge delay and the
+    breaker only see the time after it is granted, so waiting in the local queue never counts
+    as an upstream failure. Hedge delays come from the latencies recorded under latency_key
+    (default: task), so models of different speed serving one task keep separate percentiles.
+    Raises CircuitOpenError without calling upstream while the circuit is open.
+    """
+    latency_key = latency_key or task
+    timeout = timeout if timeout is not None else LLM_CALL_TIMEOUT_S
+    max_retries = max_retries if max_retries is not None else LLM_MAX_RETRIES
+    schedule = schedule or _unscheduled
+    for attempt in range(max_retries + 1):
+        if not BREAKER.allow():
+            BREAKER_REJECTIONS.inc(task=task)
+            raise CircuitOpenError(BREAKER.retry_after() or BREAKER.cooldown_seconds)
+        probe = BREAKER.state == "half_open"
+        hedge_after = LATENCY.percentile(latency_key, 95) if LLM_HEDGING_ENABLED else None
+        started = asyncio.Event()
+        granted = []
+
+        async def upstream():
+            if not started.is_set():
+                granted.append(time.perf_counter())
+                started.set()
+            return await asyncio.wait_for(call(), timeout)
+
+        try:
+            result = await _hedged(lambda: schedule(upstream), task, hedge_after, started)
+        except Exception as e:
+            if not is_retryable(e):
+                # A rejected request (400, 401, ...) says nothing about upstream health: neither
+                # a success nor a failure, but a probe must be released
+                if probe:
+                    BREAKER.release_probe()
+                raise
+            BREAKER.record_failure()
+            reason = "timeout" if isinstance(e, asyncio.TimeoutError) else str(getattr(e, "status_code", None) or type(e).__name__)
+            if attempt == max_retries:
+                raise
+            RETRIES.inc(task=task, reason=reason)
+            await asyncio.sleep(max(backoff_delay(attempt), retry_after_seconds(e) or 0.0))
+            continue
+        except BaseException:
+            # Cancelled (client gone, a hedge that lost, coalescing teardown): no verdict on upstream,
+            # but a probe must not stay in flight or the half-open circuit rejects everything
+            if probe:
+                BREAKER.release_probe()
+            raise
+        BREAKER.record_success()
+        LATENCY.record(latency_key, time.perf_counter() - granted[0])
+        return result
@@ -0,0 +1,258 @@
+# Central scheduler for upstream LLM requests.
+# Every upstream chat completion goes through LLM_SCHEDULER.submit(): requests
+# wait in priority lanes (interactive > bulk > background) and are released only
+# when the request-per-minute and token-per-minute buckets allow it.
+# LLM_SCHEDULER.coalesce() lets identical prompts already in flight share a single
+# upstream call.
+import os
+import time
+import heapq
+import asyncio
+import hashlib
+import itertools
+import threading
+from collections import deque
+
+import metrics
+
+LANES = {"interactive": 0, "bulk": 1, "background": 2}
+
+LLM_RPM = float(os.getenv("LLM_RPM", "500"))
+LLM_TPM = float(os.getenv("LLM_TPM", "80000"))
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "16"))
+
+QUEUE_WAIT_SECONDS = metrics.REGISTRY.histogram(
+    "finance_ai_llm_queue_wait_seconds",
+    "Time LLM requests waited in the scheduler before being sent",
+    ["lane"],
+)
+COALESCED = metrics.REGISTRY.counter(
+    "finance_ai_llm_coalesced_total",
+    "LLM requests answered by an identical in-flight request",
+    ["lane"],
+)
+THROTTLED = metrics.REGISTRY.counter(
+    "finance_ai_llm_upstream_throttled_total",
+    "Upstream 429 responses that paused the scheduler",
+)
+
+class TokenBucket:
+    """Continuous-refill bucket holding up to `capacity`, refilled at rate_per_minute"""
+
+    def __init__(self, rate_per_minute, capacity=None):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = capacity if capacity is not None else rate_per_minute
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay(self, amount):
+        """Seconds until `amount` can be taken (0 if available now)"""
+        with self._lock:
+            self._refill()
+            amount = min(amount, self.capacity)
+            if self.tokens >= amount:
+                return 0.0
+            return (amount - self.tokens) / self.rate if self.rate else float("inf")
+
+    def take(self, amount):
+        with self._lock:
+            self._refill()
+            self.tokens -= amount
+
+    def give_back(self, amount):
+        with self._lock:
+            self._refill()
+            self.tokens = min(self.capacity, self.tokens + amount)
+
+def estimate_tokens(messages, completion_tokens=400):
+    """Rough prompt+completion token estimate (about 4 characters per token)"""
+    return sum(len(m.get("content") or "") for m in messages) // 4 + completion_tokens
+
+def request_key(model, messages, **params):
+    """Stable hash identifying an upstream request for coalescing"""
+    digest = hashlib.sha256()
+    digest.update(model.encode())
+    for message in messages:
+        digest.update(b"\x00" + message.get("role", "").encode() + b"\x01" + (message.get("content") or "").encode())
+    for name in sorted(params):
+        digest.update(f"\x02{name}={params[name]}".encode())
+    return digest.hexdigest()
+
+class _LoopState:
+    """Queue and in-flight bookkeeping bound to one event loop"""
+
+    def __init__(self, loop):
+        self.loop = loop
+        self.waiting = []
+        self.changed = asyncio.Event()
+        self.in_flight = 0
+        self.pending = {}                     # key -> [shared task, waiter count]
+
+class LLMScheduler:
+    def __init__(self, rpm=LLM_RPM, tpm=LLM_TPM, max_concurrency=LLM_MAX_CONCURRENCY):
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+        self.max_concurrency = max_concurrency
+        self.paused_until = 0.0
+        self._sequence = itertools.count()
+        self._state = None
+        self._recent_waits = {lane: deque(maxlen=1000) for lane in LANES}
+        self.coalesced = 0
+        self.dispatched = 0
+
+    def _loop_state(self):
+        loop = asyncio.get_running_loop()
+        if self._state is None or self._state.loop is not loop:
+            self._state = _LoopState(loop)
+        return self._state
+
+    def queue_depths(self):
+        state = self._state
+        depths = {lane: 0 for lane in LANES}
+        if state is not None:
+            names = {rank: lane for lane, rank in LANES.items()}
+            for priority, _ in state.waiting:
+                depths[names[priority]] += 1
+        return depths
+
+    def in_flight(self):
+        return self._state.in_flight if self._state else 0
+
+    def _notify(self, state):
+        state.changed.set()
+        state.changed = asyncio.Event()
+
+    async def _acquire(self, state, priority, tokens):
+        ticket = (priority, next(self._sequence))
+        heapq.heappush(state.waiting, ticket)
+        try:
+            while True:
+                changed = state.changed
+                timeout = None
+                if state.waiting[0] == ticket and state.in_flight < self.max_concurrency:
+                    wait = max(self.paused_until - time.monotonic(), self.requests.delay(1), self.tokens.delay(tokens))
+                    if wait <= 0:
+                        heapq.heappop(state.waiting)
+                        self.requests.take(1)
+                        self.tokens.take(tokens)
+                        state.in_flight += 1
+                        self._notify(state)
+                        return
+                    timeout = wait
+                try:
+                    await asyncio.wait_for(changed.wait(), timeout)
+                except asyncio.TimeoutError:
+                    pass
+        except BaseException:
+            if ticket in state.waiting:
+                state.waiting.remove(ticket)
+                heapq.heapify(state.waiting)
+                self._notify(state)
+            raise
+
+    def _release(self, state):
+        state.in_flight -= 1
+        self._notify(state)
+
+    def pause(self, seconds):
+        """Stop dispatching for `seconds` (e.g. after an upstream 429)"""
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+        THROTTLED.inc()
+
+    async def coalesce(self, key, call, lane="bulk"):
+        """Await call() unless an identical request (same key) is in flight; then share its result.
+
+        The call runs in its own task, shared by every waiter: a waiter that is cancelled
+        leaves it running for the others, and it is cancelled only when the last one leaves.
+        """
+        state = self._loop_state()
+        entry = state.pending.get(key)
+        if entry is None:
+            entry = state.pending[key] = [state.loop.create_task(call()), 0]
+
+            def finished(task, entry=entry):
+                if state.pending.get(key) is entry:
+                    del state.pending[key]
+                if not task.cancelled():
+                    task.exception()  # retrieved even when every waiter has left
+            entry[0].add_done_callback(finished)
+        else:
+            self.coalesced += 1
+            COALESCED.inc(lane=lane)
+        entry[1] += 1
+        try:
+            return await asyncio.shield(entry[0])
+        finally:
+            entry[1] -= 1
+            if not entry[1] and not entry[0].done():
+                if state.pending.get(key) is entry:
+                    del state.pending[key]
+                entry[0].cancel()
+
+    async def submit(self, call, lane="bulk", tokens=1000):
+        """Run the coroutine factory call() once the lane, rate limits and concurrency allow.
+
+        call() may return (result, actual_tokens) to correct the token bucket.
+        """
+        state = self._loop_state()
+        queued = time.perf_counter()
+        await self._acquire(state, LANES[lane], tokens)
+        waited = time.perf_counter() - queued
+        QUEUE_WAIT_SECONDS.observe(waited, lane=lane)
+        self._recent_waits[lane].append(waited)
+        self.dispatched += 1
+        try:
+            outcome = await call()
+        except BaseException as e:
+            if getattr(e, "status_code", None) == 429:
+                retry_after = getattr(getattr(e, "response", None), "headers", {}).get("retry-after")
+                self.pause(float(retry_after) if retry_after else 1.0)
+            raise
+        finally:
+            self._release(state)
+        if isinstance(outcome, tuple) and len(outcome) == 2:
+            result, actual_tokens = outcome
+            if actual_tokens:
+                if actual_tokens > tokens:
+                    self.tokens.take(actual_tokens - tokens)
+                else:
+                    self.tokens.give_back(tokens - actual_tokens)
+            return result
+        return outcome
+
+    def stats(self):
+        waits = {}
+        for lane, samples in self._recent_waits.items():
+            ordered = sorted(samples)
+            waits[lane] = {
+                "samples": len(ordered),
+                "p50": ordered[len(ordered) // 2] if ordered else 0.0,
+                "p95": ordered[int(len(ordered) * 0.95)] if ordered else 0.0,
+                "max": ordered[-1] if ordered else 0.0,
+            }
+        return {
+            "queue_depth": self.queue_depths(),
+            "in_flight": self.in_flight(),
+            "max_concurrency": self.max_concurrency,
+            "rpm": self.requests.rate * 60,
+            "tpm": self.tokens.rate * 60,
+            "paused_for_seconds": max(0.0, self.paused_until - time.monotonic()),
+            "dispatched": self.dispatched,
+            "coalesced": self.coalesced,
+            "queue_wait_seconds": waits,
+        }
+
+LLM_SCHEDULER = LLMScheduler()
+
+metrics.REGISTRY.gauge("finance_ai_llm_queue_depth", "LLM requests waiting in the scheduler", ["lane"],
+                       callback=lambda: {(lane,): depth for lane, depth in LLM_SCHEDULER.queue_depths().items()})
+metrics.REGISTRY.gauge("finance_ai_llm_in_flight", "Upstream LLM requests in flight",
+                       callback=LLM_SCHEDULER.in_flight)
+metrics.REGISTRY.register_cache("llm_inflight_coalescing",
+                                lambda: {"hits": LLM_SCHEDULER.coalesced, "misses": LLM_SCHEDULER.dispatched})
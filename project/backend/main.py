@@ -2,34 +2,163 @@
 import os
 import logging
 import tempfile
-import pytesseract
-import pdfplumber
-import pandas as pd
-from pdf2image import convert_from_path
-from docx import Document
-from PIL import Image
-from fastapi import FastAPI, UploadFile, File, HTTPException, Body
+import asyncio
+import time
+import weakref
+import math
+import secrets
+import hashlib
+from fastapi import FastAPI, UploadFile, File, HTTPException, Body, Depends, Header
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse, FileResponse
 from typing import List
-import openai
-import aiofiles
 import json
-import boto3
 from dotenv import load_dotenv
-import shutil
 import re
 from datetime import datetime, date
 
 load_dotenv()
 
-# DO NOT set or fallback to a hardcoded OpenAI API key here.
-OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
-if not OPENAI_API_KEY:
-    raise RuntimeError("OPENAI_API_KEY environment variable not set. Please set it in your .env file and never commit secrets.")
-openai.api_key = OPENAI_API_KEY
+# Imported after load_dotenv() so module-level settings see values from .env
+import metrics
+import tracing
+import ocr_backends
+from profiling import profiler
+from llm_scheduler import LLM_SCHEDULER, estimate_tokens, request_key
+from llm_resilience import BREAKER, CircuitOpenError, DEGRADED_RESPONSES, call_with_resilience
+from ocr_backends import ocr_registry, ocr_router, count_pages_async, get_poppler_path
+from ocr_workers import ocr_worker_pool
+from posting_rules import compile_posting_rules
+from amounts import parse_amount
+import data_validation
+import statement_tables
+from label_cache import classification_cache
+from model_cascade import cascade_stats, escalation_reason, model_tiers, vote as vote_samples
+from audit_log import audit_log
+from search_index import search_index
+import entity_statements
+import reconciliation
+from entity_statements import notes_jobs
+from statement_tables import STATEMENT_PAGES, statement_reader_pool
+from duplicates import DUPLICATE_AMOUNT_TOLERANCE, DUPLICATE_DATE_WINDOW_DAYS, DUPLICATE_MIN_SIMILARITY, document_index, find_duplicates
+
+# Heavy extractor and SDK modules (pandas, pdfplumber, python-docx, openai, the OCR
+# stack and boto3) are imported on first use so workers and health checks start fast.
+
+def get_openai():
+    """Import the OpenAI SDK on first use and check the API key then, not at import time"""
+    import openai
+    if not openai.api_key:
+        # DO NOT set or fallback to a hardcoded OpenAI API key here.
+        api_key = os.getenv("OPENAI_API_KEY")
+        if not api_key:
+            raise RuntimeError("OPENAI_API_KEY environment variable not set. Please set it in your .env file and never commit secrets.")
+        openai.api_key = api_key
+    return openai
+
+def warm_up():
+    """Import heavy modules ahead of the first request (WARM_UP_ON_STARTUP=1)"""
+    import pandas
+    import pdfplumber
+    import docx
+    ocr_backends.warm_up()
+    search_index.load()
+    if os.getenv("OPENAI_API_KEY"):
+        get_openai()
 
 app = FastAPI()
 
+@app.on_event("startup")
+async def schedule_warm_up():
+    if os.getenv("WARM_UP_ON_STARTUP") == "1":
+        # Run in the background so the server accepts requests (and health checks) immediately
+        asyncio.get_running_loop().run_in_executor(None, warm_up)
+
+@app.on_event("shutdown")
+def stop_ocr_workers(wait=False):
+    ocr_worker_pool.shutdown(wait)
+    statement_reader_pool.shutdown(wait)
+    entity_statements.shutdown(wait)
+    audit_log.shutdown()
+
+@app.middleware("http")
+async def record_request_metrics(request, call_next):
+    started = time.perf_counter()
+    metrics.HTTP_IN_FLIGHT.inc()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        metrics.HTTP_IN_FLIGHT.dec()
+        # Label by route template, not raw path, to keep label cardinality bounded
+        matched = request.scope.get("route")
+        metrics.HTTP_REQUEST_SECONDS.observe(
+            time.perf_counter() - started,
+            method=request.method, route=getattr(matched, "path", "unmatched"), status=status,
+        )
+
+@app.middleware("http")
+async def trace_requests(request, call_next):
+    request_id = request.headers.get("X-Request-ID") or tracing.new_request_id()
+    token = tracing.set_request_id(request_id)
+    try:
+        with tracing.span("http_request", method=request.method, path=request.url.path):
+            session = profiler.claim(request.url.path)
+            if session:
+                response = await profiler.capture(session, request_id, lambda: call_next(request))
+            else:
+                response = await call_next(request)
+        response.headers["X-Request-ID"] = request_id
+        return response
+    finally:
+        tracing.reset_request_id(token)
+
+def require_admin(x_admin_token: str = Header(None)):
+    """Admin endpoints are disabled unless ADMIN_TOKEN is set, then require X-Admin-Token"""
+    expected = os.getenv("ADMIN_TOKEN")
+    if not expected:
+        raise HTTPException(status_code=403, detail="Admin endpoints are disabled (ADMIN_TOKEN not set).")
+    if not x_admin_token or not secrets.compare_digest(x_admin_token, expected):
+        raise HTTPException(status_code=401, detail="Invalid admin token.")
+
+@app.post("/admin/profile", dependencies=[Depends(require_admin)])
+async def arm_profile(route: str = Body(...), count: int = Body(1), mode: str = Body("cprofile")):
+    """Profile the next `count` requests to `route` (mode: cprofile or sampler)"""
+    try:
+        session = profiler.arm(route, count, mode)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return session.to_dict()
+
+@app.get("/admin/profile", dependencies=[Depends(require_admin)])
+async def list_profiles():
+    return {"sessions": profiler.list()}
+
+@app.delete("/admin/profile/{session_id}", dependencies=[Depends(require_admin)])
+async def disarm_profile(session_id: str):
+    session = profiler.disarm(session_id)
+    if not session:
+        raise HTTPException(status_code=404, detail="Unknown profile session.")
+    return session.to_dict()
+
+@app.get("/admin/profile/files/{filename}", dependencies=[Depends(require_admin)])
+async def download_profile(filename: str):
+    path = profiler.path_for(filename)
+    if not path or not os.path.exists(path):
+        raise HTTPException(status_code=404, detail="Unknown profile file.")
+    return FileResponse(path, media_type="application/octet-stream", filename=filename)
+
+@app.get("/metrics")
+async def metrics_endpoint():
+    """Prometheus text-format metrics"""
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+@app.get("/health")
+async def health():
+    return {"status": "ok", "openai_configured": bool(os.getenv("OPENAI_API_KEY"))}
+
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
@@ -199,39 +328,21 @@ ACCOUNTING_MAP = {
 }
 # --- END ACCOUNTING MAP ---
 
-def get_poppler_path():
-    poppler_path = os.getenv("POPPLER_PATH")
-    if poppler_path and os.path.isdir(poppler_path):
-        return poppler_path
-    if shutil.which("pdftoppm") is not None:
-        return None
-    raise RuntimeError(
-        "Poppler is required for PDF processing. "
-        "Install it and add to PATH, or set POPPLER_PATH in your .env file. "
-        "See: https://github.com/oschwartz10612/poppler-windows"
-    )
-
-def get_textract_client():
-    aws_key = os.getenv("AWS_ACCESS_KEY_ID")
-    aws_secret = os.getenv("AWS_SECRET_ACCESS_KEY")
-    region = os.getenv("AWS_REGION") or "ap-south-1"
-    if aws_key and aws_secret:
-        return boto3.client('textract',
-            aws_access_key_id=aws_key,
-            aws_secret_access_key=aws_secret,
-            region_name=region
-        )
-    return None
+# Indexed by category alias and field synonym, with journal legs per category
+POSTING_RULES = compile_posting_rules(ACCOUNTING_MAP)
 
 def extract_from_docx(file_path):
+    from docx import Document
     doc = Document(file_path)
     return "\n".join([p.text for p in doc.paragraphs if p.text.strip()])
 
 def extract_from_csv(file_path):
+    import pandas as pd
     df = pd.read_csv(file_path)
     return df.to_string(index=False)
 
 def extract_from_xlsx(file_path):
+    import pandas as pd
     try:
         df = pd.read_excel(file_path)
         return df.to_string(index=False)
@@ -240,28 +351,23 @@ def extract_from_xlsx(file_path):
         return ""
 
 def extract_from_image(file_path):
-    return pytesseract.image_to_string(Image.open(file_path), config='--psm 6 -l eng+nld')
+    return ocr_registry.get("tesseract").recognize_file(file_path, os.path.splitext(file_path)[1].lower())
 
+@tracing.traced()
 async def ocr_with_tesseract(pdf_path):
     try:
-        poppler_path = get_poppler_path()
+        get_poppler_path()
     except RuntimeError as e:
         return f"Error: {str(e)}"
-    with tempfile.TemporaryDirectory() as temp_dir:
-        try:
-            images = convert_from_path(
-                pdf_path, dpi=150, output_folder=temp_dir,
-                poppler_path=poppler_path
-            )
-        except Exception as e:
-            return f"Error during PDF to image conversion: {str(e)}"
-        full_text = ""
-        for image in images:
-            text = pytesseract.image_to_string(image, config='--psm 6 -l eng+nld')
-            full_text += text + "\n"
-        return full_text.strip()
+    try:
+        return await ocr_registry.get("tesseract").recognize(pdf_path, ".pdf", await count_pages_async(pdf_path, ".pdf"))
+    except Exception as e:
+        return f"Error during PDF to image conversion: {str(e)}"
 
+@metrics.timed_stage("pdfplumber")
+@tracing.traced()
 def extract_with_pdfplumber(file_path):
+    import pdfplumber
     try:
         text = ""
         with pdfplumber.open(file_path) as pdf:
@@ -273,27 +379,27 @@ def extract_with_pdfplumber(file_path):
         return ""
 
 async def extract_text_with_textract(file_path):
-    textract = get_textract_client()
-    if not textract:
+    textract = ocr_registry.get("textract")
+    if not textract.is_available():
         return await ocr_with_tesseract(file_path)
-    with open(file_path, 'rb') as file:
-        try:
-            response = textract.detect_document_text(Document={'Bytes': file.read()})
-            blocks = response.get("Blocks", [])
-            text = " ".join(block.get("Text", "") for block in blocks if block["BlockType"] == "LINE")
-            if not text.strip():
-                return await ocr_with_tesseract(file_path)
-            return text
-        except Exception:
+    extension = os.path.splitext(file_path)[1].lower()
+    try:
+        text = await textract.recognize(file_path, extension, await count_pages_async(file_path, extension))
+        if not text.strip():
             return await ocr_with_tesseract(file_path)
+        return text
+    except Exception:
+        return await ocr_with_tesseract(file_path)
 
+@tracing.traced()
 async def extract_text(file_path: str, extension: str) -> str:
     try:
         if extension == ".pdf":
             text = extract_with_pdfplumber(file_path)
             if not text:
-                logging.warning("pdfplumber found no text, using Tesseract fallback.")
-                return await ocr_with_tesseract(file_path)
+                logging.warning("pdfplumber found no text, using OCR fallback.")
+                metrics.OCR_FALLBACKS.inc(reason="pdf_no_text")
+                return await ocr_router.recognize(file_path, extension)
             return text
         elif extension == ".docx":
             return extract_from_docx(file_path)
@@ -302,84 +408,277 @@ async def extract_text(file_path: str, extension: str) -> str:
         elif extension == ".xlsx":
             return extract_from_xlsx(file_path)
         elif extension in [".png", ".jpg", ".jpeg"]:
-            return extract_from_image(file_path)
+            return await ocr_router.recognize(file_path, extension)
         else:
             raise ValueError("Unsupported file format")
     except Exception as e:
         logging.error(f"Text extraction failed: {e}")
         return ""
 
-def openai_chat_with_retry(messages: list, max_attempts: int = 3, verification_attempts: int = 2) -> str:
-    """Enhanced OpenAI chat with retry and verification logic"""
-    all_responses = []
+# Stop progressive OCR once the final amount is extracted with at least this confidence
+OCR_EARLY_STOP_CONFIDENCE = float(os.getenv("OCR_EARLY_STOP_CONFIDENCE", "0.8"))
+
+@tracing.traced()
+async def extract_text_progressive(file_path: str, extension: str, full_text: bool = False):
+    """Text of a document plus its final amount when OCR stopped early; returns (text, final_amount_result, ocr_info).
+
+    Scanned multi-page PDFs are OCR'd last page first, then the first page and the rest, with
+    the final amount extracted after each page until OCR_EARLY_STOP_CONFIDENCE is reached.
+    full_text=True, text PDFs and other formats use extract_text (final_amount_result is None).
+    """
+    if extension != ".pdf" or full_text:
+        return await extract_text(file_path, extension), None, None
+    text = extract_with_pdfplumber(file_path)
+    if text:
+        return text, None, None
+    metrics.OCR_FALLBACKS.inc(reason="pdf_no_text")
+    page_count = await count_pages_async(file_path, extension)
+    ranked = ocr_router.rank(page_count)
+    if page_count < 2 or not ranked or not ranked[0].supports_progressive:
+        return await ocr_router.recognize(file_path, extension), None, None
     
-    # Make multiple attempts to get responses
-    for attempt in range(max_attempts):
+    extraction = {}
+    async def accept(partial_text):
+        extraction["result"] = await extract_final_amount_with_openai(partial_text)
         try:
-            response = openai.chat.completions.create(
-                model="gpt-4",
-                messages=messages,
-                temperature=0.1
-            )
-            content = response.choices[0].message.content
-            if content:
-                all_responses.append(content.strip())
-        except Exception as e:
-            print(f"OpenAI attempt {attempt + 1} failed: {e}")
-            if attempt == max_attempts - 1:
-                raise HTTPException(status_code=500, detail=f"OpenAI error after {max_attempts} attempts: {str(e)}")
+            return float(extraction["result"]["confidence"]) >= OCR_EARLY_STOP_CONFIDENCE
+        except (TypeError, ValueError):
+            return False
     
-    # If we have multiple responses, verify consistency
+    try:
+        text, pages_read = await ranked[0].recognize_progressive(file_path, page_count, accept)
+    except Exception as e:
+        logging.warning(f"Progressive OCR failed, falling back to full OCR: {e}")
+        return await ocr_router.recognize(file_path, extension), None, None
+    ocr_info = {"backend": ranked[0].name, "page_count": page_count, "pages_read": pages_read, "early_stop": pages_read < page_count}
+    return text, extraction.get("result"), ocr_info
+
+# Scheduler lane for each LLM task: interactive classification first, then bulk
+# document analysis, then background work such as professional notes.
+LLM_TASK_LANES = {
+    "classify": "interactive",
+    "classify_audit": "background",
+    "analyze_document": "bulk",
+    "final_amount": "bulk",
+    "validate": "bulk",
+    "statement_page": "bulk",
+    "professional_notes": "background",
+}
+
+# Per-attempt deadline for each LLM task in seconds (override with LLM_TIMEOUT_<TASK>_S)
+LLM_TASK_TIMEOUTS = {
+    "classify": 10.0,
+    "classify_audit": 10.0,
+    "final_amount": 30.0,
+    "analyze_document": 45.0,
+    "validate": 60.0,
+    "statement_page": 45.0,
+    "professional_notes": 90.0,
+}
+
+def llm_task_timeout(task):
+    override = os.getenv(f"LLM_TIMEOUT_{task.upper()}_S")
+    if override:
+        return float(override)
+    return LLM_TASK_TIMEOUTS.get(task)
+
+class LLMUnavailable(HTTPException):
+    """503 with Retry-After, raised while the LLM circuit breaker is open"""
+
+    def __init__(self, retry_after):
+        super().__init__(
+            status_code=503,
+            detail="AI service is temporarily unavailable. Please retry later.",
+            headers={"Retry-After": str(max(1, math.ceil(retry_after)))},
+        )
+        self.retry_after = retry_after
+
+# One AsyncOpenAI client (and connection pool) per event loop, reused across requests
+_async_openai_clients = weakref.WeakKeyDictionary()
+
+def get_async_openai_client():
+    loop = asyncio.get_running_loop()
+    client = _async_openai_clients.get(loop)
+    if client is None:
+        openai = get_openai()
+        # Retries, backoff and deadlines are handled by call_with_resilience
+        client = _async_openai_clients[loop] = openai.AsyncOpenAI(api_key=openai.api_key, max_retries=0)
+    return client
+
+async def openai_chat_completion(messages: list, task: str = "general", sample: int = 0, model: str = "gpt-4", temperature: float = 0.1) -> str:
+    """One chat completion: coalesced, retried/hedged with deadlines, and scheduled through LLM_SCHEDULER.
+
+    `sample` distinguishes the verification samples of one prompt, so identical
+    concurrent prompts coalesce sample-by-sample and voting still sees independent answers.
+    """
+    client = get_async_openai_client()
+    lane = LLM_TASK_LANES.get(task, "bulk")
+
+    async def call():
+        started = time.perf_counter()
+        try:
+            with metrics.LLM_CALL_SECONDS.time(task=task, model=model), tracing.span("llm_call", task=task, model=model, attempt=sample + 1):
+                response = await client.chat.completions.create(
+                    model=model,
+                    messages=messages,
+                    temperature=temperature
+                )
+        except (Exception, asyncio.CancelledError) as e:
+            # Cancelled: timed out, or a hedged duplicate answered first
+            outcome = "cancelled" if isinstance(e, asyncio.CancelledError) else "error"
+            audit_log.record("llm_call", task=task, model=model, sample=sample, messages=messages, outcome=outcome,
+                             error=f"{type(e).__name__}: {e}", seconds=time.perf_counter() - started)
+            raise
+        usage = getattr(response, "usage", None)
+        total_tokens = prompt_tokens = completion_tokens = None
+        if usage is not None:
+            prompt_tokens, completion_tokens = usage.prompt_tokens, usage.completion_tokens
+            metrics.LLM_TOKENS.inc(prompt_tokens or 0, task=task, direction="in")
+            metrics.LLM_TOKENS.inc(completion_tokens or 0, task=task, direction="out")
+            total_tokens = usage.total_tokens
+        content = response.choices[0].message.content
+        audit_log.record("llm_call", task=task, model=model, sample=sample, messages=messages, outcome="ok", response=content,
+                         prompt_tokens=prompt_tokens, completion_tokens=completion_tokens, seconds=time.perf_counter() - started)
+        return content, total_tokens
+
+    def scheduled(upstream):
+        return LLM_SCHEDULER.submit(upstream, lane=lane, tokens=estimate_tokens(messages))
+
+    async def resilient():
+        # The deadline and hedging apply once the scheduler lets a request through, not to the queue wait
+        return await call_with_resilience(call, task=task, timeout=llm_task_timeout(task), latency_key=(task, model),
+                                          schedule=scheduled)
+
+    key = request_key(model, messages, temperature=temperature, sample=sample)
+    return await LLM_SCHEDULER.coalesce(key, resilient, lane=lane)
+
+@tracing.traced()
+async def openai_chat_with_retry(messages: list, max_attempts: int = 3, verification_attempts: int = 2, task: str = "general") -> str:
+    """Enhanced OpenAI chat with retry and verification logic.
+
+    The model tiers of the task (model_cascade) are asked in turn, cheapest first; a tier's
+    answer is returned unless its samples disagreed, it failed the task's schema check or
+    its reported confidence is too low. The last tier's answer is always returned.
+    """
+    try:
+        get_openai()
+    except RuntimeError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    tiers = model_tiers(task)
+    for tier, model in enumerate(tiers):
+        last_tier = tier == len(tiers) - 1
+        started = time.perf_counter()
+        try:
+            response, vote = await verified_chat_response(messages, max_attempts, verification_attempts, task, model)
+        except LLMUnavailable:
+            # The circuit breaker is shared by all tiers
+            raise
+        except HTTPException as e:
+            audit_log.record("llm_answer", task=task, model=model, outcome="error", error=str(e.detail),
+                             escalated=not last_tier, seconds=time.perf_counter() - started)
+            if last_tier:
+                raise
+            cascade_stats.record(task, model, time.perf_counter() - started, reason="error")
+            continue
+        reason = None if last_tier else escalation_reason(task, response, vote not in DISAGREEING_VOTES)
+        cascade_stats.record(task, model, time.perf_counter() - started, reason=reason)
+        audit_log.record("llm_answer", task=task, model=model, outcome="escalated" if reason else "answered", vote=vote,
+                         escalation_reason=reason, response=response, seconds=time.perf_counter() - started)
+        if reason is None:
+            return response
+
+# Verification votes of verified_chat_response(); these two count as disagreement for the cascade
+DISAGREEING_VOTES = {"majority", "amounts_differ"}
+
+async def verified_chat_response(messages: list, max_attempts: int, verification_attempts: int, task: str, model: str):
+    """(response, vote) from max_attempts samples of one model.
+
+    vote is 'unanimous' or 'majority' (labels or document categories), 'amounts_agree' or
+    'amounts_differ' (extracted amounts), or 'unverified' when the samples could not be
+    compared; samples are compared on their parsed fields (model_cascade.vote).
+    """
+    all_responses = []
+    
+    # Request all verification samples at once; the scheduler paces them upstream
+    outcomes = await asyncio.gather(
+        *(openai_chat_completion(messages, task=task, sample=attempt, model=model) for attempt in range(max_attempts)),
+        return_exceptions=True
+    )
+    last_error = None
+    for attempt, outcome in enumerate(outcomes):
+        if isinstance(outcome, BaseException):
+            metrics.LLM_ATTEMPTS.inc(task=task, outcome="error")
+            last_error = outcome
+            continue
+        metrics.LLM_ATTEMPTS.inc(task=task, outcome="success")
+        if outcome:
+            all_responses.append(outcome.strip())
+    if not all_responses and isinstance(last_error, CircuitOpenError):
+        raise LLMUnavailable(last_error.retry_after)
+    if not all_responses and last_error is not None:
+        raise HTTPException(status_code=500, detail=f"OpenAI error after {max_attempts} attempts: {str(last_error)}")
+    
+    # If we have multiple responses, verify consistency on the fields the task returns
     if len(all_responses) >= verification_attempts:
-        # Check if responses are similar (for classification tasks)
-        if "classify" in str(messages).lower() or "category" in str(messages).lower():
-            # For classification, check if responses are the same
-            unique_responses = set(all_responses)
-            if len(unique_responses) == 1:
-                return all_responses[0]  # All responses agree
-            else:
-                # Responses differ, use the most common one
-                from collections import Counter
-                most_common = Counter(all_responses).most_common(1)[0][0]
-                print(f"Classification responses differed: {all_responses}, using most common: {most_common}")
-                return most_common
-        
-        # For extraction tasks, verify the extracted amounts are similar
-        elif "extract" in str(messages).lower() or "amount" in str(messages).lower():
-            # Try to extract amounts from responses and compare
-            amounts = []
-            for response in all_responses:
-                try:
-                    # Extract JSON and find amount
-                    json_str = extract_json_from_response(response)
-                    result = json.loads(json_str)
-                    if 'final_amount' in result:
-                        amounts.append(float(result['final_amount']))
-                    elif 'amount' in result:
-                        amounts.append(float(result['amount']))
-                except Exception:
-                    continue
-            
-            if len(amounts) >= 2:
-                # Check if amounts are within 10% of each other
-                avg_amount = sum(amounts) / len(amounts)
-                variance = max(abs(amt - avg_amount) for amt in amounts)
-                if variance / avg_amount < 0.1:  # Within 10%
-                    # Use the response with highest confidence or most detailed
-                    best_response = max(all_responses, key=lambda x: len(x))
-                    print(f"Amount extraction verified: {amounts}, using: {avg_amount}")
-                    return best_response
-                else:
-                    # Amounts differ significantly, use the most common range
-                    print(f"Amount extraction differed significantly: {amounts}")
-                    return all_responses[0]  # Fallback to first response
+        response, vote = vote_samples(task, all_responses)
+        if vote in DISAGREEING_VOTES:
+            metrics.LLM_VOTE_DISAGREEMENTS.inc(task=task)
+        return response, vote
     
-    # Return the first valid response if verification fails
-    return all_responses[0] if all_responses else ""
+    return (all_responses[0] if all_responses else ""), "unverified"
 
-def openai_chat(messages: list, max_attempts: int = 3) -> str:
+async def openai_chat(messages: list, max_attempts: int = 3) -> str:
     """Legacy function - now uses enhanced retry logic"""
-    return openai_chat_with_retry(messages, max_attempts, 2)
+    return await openai_chat_with_retry(messages, max_attempts, 2)
+
+# --- LOCAL FAST PATHS (used while the LLM circuit is open) ---
+FINAL_AMOUNT_KEYWORDS = [
+    ('grand total', 0.7), ('total due', 0.7), ('amount due', 0.7), ('balance due', 0.7),
+    ('final amount', 0.7), ('final balance', 0.6), ('net amount', 0.6), ('total payment', 0.6),
+    ('total', 0.5),
+]
+_FINAL_AMOUNT_PATTERNS = [
+    (keyword, confidence, re.compile(r'\b' + keyword + r'\b\W{0,5}?[^0-9\n\-(]{0,15}([-(]?\s*[0-9][0-9.,]*\)?)', re.IGNORECASE))
+    for keyword, confidence in FINAL_AMOUNT_KEYWORDS
+]
+
+def local_extract_final_amount(text: str) -> dict:
+    """Regex extraction of the final amount: last match of the strongest total keyword"""
+    for keyword, confidence, pattern in _FINAL_AMOUNT_PATTERNS:
+        matches = pattern.findall(text or "")
+        if matches:
+            raw = matches[-1].strip()
+            amount = sanitize_amount(raw)
+            return {
+                'final_amount': amount,
+                'confidence': confidence,
+                'amount_type': keyword.title(),
+                'extraction_notes': f"Local pattern match on '{keyword}' (AI service unavailable)",
+                'raw_response': ''
+            }
+    return {
+        'final_amount': 0,
+        'confidence': 0,
+        'amount_type': 'Not Found',
+        'extraction_notes': 'No amount detected by local pattern match (AI service unavailable)',
+        'raw_response': ''
+    }
+
+DASHBOARD_KEYWORDS = [
+    ('Net Burn', ['burn rate', 'net burn', 'runway']),
+    ('Revenue', ['invoice', 'sales', 'sale of', 'revenue', 'income', 'payment received', 'receipt from', 'customer']),
+    ('Expenses', ['bill', 'purchase', 'rent', 'salary', 'payroll', 'utilities', 'fee', 'charges', 'expense', 'supplies', 'subscription']),
+    ('Cash Balance', ['balance', 'bank statement', 'deposit', 'transfer', 'withdrawal']),
+]
+
+def local_classify_financial_category(text: str) -> str:
+    """Keyword classification into the dashboard categories ("" when nothing matches)"""
+    lowered = (text or "").lower()
+    for category, keywords in DASHBOARD_KEYWORDS:
+        if any(keyword in lowered for keyword in keywords):
+            return category
+    return ""
+# --- END LOCAL FAST PATHS ---
 
 def extract_json_from_response(response_str):
     # Try to extract the first {...} JSON object from the response
@@ -389,13 +688,9 @@ def extract_json_from_response(response_str):
     return response_str  # fallback
 
 def sanitize_amount(value):
-    try:
-        # Remove any non-numeric characters except dot and minus
-        amount_str = str(value)
-        amount_clean = re.sub(r'[^0-9.\-]', '', amount_str)
-        return float(amount_clean) if amount_clean else 0.0
-    except Exception:
-        return 0.0
+    """Signed float for an amount in any common notation ('1.234,56', '(500.00)', '1,234.56 CR'); 0.0 if unreadable"""
+    amount = parse_amount(value)
+    return amount if amount is not None else 0.0
 
 def validate_and_parse_date(date_str):
     """Validate and parse date strings, defaulting to current date if invalid"""
@@ -442,7 +737,7 @@ def validate_payment_status(amount, date_str, description):
     else:
         return "pending"
 
-def extract_final_amount_with_openai(text: str) -> dict:
+async def extract_final_amount_with_openai(text: str) -> dict:
     """Use OpenAI to specifically extract the final amount from text with retry and verification"""
     messages = [
         {"role": "system", "content": (
@@ -466,7 +761,7 @@ def extract_final_amount_with_openai(text: str) -> dict:
     
     try:
         # Use enhanced retry logic with verification
-        result_str = openai_chat_with_retry(messages, max_attempts=3, verification_attempts=2)
+        result_str = await openai_chat_with_retry(messages, max_attempts=3, verification_attempts=2, task="final_amount")
         if result_str:
             result_str = result_str.strip()
         else:
@@ -490,8 +785,11 @@ def extract_final_amount_with_openai(text: str) -> dict:
             'extraction_notes': result.get('extraction_notes', ''),
             'raw_response': result_str
         }
+    except LLMUnavailable:
+        DEGRADED_RESPONSES.inc(task="final_amount")
+        return local_extract_final_amount(text)
     except Exception as e:
-        print(f"Error extracting final amount: {e}")
+        logging.warning(f"Error extracting final amount: {e}")
         return {
             'final_amount': 0,
             'confidence': 0,
@@ -502,7 +800,7 @@ def extract_final_amount_with_openai(text: str) -> dict:
 
 # Function to classify text using OpenAI with retry and verification
 
-def classify_financial_category(text: str) -> str:
+async def classify_with_openai(text: str, task: str = "classify") -> str:
     messages = [
         {"role": "system", "content": (
             "You are a financial classification expert. "
@@ -512,32 +810,61 @@ def classify_financial_category(text: str) -> str:
         )},
         {"role": "user", "content": f"Classify this text: {text}"}
     ]
+    # Use enhanced retry logic with verification
+    category = await openai_chat_with_retry(messages, max_attempts=3, verification_attempts=2, task=task)
+    return category.strip() if category else ""
+
+# Background re-classifications of cached labels (references kept until they finish)
+_label_audits = set()
+
+async def audit_cached_label(text: str, cached_label: str):
     try:
-        # Use enhanced retry logic with verification
-        category = openai_chat_with_retry(messages, max_attempts=3, verification_attempts=2)
-        if category:
-            category = category.strip()
-        return category if category else ""
+        classification_cache.record_audit(text, cached_label, await classify_with_openai(text, task="classify_audit"))
+    except Exception as e:
+        logging.warning(f"Label cache audit failed: {e}")
+
+async def classify_financial_category(text: str) -> str:
+    # Recurring descriptions reuse the label of an earlier near-identical one
+    cached = classification_cache.lookup(text)
+    if cached is not None:
+        label, _ = cached
+        if classification_cache.should_audit():
+            audit = asyncio.create_task(audit_cached_label(text, label))
+            _label_audits.add(audit)
+            audit.add_done_callback(_label_audits.discard)
+        return label
+    try:
+        category = await classify_with_openai(text)
+        classification_cache.store(text, category)
+        return category
+    except LLMUnavailable:
+        DEGRADED_RESPONSES.inc(task="classify")
+        return local_classify_financial_category(text)
     except Exception as e:
-        print(f"OpenAI API error: {e}")
+        logging.warning(f"OpenAI API error: {e}")
         return ""
 
 @app.post("/analyze-document/")
-async def analyze_document(file: UploadFile = File(...)):
-    content = await file.read()
-    text = None
-    
-    # Get file extension
-    file_extension = os.path.splitext(file.filename)[1].lower() if file.filename else ""
-    
-    # Save file to temporary location for processing
-    with tempfile.NamedTemporaryFile(delete=False, suffix=file_extension) as tmp:
-                    tmp.write(content)
-                    tmp_path = tmp.name
-    
+async def analyze_document(file: UploadFile = File(...), full_text: bool = False):
+    with metrics.stage_timer("upload"):
+        content = await file.read()
+        text = None
+        
+        # Get file extension
+        file_extension = os.path.splitext(file.filename)[1].lower() if file.filename else ""
+        
+        # Save file to temporary location for processing
+        with tempfile.NamedTemporaryFile(delete=False, suffix=file_extension) as tmp:
+                        tmp.write(content)
+                        tmp_path = tmp.name
+    return await analyze_saved_document(tmp_path, file_extension, content, file.filename, full_text)
+
+async def analyze_saved_document(tmp_path: str, file_extension: str, content: bytes, filename: str, full_text: bool = False) -> dict:
+    """The /analyze-document/ pipeline for a document saved at tmp_path (deleted once its text is extracted)"""
+    started = time.perf_counter()
     try:
-        # Use the new extraction function
-        text = await extract_text(tmp_path, file_extension)
+        # Scanned PDFs are OCR'd progressively unless the caller asks for the full text
+        text, progressive_amount, ocr_info = await extract_text_progressive(tmp_path, file_extension, full_text)
         if not text or not text.strip():
             raise HTTPException(status_code=400, detail="No extractable text found in the document.")
     except Exception as e:
@@ -572,21 +899,21 @@ async def analyze_document(file: UploadFile = File(...)):
         )},
         {"role": "user", "content": f"Extract the FINAL AMOUNT from this document. Look for the total amount that should be paid or received: {text}"}
     ]
-    result_str = openai_chat_with_retry(messages, max_attempts=3, verification_attempts=2)
+    result_str = await openai_chat_with_retry(messages, max_attempts=3, verification_attempts=2, task="analyze_document")
     if not result_str:
         raise HTTPException(status_code=500, detail="No response from OpenAI after retries.")
-    print("OpenAI raw response (with retry verification):", result_str)  # Log for debugging
     try:
-        json_str = extract_json_from_response(result_str)
-        result = json.loads(json_str)
+        with metrics.stage_timer("json_parse"):
+            json_str = extract_json_from_response(result_str)
+            result = json.loads(json_str)
         
         # Validate and sanitize extracted data
         if 'extractedData' in result:
             extracted_data = result['extractedData']
             category = result.get('category', '').lower()
             
-            # Use specialized final amount extraction
-            final_amount_result = extract_final_amount_with_openai(text)
+            # Use specialized final amount extraction (already done page by page when OCR stopped early)
+            final_amount_result = progressive_amount or await extract_final_amount_with_openai(text)
             
             # Use the final amount if it has higher confidence or if no amount was extracted
             if final_amount_result['confidence'] > 0.5 or not extracted_data.get('amount'):
@@ -627,28 +954,156 @@ async def analyze_document(file: UploadFile = File(...)):
             }
 
             # --- ACCOUNTING MAP ATTACHMENT ---
-            # Attach mapping info for each field in extracted_data
-            accounting_info = {}
-            if category in ACCOUNTING_MAP:
-                for field, value in extracted_data.items():
-                    if field in ACCOUNTING_MAP[category]:
-                        accounting_info[field] = ACCOUNTING_MAP[category][field]
-            extracted_data['accountingInfo'] = accounting_info
+            # Attach mapping info for each field in extracted_data (category aliases and field synonyms resolved)
+            extracted_data['accountingInfo'] = POSTING_RULES.accounting_info(category, extracted_data)
             # --- END ACCOUNTING MAP ATTACHMENT ---
         
         # Classify the extracted text into dashboard category using OpenAI
-        dashboard_category = classify_financial_category(text)
+        dashboard_category = await classify_financial_category(text)
         result['dashboardCategory'] = dashboard_category
         
+        # Earlier uploads of the same file, or of a document with the same transaction
+        result['possibleDuplicates'] = document_index.check(content, filename, result.get('extractedData'))
+        
         # Add processing metadata
         result['processed_at'] = datetime.now().isoformat()
         result['text_length'] = len(text)
+        if ocr_info:
+            result['ocr'] = ocr_info
         
     except Exception as e:
-        print(f"Error processing OpenAI response: {e}")
+        logging.warning(f"Error processing OpenAI response: {e}")
+        audit_log.record("document_analysis", filename=filename, content_sha256=hashlib.sha256(content).hexdigest(),
+                         outcome="error", error=f"{type(e).__name__}: {e}", response=result_str, seconds=time.perf_counter() - started)
         raise HTTPException(status_code=500, detail=f"Failed to parse OpenAI response: {result_str}")
+    digest = hashlib.sha256(content).hexdigest()
+    # Kept for /documents/search (the first call also reads the stored index)
+    await asyncio.get_running_loop().run_in_executor(None, search_index.add, digest, filename, text, result)
+    extracted = result.get('extractedData') or {}
+    audit_log.record("document_analysis", filename=filename, content_sha256=digest, outcome="ok",
+                     category=result.get('category'), dashboard_category=result.get('dashboardCategory'),
+                     amount=extracted.get('amount'), date=extracted.get('date'), confidence=result.get('confidence'),
+                     text_length=len(text), ocr=ocr_info, response=result_str, seconds=time.perf_counter() - started)
     return result
 
+@app.post("/extract-bank-statement/")
+async def extract_bank_statement(file: UploadFile = File(...)):
+    """Transactions of a digital PDF bank statement: read from its tables, with the LLM only for pages that do not reconcile"""
+    if not (file.filename or "").lower().endswith(".pdf"):
+        raise HTTPException(status_code=400, detail="Bank statement extraction needs a PDF with a text layer.")
+    with metrics.stage_timer("upload"):
+        content = await file.read()
+        with tempfile.NamedTemporaryFile(delete=False, suffix=".pdf") as tmp:
+            tmp.write(content)
+            tmp_path = tmp.name
+    
+    loop = asyncio.get_running_loop()
+    try:
+        page_count = await count_pages_async(tmp_path, ".pdf")
+        with metrics.stage_timer("statement_tables"):
+            page_transactions, failed_pages, page_texts = await loop.run_in_executor(
+                None, tracing.run_in_context(statement_tables.extract_statement, tmp_path, page_count))
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Failed to read the statement: {str(e)}")
+    finally:
+        os.unlink(tmp_path)
+    if not any(page_transactions) and not any(text.strip() for text in page_texts.values()):
+        raise HTTPException(status_code=400, detail="No statement table or text found; scanned statements go through /analyze-document/.")
+    
+    # Pages whose table did not reconcile are re-read by OpenAI, concurrently
+    async def read_page(index):
+        prompt = f"""
+        This is page {index + 1} of a bank statement. List every transaction on it in order.
+        Return JSON only: {{"transactions": [{{"date": "YYYY-MM-DD", "description": "...", "debit": <number or null>, "credit": <number or null>, "balance": <number or null>}}]}}
+        Debit is money out, credit is money in, balance the running balance printed on the row. Skip opening, closing and carried-forward balance lines.
+        Page text:
+        {page_texts[index]}
+        """
+        response = await openai_chat_with_retry([{"role": "user", "content": prompt}], max_attempts=1, task="statement_page")
+        return statement_tables.llm_transactions(json.loads(extract_json_from_response(response)), index)
+    
+    outcomes = await asyncio.gather(*(read_page(index) for index in failed_pages), return_exceptions=True)
+    llm_failed = []
+    for index, outcome in zip(failed_pages, outcomes):
+        if isinstance(outcome, BaseException) or not outcome:
+            # Keep whatever the table gave for the page
+            llm_failed.append(index + 1)
+            logging.warning(f"Statement page {index + 1} LLM fallback failed: {outcome}")
+            continue
+        page_transactions[index] = outcome
+    if llm_failed:
+        DEGRADED_RESPONSES.inc(task="statement_page")
+    STATEMENT_PAGES.inc(page_count - len(failed_pages), source="table")
+    STATEMENT_PAGES.inc(len(failed_pages) - len(llm_failed), source="llm")
+    STATEMENT_PAGES.inc(len(llm_failed), source="llm_failed")
+    
+    transactions = [record for records in page_transactions for record in records]
+    unreconciled = statement_tables.unreconciled_pages(page_transactions)
+    return {
+        "status": "success",
+        "message": f"{len(transactions)} transactions from {page_count} pages; {len(failed_pages)} pages read by AI",
+        "transactions": transactions,
+        "summary": {
+            "page_count": page_count,
+            "table_pages": page_count - len(failed_pages),
+            "llm_pages": [index + 1 for index in failed_pages],
+            "llm_failed_pages": llm_failed,
+            "unreconciled_pages": unreconciled,
+            "balanced": not unreconciled,
+        },
+    }
+
+@app.post("/post-journal/")
+async def post_journal(records: List[dict], include_lines: bool = True):
+    """Post transactions or analyzed documents to balanced double-entry journal lines and a trial balance"""
+    loop = asyncio.get_running_loop()
+    with metrics.stage_timer("posting"):
+        lines, unposted = await loop.run_in_executor(None, tracing.run_in_context(POSTING_RULES.post, records))
+    total_debit = round(float(lines['debit'].sum()), 2)
+    total_credit = round(float(lines['credit'].sum()), 2)
+    return {
+        "lines": POSTING_RULES.to_records(lines) if include_lines else [],
+        "trialBalance": POSTING_RULES.trial_balance(lines),
+        "unposted": POSTING_RULES.to_records(unposted),
+        "summary": {
+            "records": len(records),
+            "posted": len(records) - len(unposted),
+            "unposted": len(unposted),
+            "lines": len(lines),
+            "total_debit": total_debit,
+            "total_credit": total_credit,
+            "balanced": abs(total_debit - total_credit) < 0.01,
+        },
+    }
+
+@app.post("/find-duplicates/")
+async def find_duplicate_transactions(transactions: List[dict], date_window_days: int = DUPLICATE_DATE_WINDOW_DAYS,
+                                      amount_tolerance: float = DUPLICATE_AMOUNT_TOLERANCE,
+                                      min_similarity: float = DUPLICATE_MIN_SIMILARITY):
+    """Cluster duplicate transactions (exact, and fuzzy within amount/date blocks)"""
+    if not transactions:
+        return {"clusters": [], "summary": {"rows": 0, "clusters": 0, "duplicate_rows": 0}}
+    loop = asyncio.get_running_loop()
+    with metrics.stage_timer("duplicates"):
+        clusters, stats = await loop.run_in_executor(None, tracing.run_in_context(
+            find_duplicates, transactions, date_window_days, amount_tolerance, min_similarity))
+    return {"clusters": clusters, "summary": stats}
+
+def _reconcile_and_annotate(transactions, date_window_days, amount_tolerance):
+    paid, matched, stats = reconciliation.reconcile(transactions, amount_tolerance=amount_tolerance, window_days=date_window_days)
+    return reconciliation.annotate(transactions, paid, matched), stats
+
+@app.post("/reconcile/")
+async def reconcile_transactions(transactions: List[dict], include_transactions: bool = True,
+                                 date_window_days: int = reconciliation.RECONCILE_DATE_WINDOW_DAYS,
+                                 amount_tolerance: float = reconciliation.RECONCILE_AMOUNT_TOLERANCE):
+    """Match bank transactions to invoices and bills; documents get their payment status and outstanding amount"""
+    loop = asyncio.get_running_loop()
+    with metrics.stage_timer("reconcile"):
+        transactions, stats = await loop.run_in_executor(None, tracing.run_in_context(
+            _reconcile_and_annotate, transactions, date_window_days, amount_tolerance))
+    return {"transactions": transactions if include_transactions else [], "summary": stats}
+
 @app.post("/generate-financial-statements/")
 async def generate_financial_statements(transactions: List[dict]):
     """Generate professional financial statements using OpenAI with proper accounting principles"""
@@ -662,6 +1117,107 @@ async def generate_financial_statements(transactions: List[dict]):
             "professionalNotes": []
         }
     
+    # Totals include a reconciliation pass over the whole list, so they are built off the event loop
+    loop = asyncio.get_running_loop()
+    with metrics.stage_timer("statements"):
+        balance_sheet, profit_loss, trial_balance, cash_flow = await loop.run_in_executor(
+            None, tracing.run_in_context(build_financial_statements, transactions))
+    
+    # Use OpenAI to generate professional financial statement notes and analysis
+    professional_notes = await generate_professional_financial_notes(
+        balance_sheet, profit_loss, trial_balance, cash_flow, transactions
+    )
+    
+    return {
+        "balanceSheet": balance_sheet,
+        "profitLoss": profit_loss,
+        "trialBalance": trial_balance,
+        "cashFlow": cash_flow,
+        "professionalNotes": professional_notes
+    }
+
+# Entities whose deferred notes are generated at the same time
+ENTITY_NOTES_CONCURRENCY = int(os.getenv("ENTITY_NOTES_CONCURRENCY", "4"))
+# Background notes jobs (references kept until they finish)
+_notes_tasks = set()
+
+def statements_response(statements, transaction_count):
+    balance_sheet, profit_loss, trial_balance, cash_flow = statements
+    return {
+        "balanceSheet": balance_sheet,
+        "profitLoss": profit_loss,
+        "trialBalance": trial_balance,
+        "cashFlow": cash_flow,
+        "transactionCount": transaction_count,
+    }
+
+def build_entity_statements(transactions, entity_field, consolidated):
+    """(entities, {entity: (statements, transaction_summary)}, consolidated (statements, summary) or None)"""
+    entities, totals, summaries = entity_statements.group_totals(transactions, entity_field)
+    results = {name: (statement_rows(entity_totals), summary) for name, entity_totals, summary in zip(entities, totals, summaries)}
+    rollup = None
+    if consolidated and entities:
+        rollup_totals, rollup_summary = entity_statements.consolidate(totals, summaries)
+        rollup = (statement_rows(rollup_totals), rollup_summary)
+    return entities, results, rollup
+
+async def generate_entity_notes(job_id, entities):
+    """Professional notes for each (name, statements, transaction_summary), recorded in notes_jobs as they finish"""
+    semaphore = asyncio.Semaphore(ENTITY_NOTES_CONCURRENCY)
+    async def one(name, statements, summary):
+        async with semaphore:
+            notes = await generate_professional_financial_notes(*statements, [], transaction_summary=summary)
+        notes_jobs.complete(job_id, name, notes)
+    await asyncio.gather(*(one(*entity) for entity in entities))
+
+@app.post("/generate-financial-statements/batch/")
+async def generate_financial_statements_batch(transactions: List[dict], entity_field: str = "entity_id",
+                                              consolidated: bool = True, notes: bool = False):
+    """Statements for every entity in a tagged transaction list, plus an optional consolidated roll-up.
+
+    Totals are computed in one grouped pass (partitioned across worker processes for very large
+    inputs). Professional notes are deferred: with notes=true a background job generates them per
+    entity and GET /generate-financial-statements/batch/notes/{job_id} reports its progress.
+    """
+    loop = asyncio.get_running_loop()
+    with metrics.stage_timer("entity_statements"):
+        entities, results, rollup = await loop.run_in_executor(
+            None, tracing.run_in_context(build_entity_statements, transactions, entity_field, consolidated))
+    
+    notes_job = None
+    if notes and entities:
+        notes_job = notes_jobs.create(entities + (["consolidated"] if rollup else []))
+        jobs = [(name, statements, summary) for name, (statements, summary) in results.items()]
+        if rollup:
+            jobs.append(("consolidated", *rollup))
+        task = asyncio.create_task(generate_entity_notes(notes_job, jobs))
+        _notes_tasks.add(task)
+        task.add_done_callback(_notes_tasks.discard)
+    
+    def count(summary):
+        return sum(values["count"] for values in summary.values())
+    return {
+        "entities": {name: statements_response(statements, count(summary)) for name, (statements, summary) in results.items()},
+        "consolidated": statements_response(rollup[0], count(rollup[1])) if rollup else None,
+        "notes": {"status": "deferred", "job_id": notes_job} if notes_job else {"status": "not_requested"},
+        "summary": {"entities": len(entities), "transactions": len(transactions)},
+    }
+
+@app.get("/generate-financial-statements/batch/notes/{job_id}")
+async def entity_notes_status(job_id: str):
+    """Progress and results of a deferred per-entity notes job"""
+    job = notes_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Unknown or expired notes job")
+    return job
+
+@tracing.traced()
+def build_financial_statements(transactions):
+    """Compute balance sheet, P&L, trial balance and cash flow rows from transactions"""
+    return statement_rows(statement_totals(transactions))
+
+def statement_totals(transactions):
+    """Account totals of a transaction list (see entity_statements.group_totals for the grouped, vectorised pass)"""
     # Phase 1: Categorize and analyze transactions properly
     cash_balance = 0
     revenue = 0
@@ -678,32 +1234,25 @@ async def generate_financial_statements(transactions: List[dict]):
     # Track inventory
     inventory_assets = 0
     
+    # Invoices and bills are settled by the bank transactions reconciled against them
+    paid = reconciliation.reconcile(transactions)[0].tolist()
+    
     # Process each transaction based on its category and type
-    for transaction in transactions:
+    for row, transaction in enumerate(transactions):
         amount = transaction.get('amount', 0)
         transaction_type = transaction.get('type', 'debit')
         category = transaction.get('category', '')
         
         # Phase 3.1: Profit and Loss (P&L) calculations
         if category == 'invoices':
-            # Invoices are revenue (money coming in)
+            # Invoices are revenue; the unpaid part is receivable (the cash arrives as a bank transaction)
             revenue += amount
-            # Assume some invoices are paid, some are receivables
-            if transaction_type == 'credit':
-                cash_balance += amount * 0.7  # 70% paid
-                accounts_receivable += amount * 0.3  # 30% outstanding
-            else:
-                accounts_receivable += amount
+            accounts_receivable += amount - paid[row]
                 
         elif category == 'bills':
-            # Bills are expenses (money going out)
+            # Bills are expenses; the unpaid part is payable (the cash leaves as a bank transaction)
             expenses += amount
-            # Assume some bills are paid, some are payables
-            if transaction_type == 'debit':
-                cash_balance -= amount * 0.6  # 60% paid
-                accounts_payable += amount * 0.4  # 40% outstanding
-            else:
-                accounts_payable += amount
+            accounts_payable += amount - paid[row]
                 
         elif category == 'bank-transactions':
             # Bank transactions affect cash balance directly
@@ -749,6 +1298,25 @@ async def generate_financial_statements(transactions: List[dict]):
                 else:
                     other_expenses += amount
     
+    fixed_assets = sum(t.get('amount', 0) for t in transactions 
+                      if t.get('category') == 'fixed-assets')
+    long_term_debt = sum(t.get('amount', 0) for t in transactions 
+                        if t.get('category') == 'long-term-debt')
+    return {
+        'cash_balance': cash_balance, 'revenue': revenue, 'expenses': expenses, 'cogs': cogs,
+        'operating_expenses': operating_expenses, 'other_income': other_income, 'other_expenses': other_expenses,
+        'accounts_receivable': accounts_receivable, 'accounts_payable': accounts_payable,
+        'inventory_assets': inventory_assets, 'fixed_assets': fixed_assets, 'long_term_debt': long_term_debt,
+    }
+
+def statement_rows(totals):
+    """Balance sheet, P&L, trial balance and cash flow rows from statement_totals()"""
+    cash_balance = totals['cash_balance']
+    revenue, cogs = totals['revenue'], totals['cogs']
+    operating_expenses, other_income, other_expenses = totals['operating_expenses'], totals['other_income'], totals['other_expenses']
+    accounts_receivable, accounts_payable = totals['accounts_receivable'], totals['accounts_payable']
+    inventory_assets, fixed_assets, long_term_debt = totals['inventory_assets'], totals['fixed_assets'], totals['long_term_debt']
+    
     # Phase 3.1: Calculate P&L components
     gross_profit = revenue - cogs
     operating_income = gross_profit - operating_expenses
@@ -783,9 +1351,6 @@ async def generate_financial_statements(transactions: List[dict]):
         })
     
     # Non-current Assets (if any)
-    # Add fixed assets if present in transactions
-    fixed_assets = sum(t.get('amount', 0) for t in transactions 
-                      if t.get('category') == 'fixed-assets')
     if fixed_assets > 0:
         balance_sheet.append({
             "account": "Fixed Assets",
@@ -805,8 +1370,6 @@ async def generate_financial_statements(transactions: List[dict]):
         })
     
     # Long-term Liabilities (if any)
-    long_term_debt = sum(t.get('amount', 0) for t in transactions 
-                        if t.get('category') == 'long-term-debt')
     if long_term_debt > 0:
         balance_sheet.append({
             "account": "Long-term Debt",
@@ -1009,21 +1572,10 @@ async def generate_financial_statements(transactions: List[dict]):
             "type": "operating"
         })
     
-    # Use OpenAI to generate professional financial statement notes and analysis
-    professional_notes = await generate_professional_financial_notes(
-        balance_sheet, profit_loss, trial_balance, cash_flow, transactions
-    )
-    
-    return {
-        "balanceSheet": balance_sheet,
-        "profitLoss": profit_loss,
-        "trialBalance": trial_balance,
-        "cashFlow": cash_flow,
-        "professionalNotes": professional_notes
-    }
+    return balance_sheet, profit_loss, trial_balance, cash_flow
 
-async def generate_professional_financial_notes(balance_sheet, profit_loss, trial_balance, cash_flow, transactions):
-    """Generate professional financial statement notes using OpenAI"""
+async def generate_professional_financial_notes(balance_sheet, profit_loss, trial_balance, cash_flow, transactions, transaction_summary=None):
+    """Generate professional financial statement notes using OpenAI (transaction_summary: per-category counts and totals, if already known)"""
     
     # Prepare data summary for OpenAI
     total_assets = sum(item['amount'] for item in balance_sheet if item['type'] == 'asset')
@@ -1034,13 +1586,14 @@ async def generate_professional_financial_notes(balance_sheet, profit_loss, tria
     net_income = total_revenue - total_expenses
     
     # Categorize transactions
-    transaction_summary = {}
-    for transaction in transactions:
-        category = transaction.get('category', 'other')
-        if category not in transaction_summary:
-            transaction_summary[category] = {'count': 0, 'total': 0}
-        transaction_summary[category]['count'] += 1
-        transaction_summary[category]['total'] += transaction.get('amount', 0)
+    if transaction_summary is None:
+        transaction_summary = {}
+        for transaction in transactions:
+            category = transaction.get('category', 'other')
+            if category not in transaction_summary:
+                transaction_summary[category] = {'count': 0, 'total': 0}
+            transaction_summary[category]['count'] += 1
+            transaction_summary[category]['total'] += transaction.get('amount', 0)
     
     messages = [
         {"role": "system", "content": (
@@ -1087,7 +1640,7 @@ Generate comprehensive professional analysis and notes.
     
     try:
         # Use enhanced retry logic for professional analysis
-        result_str = openai_chat_with_retry(messages, max_attempts=3, verification_attempts=2)
+        result_str = await openai_chat_with_retry(messages, max_attempts=3, verification_attempts=2, task="professional_notes")
         if not result_str:
             return {
                 "executive_summary": "Financial analysis completed successfully.",
@@ -1107,7 +1660,7 @@ Generate comprehensive professional analysis and notes.
         }
         
     except Exception as e:
-        print(f"Error generating professional notes: {e}")
+        logging.warning(f"Error generating professional notes: {e}")
         return {
             "executive_summary": "Financial analysis completed successfully.",
             "balance_sheet_analysis": "Balance sheet analysis available.",
@@ -1121,13 +1674,85 @@ Generate comprehensive professional analysis and notes.
 
 @app.post("/classify-transaction/")
 async def classify_transaction(description: str = Body(..., embed=True)):
-    category = classify_financial_category(description)
+    category = await classify_financial_category(description)
     return {"dashboardCategory": category}
 
+@app.get("/classification/cache")
+async def classification_cache_status():
+    """Hit rate (exact and near-duplicate), size and audited agreement of the description label cache"""
+    return classification_cache.stats()
+
+@app.get("/llm/scheduler")
+async def llm_scheduler_status():
+    """Queue depths, in-flight requests, coalescing, queue wait times and circuit breaker state"""
+    return {**LLM_SCHEDULER.stats(), "circuit_breaker": BREAKER.snapshot()}
+
+@app.get("/llm/cascade")
+async def llm_cascade_status():
+    """Model tiers per task with answers, escalation rates (by reason) and mean latency of each tier"""
+    return cascade_stats.stats()
+
+@app.get("/documents/search")
+async def search_documents(q: str = None, vendor: str = None, category: str = None, amount_min: float = None,
+                           amount_max: float = None, date_from: str = None, date_to: str = None,
+                           sort: str = "-date", page: int = 1, page_size: int = 20):
+    """Analysed documents matching all given filters, one page at a time.
+
+    q and vendor match documents containing all their words; amount and date ranges
+    (YYYY-MM-DD) are inclusive. sort is date, amount, -date (default) or -amount.
+    """
+    loop = asyncio.get_running_loop()
+    try:
+        return await loop.run_in_executor(None, search_index.search, q, vendor, category, amount_min, amount_max,
+                                          date_from, date_to, sort, page, page_size)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.get("/documents/index")
+async def document_index_status():
+    """Documents and distinct tokens in the search index"""
+    return search_index.stats()
+
+@app.get("/audit-log")
+async def audit_log_status():
+    """Audit log writer: entries queued, written and dropped, and segments opened"""
+    return audit_log.stats()
+
+@app.get("/ocr/backends")
+async def ocr_backends_status():
+    """Latency, throughput, error and cost stats for each OCR backend, plus the Tesseract worker pool"""
+    return {
+        "backends": ocr_registry.stats(),
+        "latency_budget_seconds": ocr_router.latency_budget_seconds,
+        "max_cost_per_document": ocr_router.max_cost_per_document,
+        "tesseract_workers": ocr_worker_pool.stats(),
+    }
+
 @app.post("/extract-final-amount/")
 async def extract_final_amount_endpoint(text: str = Body(..., embed=True)):
     """Extract final amount from text using OpenAI"""
-    result = extract_final_amount_with_openai(text)
+    result = await extract_final_amount_with_openai(text)
+    return result
+
+@app.post("/extract-final-amount-from-file/")
+async def extract_final_amount_from_file(file: UploadFile = File(...), full_text: bool = False):
+    """Extract the final amount from an uploaded document, OCR'ing scanned PDFs only as far as needed"""
+    content = await file.read()
+    file_extension = os.path.splitext(file.filename)[1].lower() if file.filename else ""
+    with tempfile.NamedTemporaryFile(delete=False, suffix=file_extension) as tmp:
+        tmp.write(content)
+        tmp_path = tmp.name
+    try:
+        text, result, ocr_info = await extract_text_progressive(tmp_path, file_extension, full_text)
+        if not text or not text.strip():
+            raise HTTPException(status_code=400, detail="No extractable text found in the document.")
+        if result is None:
+            result = await extract_final_amount_with_openai(text)
+    finally:
+        os.unlink(tmp_path)
+    result = {**result, "ocr": ocr_info}
+    if full_text:
+        result["text"] = text
     return result
 
 @app.post("/validate-payments/")
@@ -1194,7 +1819,7 @@ async def validate_payments(transactions: List[dict]):
 
 @app.post("/validate-and-correct-data/")
 async def validate_and_correct_data(transactions: List[dict]):
-    """Validate and correct financial data using OpenAI"""
+    """Validate and correct financial data: rule pass over every row, OpenAI review of the suspicious ones"""
     
     if not transactions:
         return {
@@ -1204,15 +1829,75 @@ async def validate_and_correct_data(transactions: List[dict]):
             "issues_found": 0
         }
     
-    # Prepare data for OpenAI analysis
-    transaction_summary = []
-    for transaction in transactions:
-        transaction_summary.append({
-            "id": transaction.get('id'),
-            "date": transaction.get('date'),
-            "description": transaction.get('description'),
-            "amount": transaction.get('amount'),
-            "category": transaction.get('category'),
-            "type": transaction.get('type'),
-            "dashboardCategory": transaction.get('dashboardCategory')
-        })
+    # Deterministic vectorised rules over the whole ledger
+    loop = asyncio.get_running_loop()
+    with metrics.stage_timer("validation_rules"):
+        frame, issues, corrections = await loop.run_in_executor(
+            None, tracing.run_in_context(data_validation.rule_check, transactions))
+        review, positions, not_reviewed = await loop.run_in_executor(
+            None, tracing.run_in_context(data_validation.review_rows, frame, issues))
+        context = await loop.run_in_executor(None, tracing.run_in_context(data_validation.category_context, frame))
+    
+    # Only rows whose findings need judgement go to OpenAI, in token-bounded chunks reviewed concurrently
+    async def review_chunk(chunk):
+        prompt = f"""
+        You are a financial data validation expert. The transactions below were flagged by automatic checks; each carries its "findings".
+        Decide for each whether the finding is a real problem and how to correct it.
+        Typical amounts per category: {json.dumps(context)}
+        Transactions: {json.dumps(chunk, default=str)}
+        Return JSON only:
+        {{"issues": [{{"transaction_id": "...", "type": "...", "severity": "high|medium|low", "description": "...", "suggested_correction": "..."}}],
+          "corrections": [{{"transaction_id": "...", "field": "date|description|amount|type|category|dashboardCategory", "new_value": "...", "reason": "..."}}]}}
+        Only include corrections you are confident about; leave legitimate transactions out.
+        """
+        response = await openai_chat_with_retry([{"role": "user", "content": prompt}], max_attempts=1, task="validate")
+        return data_validation.parse_review(response, positions, frame)
+    
+    chunks = data_validation.review_chunks(review)
+    outcomes = await asyncio.gather(*(review_chunk(chunk) for chunk in chunks), return_exceptions=True)
+    failed_chunks = 0
+    for outcome in outcomes:
+        if isinstance(outcome, BaseException):
+            failed_chunks += 1
+            logging.warning(f"Validation review chunk failed: {outcome}")
+            continue
+        chunk_issues, chunk_corrections = outcome
+        issues.extend(chunk_issues)
+        corrections.extend(chunk_corrections)
+    if failed_chunks:
+        DEGRADED_RESPONSES.inc(task="validate")
+    
+    corrected_transactions = await loop.run_in_executor(
+        None, tracing.run_in_context(data_validation.merge_corrections, transactions, frame, corrections))
+    counts = {}
+    for issue in issues:
+        counts[issue["type"]] = counts.get(issue["type"], 0) + 1
+    message = f"Found {len(issues)} issues in {len(transactions)} transactions; {len(review)} reviewed by AI in {len(chunks)} requests"
+    if failed_chunks:
+        message += f" ({failed_chunks} review requests failed, rule results only for those rows)"
+    if not_reviewed:
+        message += f" ({not_reviewed} flagged rows over the review limit were not sent to AI)"
+    return {
+        "status": "success",
+        "message": message,
+        "issues_found": len(issues),
+        "corrections": corrections,
+        "corrected_transactions": corrected_transactions,
+        "validation_result": {
+            "summary": {
+                "total_issues": len(issues),
+                "duplicates_found": counts.get("duplicate", 0) + counts.get("possible_duplicate", 0),
+                "amount_errors": counts.get("amount_error", 0) + counts.get("amount_outlier", 0) + counts.get("negative_amount", 0),
+                "missing_refs": counts.get("missing_reference", 0),
+                "balance_errors": counts.get("balance_error", 0),
+                "by_type": counts,
+            },
+            "issues": issues,
+        },
+        "review": {
+            "flagged_rows": len(review) + not_reviewed,
+            "reviewed_rows": len(review),
+            "requests": len(chunks),
+            "failed_requests": failed_chunks,
+        },
+    }
@@ -0,0 +1,266 @@
+# Minimal in-process metrics with Prometheus text exposition (served at /metrics).
+# Counters, gauges and histograms are thread-safe so OCR/LLM worker threads can
+# record into them; gauges can also be computed on scrape from a callback.
+import time
+import inspect
+import threading
+import functools
+from contextlib import contextmanager
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _format_labels(labelnames, values, extra=None):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(labelnames, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class _Metric:
+    type_name = "untyped"
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def header(self):
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type_name}"]
+
+class Counter(_Metric):
+    type_name = "counter"
+
+    def inc(self, amount=1.0, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels):
+        with self._lock:
+            return self._values.get(self._key(labels), 0.0)
+
+    def render(self):
+        with self._lock:
+            items = sorted(self._values.items())
+        return self.header() + [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(v)}" for key, v in items]
+
+class Gauge(_Metric):
+    """Gauge set explicitly, or computed on scrape by callback() -> {label_tuple: value}"""
+
+    type_name = "gauge"
+
+    def __init__(self, name, documentation, labelnames=(), callback=None):
+        super().__init__(name, documentation, labelnames)
+        self.callback = callback
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = float(value)
+
+    def inc(self, amount=1.0, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def dec(self, amount=1.0, **labels):
+        self.inc(-amount, **labels)
+
+    def render(self):
+        if self.callback is not None:
+            values = self.callback()
+            if not isinstance(values, dict):
+                values = {(): values}
+            items = sorted((tuple(str(v) for v in key), value) for key, value in values.items())
+        else:
+            with self._lock:
+                items = sorted(self._values.items())
+        return self.header() + [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(v)}" for key, v in items]
+
+class Histogram(_Metric):
+    type_name = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = {"counts": [0] * len(self.buckets), "sum": 0.0, "count": 0}
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state["counts"][i] += 1
+                    break
+            state["sum"] += value
+            state["count"] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def snapshot(self, **labels):
+        with self._lock:
+            state = self._values.get(self._key(labels))
+            return {"count": state["count"], "sum": state["sum"]} if state else {"count": 0, "sum": 0.0}
+
+    def render(self):
+        with self._lock:
+            items = sorted((key, {"counts": list(s["counts"]), "sum": s["sum"], "count": s["count"]}) for key, s in self._values.items())
+        lines = self.header()
+        for key, state in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets, state["counts"]):
+                cumulative += count
+                le = 'le="' + _format_value(bound) + '"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {_format_value(state['sum'])}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {state['count']}")
+        return lines
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+        self._caches = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            self._metrics.append(metric)
+        return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name, documentation, labelnames=(), callback=None):
+        return self.register(Gauge(name, documentation, labelnames, callback))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def register_cache(self, name, stats):
+        """Expose a cache; stats() must return a dict with 'hits', 'misses' and optionally 'size'"""
+        with self._lock:
+            self._caches[name] = stats
+
+    def cache_stats(self):
+        with self._lock:
+            caches = dict(self._caches)
+        out = {}
+        for name, stats in caches.items():
+            values = stats()
+            lookups = values.get("hits", 0) + values.get("misses", 0)
+            out[name] = {**values, "hit_rate": values.get("hits", 0) / lookups if lookups else 0.0}
+        return out
+
+    def render(self):
+        with self._lock:
+            metrics = list(self._metrics)
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        caches = self.cache_stats()
+        for field, kind in (("hits", "counter"), ("misses", "counter"), ("size", "gauge"), ("hit_rate", "gauge")):
+            name = f"finance_ai_cache_{field}" + ("_total" if kind == "counter" else "")
+            lines.append(f"# HELP {name} Cache {field.replace('_', ' ')} per cache")
+            lines.append(f"# TYPE {name} {kind}")
+            for cache, values in sorted(caches.items()):
+                if field in values:
+                    lines.append(f'{name}{{cache="{_escape(cache)}"}} {_format_value(float(values[field]))}')
+        return "\n".join(lines) + "\n"
+
+REGISTRY = Registry()
+
+# --- PIPELINE METRICS ---
+STAGE_SECONDS = REGISTRY.histogram(
+    "finance_ai_stage_duration_seconds",
+    "Duration of each document pipeline stage",
+    ["stage"],
+)
+OCR_PAGE_SECONDS = REGISTRY.histogram(
+    "finance_ai_ocr_page_duration_seconds",
+    "OCR time per page",
+    ["backend"],
+)
+LLM_CALL_SECONDS = REGISTRY.histogram(
+    "finance_ai_llm_call_duration_seconds",
+    "Latency of each upstream LLM call",
+    ["task", "model"],
+)
+LLM_ATTEMPTS = REGISTRY.counter(
+    "finance_ai_llm_attempts_total",
+    "LLM call attempts by outcome",
+    ["task", "outcome"],
+)
+LLM_VOTE_DISAGREEMENTS = REGISTRY.counter(
+    "finance_ai_llm_vote_disagreements_total",
+    "Verification votes where the sampled responses disagreed",
+    ["task"],
+)
+LLM_TOKENS = REGISTRY.counter(
+    "finance_ai_llm_tokens_total",
+    "LLM tokens sent (in) and received (out)",
+    ["task", "direction"],
+)
+OCR_FALLBACKS = REGISTRY.counter(
+    "finance_ai_ocr_fallbacks_total",
+    "Documents that fell back to OCR",
+    ["reason"],
+)
+HTTP_REQUEST_SECONDS = REGISTRY.histogram(
+    "finance_ai_http_request_duration_seconds",
+    "HTTP request latency by route",
+    ["method", "route", "status"],
+)
+HTTP_IN_FLIGHT = REGISTRY.gauge(
+    "finance_ai_http_requests_in_flight",
+    "Requests currently being handled",
+)
+# --- END PIPELINE METRICS ---
+
+@contextmanager
+def stage_timer(stage):
+    with STAGE_SECONDS.time(stage=stage):
+        yield
+
+def timed_stage(stage):
+    """Decorator recording a sync or async function's duration as a pipeline stage"""
+    def decorator(func):
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with stage_timer(stage):
+                    return await func(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with stage_timer(stage):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def render():
+    return REGISTRY.render()
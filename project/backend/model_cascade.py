@@ -0,0 +1,219 @@
+# Model cascade for LLM tasks.
+# Every task has a list of model tiers, cheapest and fastest first. The first
+# tier answers; its answer is accepted unless the tier's verification samples
+# disagreed, the answer fails the task's schema check, or the confidence it
+# reports is below LLM_CASCADE_CONFIDENCE, in which case the next tier is asked.
+# The last tier's answer is always used. Tiers come from LLM_MODEL_TIERS
+# (override per task with LLM_MODEL_TIERS_<TASK>); free-form tasks whose output
+# cannot be checked go straight to the strongest tier.
+import os
+import re
+import json
+import threading
+
+import metrics
+from amounts import parse_amount
+
+LLM_CASCADE_ENABLED = os.getenv("LLM_CASCADE_ENABLED", "1") == "1"
+LLM_MODEL_TIERS = [model.strip() for model in os.getenv("LLM_MODEL_TIERS", "gpt-4o-mini,gpt-4").split(",") if model.strip()]
+# Verification samples agree on an amount when they are within this fraction of each other
+LLM_VOTE_AMOUNT_TOLERANCE = float(os.getenv("LLM_VOTE_AMOUNT_TOLERANCE", "0.01"))
+# Reported confidence below this escalates (override per task with LLM_CASCADE_CONFIDENCE_<TASK>)
+LLM_CASCADE_CONFIDENCE = float(os.getenv("LLM_CASCADE_CONFIDENCE", "0.8"))
+# Notes and validation reports have no schema or confidence to check
+STRONGEST_TIER_TASKS = {"professional_notes", "validate", "general"}
+DASHBOARD_LABELS = ("Cash Balance", "Revenue", "Expenses", "Net Burn")
+
+CASCADE_ANSWERS = metrics.REGISTRY.counter(
+    "finance_ai_llm_cascade_answers_total",
+    "LLM answers returned, by task and the model tier that produced them",
+    ["task", "model"],
+)
+CASCADE_ESCALATIONS = metrics.REGISTRY.counter(
+    "finance_ai_llm_cascade_escalations_total",
+    "Answers passed on to the next model tier, by the tier that escalated and why",
+    ["task", "model", "reason"],
+)
+CASCADE_TIER_SECONDS = metrics.REGISTRY.histogram(
+    "finance_ai_llm_cascade_tier_duration_seconds",
+    "Time spent in each model tier of a cascade (all verification samples)",
+    ["task", "model"],
+)
+
+def _check_tiers():
+    """Reject tier lists without a model at start-up (a task would otherwise get no answer at all)"""
+    if not LLM_MODEL_TIERS:
+        raise ValueError("LLM_MODEL_TIERS must name at least one model")
+    for name, value in os.environ.items():
+        if name.startswith("LLM_MODEL_TIERS_") and value.strip() and not any(model.strip() for model in value.split(",")):
+            raise ValueError(f"{name} must name at least one model")
+
+_check_tiers()
+
+def model_tiers(task):
+    """Models to ask for task, cheapest first"""
+    override = os.getenv(f"LLM_MODEL_TIERS_{task.upper()}")
+    if override:
+        return [model.strip() for model in override.split(",") if model.strip()]
+    if not LLM_CASCADE_ENABLED or task in STRONGEST_TIER_TASKS:
+        return LLM_MODEL_TIERS[-1:]
+    return list(LLM_MODEL_TIERS)
+
+def confidence_threshold(task):
+    override = os.getenv(f"LLM_CASCADE_CONFIDENCE_{task.upper()}")
+    return float(override) if override else LLM_CASCADE_CONFIDENCE
+
+# --- ANSWER CHECKS: (valid, reported confidence or None) ---
+def _json_object(response):
+    match = re.search(r'\{[\s\S]*\}', response or "")
+    try:
+        result = json.loads(match.group(0)) if match else None
+    except ValueError:
+        return None
+    return result if isinstance(result, dict) else None
+
+def _confidence(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return 0.0
+
+def _check_label(response):
+    return (response or "").strip().lower() in {label.lower() for label in DASHBOARD_LABELS}, None
+
+def _check_final_amount(response):
+    result = _json_object(response)
+    if result is None or isinstance(result.get("final_amount"), bool) or not isinstance(result.get("final_amount"), (int, float, str)):
+        return False, None
+    return True, _confidence(result.get("confidence"))
+
+def _check_document(response):
+    result = _json_object(response)
+    if result is None or not isinstance(result.get("extractedData"), dict) or not isinstance(result.get("category"), str):
+        return False, None
+    confidence = result.get("confidence", result["extractedData"].get("final_amount_confidence"))
+    return True, None if confidence is None else _confidence(confidence)
+
+def _check_statement_page(response):
+    result = _json_object(response)
+    rows = result.get("transactions") if result is not None else None
+    return isinstance(rows, list) and all(isinstance(row, dict) for row in rows), None
+
+ANSWER_CHECKS = {
+    "classify": _check_label,
+    "classify_audit": _check_label,
+    "final_amount": _check_final_amount,
+    "analyze_document": _check_document,
+    "statement_page": _check_statement_page,
+}
+# --- END ANSWER CHECKS ---
+
+# --- VERIFICATION VOTES: samples compared on the fields that matter, not as strings ---
+def _label(response):
+    label = (response or "").strip().strip("\"'`.").lower()
+    return label if label in {label.lower() for label in DASHBOARD_LABELS} else (response or "").strip()
+
+def _final_amount(response):
+    result = _json_object(response)
+    return None if result is None else parse_amount(result.get("final_amount"))
+
+def _document(response):
+    result = _json_object(response)
+    if result is None or not isinstance(result.get("extractedData"), dict):
+        return None, None
+    return str(result.get("category") or "").strip().lower(), parse_amount(result["extractedData"].get("amount"))
+
+def _amounts_agree(amounts):
+    low, high = min(amounts), max(amounts)
+    return high - low <= LLM_VOTE_AMOUNT_TOLERANCE * max(abs(low), abs(high)) + 0.005
+
+def vote(task, responses):
+    """(response, vote) over the verification samples of one tier.
+
+    vote is 'unanimous' or 'majority' (labels, or document categories), 'amounts_agree' or
+    'amounts_differ' (extracted amounts within LLM_VOTE_AMOUNT_TOLERANCE), or 'unverified'
+    when the task's answers cannot be compared.
+    """
+    from collections import Counter
+    if task in ("classify", "classify_audit"):
+        labels = [_label(response) for response in responses]
+        winner, count = Counter(labels).most_common(1)[0]
+        return responses[labels.index(winner)], "unanimous" if count == len(labels) else "majority"
+    if task == "analyze_document":
+        fields = [_document(response) for response in responses]
+        categories = Counter(category for category, _ in fields if category is not None)
+        if not categories:
+            return responses[0], "unverified"
+        winner, count = categories.most_common(1)[0]
+        if count < len(responses):
+            return responses[[category for category, _ in fields].index(winner)], "majority"
+        amounts = [amount for _, amount in fields if amount is not None]
+        if len(amounts) < 2:
+            return responses[0], "unanimous"
+        return (max(responses, key=len), "amounts_agree") if _amounts_agree(amounts) else (responses[0], "amounts_differ")
+    if task == "final_amount":
+        amounts = [amount for amount in map(_final_amount, responses) if amount is not None]
+        if len(amounts) < 2:
+            return responses[0], "unverified"
+        # The most detailed of agreeing answers
+        return (max(responses, key=len), "amounts_agree") if _amounts_agree(amounts) else (responses[0], "amounts_differ")
+    return responses[0], "unverified"
+# --- END VERIFICATION VOTES ---
+
+def escalation_reason(task, response, agreed):
+    """Why a tier's answer should go to the next tier ('disagreement', 'schema', 'low_confidence'), or None to accept it"""
+    if not agreed:
+        return "disagreement"
+    check = ANSWER_CHECKS.get(task)
+    if check is None:
+        return None
+    valid, confidence = check(response)
+    if not valid:
+        return "schema"
+    if confidence is not None and confidence < confidence_threshold(task):
+        return "low_confidence"
+    return None
+
+class CascadeStats:
+    """Per task and tier: answers, escalations by reason and time spent"""
+
+    def __init__(self):
+        self._tiers = {}
+        self._lock = threading.Lock()
+
+    def record(self, task, model, seconds, reason=None):
+        """reason is None when the tier's answer was returned, else why it escalated ('error' when every sample failed)"""
+        CASCADE_TIER_SECONDS.observe(seconds, task=task, model=model)
+        if reason is None:
+            CASCADE_ANSWERS.inc(task=task, model=model)
+        else:
+            CASCADE_ESCALATIONS.inc(task=task, model=model, reason=reason)
+        with self._lock:
+            tier = self._tiers.setdefault((task, model), {"calls": 0, "answered": 0, "escalations": {}, "seconds": 0.0})
+            tier["calls"] += 1
+            tier["seconds"] += seconds
+            if reason is None:
+                tier["answered"] += 1
+            else:
+                tier["escalations"][reason] = tier["escalations"].get(reason, 0) + 1
+
+    def reset(self):
+        with self._lock:
+            self._tiers.clear()
+
+    def stats(self):
+        with self._lock:
+            tasks = {}
+            for (task, model), tier in self._tiers.items():
+                escalated = sum(tier["escalations"].values())
+                tasks.setdefault(task, {"tiers": model_tiers(task), "models": {}})["models"][model] = {
+                    "calls": tier["calls"],
+                    "answered": tier["answered"],
+                    "escalated": escalated,
+                    "escalation_rate": escalated / tier["calls"],
+                    "escalation_reasons": dict(tier["escalations"]),
+                    "mean_latency_seconds": tier["seconds"] / tier["calls"],
+                }
+            return {"enabled": LLM_CASCADE_ENABLED, "confidence_threshold": LLM_CASCADE_CONFIDENCE, "tasks": tasks}
+
+cascade_stats = CascadeStats()
@@ -0,0 +1,456 @@
+# OCR backend registry and router.
+# Every OCR engine (Tesseract, AWS Textract, future ones) implements OCRBackend.
+# Backends run on a shared executor, keep latency/error stats, and the router
+# picks one per document from page count, measured throughput and budgets.
+import os
+import io
+import time
+import shutil
+import asyncio
+import logging
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import metrics
+import tracing
+from ocr_preprocess import OCR_PREPROCESS, OCR_LANGUAGES, pdf_page_dpi, usable_languages
+from ocr_workers import ocr_worker_pool, recognize_image, resolve_engine, tesseract_binary_available, tesserocr_available
+
+# pdfplumber, pdf2image, pytesseract, PIL, numpy and boto3 are imported on first use
+# to keep application start-up fast (see warm_up()).
+
+OCR_MAX_WORKERS = int(os.getenv("OCR_MAX_WORKERS", str(os.cpu_count() or 4)))
+OCR_EXECUTOR = ThreadPoolExecutor(max_workers=OCR_MAX_WORKERS, thread_name_prefix="ocr")
+
+# Pages progressive OCR reads ahead while the caller checks the pages read so far
+OCR_PROGRESSIVE_PREFETCH = int(os.getenv("OCR_PROGRESSIVE_PREFETCH", "1"))
+
+# Page segmentation mode 6: a single uniform block of text
+TESSERACT_PSM = 6
+# Used when the PDF page size cannot be read; otherwise the DPI follows the page size
+PDF_OCR_DPI = 150
+
+LANGUAGE_SELECTIONS = metrics.REGISTRY.counter(
+    "finance_ai_ocr_language_total",
+    "Tesseract language selections for OCR'd documents",
+    ["languages"],
+)
+
+def get_poppler_path():
+    poppler_path = os.getenv("POPPLER_PATH")
+    if poppler_path and os.path.isdir(poppler_path):
+        return poppler_path
+    if shutil.which("pdftoppm") is not None:
+        return None
+    raise RuntimeError(
+        "Poppler is required for PDF processing. "
+        "Install it and add to PATH, or set POPPLER_PATH in your .env file. "
+        "See: https://github.com/oschwartz10612/poppler-windows"
+    )
+
+def warm_up():
+    """Import the OCR stack ahead of the first request"""
+    import pdfplumber
+    import pytesseract
+    import pdf2image
+    import PIL.Image
+    import numpy
+    if os.getenv("AWS_ACCESS_KEY_ID") or os.getenv("TEXTRACT_STUB") == "1":
+        get_textract_client()
+    tesseract = ocr_registry.get("tesseract")
+    if tesseract.is_available() and tesseract.worker_pool is not None:
+        languages = "eng" if tesseract.languages == "auto" else usable_languages(tesseract.languages)
+        tesseract.worker_pool.warm_up(languages, TESSERACT_PSM, tesseract.engine)
+
+def rasterize_pdf(pdf_path, dpi=None):
+    """Render every page of a PDF to a PIL image (DPI chosen from the page size unless given)"""
+    from pdf2image import convert_from_path
+    dpi = dpi or pdf_page_dpi(pdf_path, PDF_OCR_DPI)
+    with tracing.span("convert_from_path", dpi=dpi):
+        return convert_from_path(pdf_path, dpi=dpi, poppler_path=get_poppler_path())
+
+def rasterize_pdf_page(pdf_path, index, dpi):
+    """Render one PDF page (0-based index) to a PIL image"""
+    from pdf2image import convert_from_path
+    with tracing.span("convert_from_path", dpi=dpi, page=index + 1):
+        return convert_from_path(pdf_path, dpi=dpi, first_page=index + 1, last_page=index + 1, poppler_path=get_poppler_path())[0]
+
+def page_priority(page_count):
+    """Page indexes in the order progressive OCR reads them: last page, first page, then the rest"""
+    order = [page_count - 1, 0] + list(range(1, page_count - 1))
+    return list(dict.fromkeys(index for index in order if index >= 0))
+
+def count_pages(file_path, extension):
+    """Cheap page count used for routing (images are one page)"""
+    if extension != ".pdf":
+        return 1
+    import pdfplumber
+    try:
+        with pdfplumber.open(file_path) as pdf:
+            return len(pdf.pages)
+    except Exception as e:
+        logging.warning(f"Could not count PDF pages: {e}")
+        return 1
+
+async def count_pages_async(file_path, extension):
+    """count_pages() off the event loop (opening a large PDF blocks for a while)"""
+    if extension != ".pdf":
+        return 1
+    return await asyncio.get_running_loop().run_in_executor(None, count_pages, file_path, extension)
+
+class BackendStats:
+    """Thread-safe latency, throughput and error counters for one backend"""
+
+    EWMA_ALPHA = 0.2
+
+    def __init__(self, prior_seconds_per_page):
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.errors = 0
+        self.pages = 0
+        self.total_seconds = 0.0
+        self.seconds_per_page = prior_seconds_per_page
+        self.error_rate = 0.0
+        self.last_error = None
+
+    def record(self, pages, seconds, ok, error=None):
+        with self._lock:
+            self.calls += 1
+            self.total_seconds += seconds
+            failed = 0.0 if ok else 1.0
+            self.error_rate += self.EWMA_ALPHA * (failed - self.error_rate)
+            if ok:
+                self.pages += pages
+                per_page = seconds / max(pages, 1)
+                self.seconds_per_page += self.EWMA_ALPHA * (per_page - self.seconds_per_page)
+            else:
+                self.errors += 1
+                self.last_error = str(error) if error else None
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "calls": self.calls,
+                "errors": self.errors,
+                "pages": self.pages,
+                "total_seconds": round(self.total_seconds, 4),
+                "seconds_per_page": round(self.seconds_per_page, 4),
+                "pages_per_second": round(1.0 / self.seconds_per_page, 4) if self.seconds_per_page else None,
+                "error_rate": round(self.error_rate, 4),
+                "last_error": self.last_error,
+            }
+
+class OCRBackend:
+    """Common interface for OCR engines; subclasses implement recognize_file"""
+
+    name = "base"
+    cost_per_page = 0.0
+    prior_seconds_per_page = 1.0
+    # How many pages of one document the backend processes at the same time
+    page_concurrency = 1
+    # Whether the backend implements recognize_progressive()
+    supports_progressive = False
+
+    def __init__(self):
+        self.stats = BackendStats(self.prior_seconds_per_page)
+
+    def is_available(self) -> bool:
+        return True
+
+    def recognize_file(self, file_path: str, extension: str) -> str:
+        """Blocking OCR of a whole file; runs on OCR_EXECUTOR"""
+        raise NotImplementedError
+
+    def estimate(self, page_count: int):
+        """Estimated (seconds, cost) to OCR a document of page_count pages"""
+        waves = -(-page_count // max(1, min(self.page_concurrency, page_count)))
+        return waves * self.stats.seconds_per_page, page_count * self.cost_per_page
+
+    async def recognize(self, file_path: str, extension: str, page_count: int = 1) -> str:
+        loop = asyncio.get_running_loop()
+        started = time.perf_counter()
+        try:
+            with tracing.span("ocr_backend", backend=self.name, pages=page_count):
+                text = await loop.run_in_executor(OCR_EXECUTOR, tracing.run_in_context(self.recognize_file, file_path, extension))
+        except Exception as e:
+            self.stats.record(page_count, time.perf_counter() - started, ok=False, error=e)
+            raise
+        self.stats.record(page_count, time.perf_counter() - started, ok=True)
+        return text
+
+class TesseractBackend(OCRBackend):
+    name = "tesseract"
+    cost_per_page = 0.0
+    prior_seconds_per_page = 1.5
+    supports_progressive = True
+
+    def __init__(self):
+        super().__init__()
+        self.preprocess = OCR_PREPROCESS
+        self.languages = OCR_LANGUAGES
+        # None lets rasterize_pdf choose the DPI from the page size
+        self.dpi = None
+        self.engine = resolve_engine()
+        # None recognises pages on the calling OCR thread instead of the worker processes
+        self.worker_pool = ocr_worker_pool if ocr_worker_pool.enabled else None
+        if self.worker_pool is None and self.engine == "tesserocr" and tesserocr_available():
+            # tesserocr installs signal handlers on import, which only works on the main thread
+            import tesserocr
+
+    def is_available(self) -> bool:
+        # Both probes initialise the engine once and cache the answer, so missing language data counts as unavailable
+        if self.engine == "tesserocr":
+            return tesserocr_available()
+        return tesseract_binary_available()
+
+    def _pages(self, images, languages):
+        """(text, languages) per page image; on the worker pool the pages run concurrently"""
+        if self.worker_pool is not None:
+            futures = [self.worker_pool.submit(image, languages, self.preprocess, TESSERACT_PSM, self.engine) for image in images]
+            outcomes = [future.result() for future in futures]
+        else:
+            outcomes = [recognize_image(image, languages, self.preprocess, TESSERACT_PSM, self.engine) for image in images]
+        for _, _, seconds in outcomes:
+            metrics.OCR_PAGE_SECONDS.observe(seconds, backend=self.name)
+        return [(text, picked) for text, picked, _ in outcomes]
+
+    def recognize_images(self, images):
+        """OCR page images in order; with OCR_LANGUAGES=auto page one picks the language for the rest"""
+        images = list(images)
+        if not images:
+            return []
+        languages = self.languages if self.languages == "auto" else usable_languages(self.languages)
+        with tracing.span("tesseract_page", languages=languages, engine=self.engine):
+            first, languages = self._pages(images[:1], languages)[0]
+        if self.languages == "auto":
+            LANGUAGE_SELECTIONS.inc(languages=languages)
+        texts = [first]
+        if len(images) > 1:
+            with tracing.span("tesseract_pages", pages=len(images) - 1, languages=languages, engine=self.engine):
+                texts += [text for text, _ in self._pages(images[1:], languages)]
+        return texts
+
+    def recognize_file(self, file_path: str, extension: str) -> str:
+        if extension != ".pdf":
+            from PIL import Image
+            return self.recognize_images([Image.open(file_path)])[0]
+        texts = self.recognize_images(rasterize_pdf(file_path, self.dpi))
+        return "\n".join(texts).strip()
+
+    def recognize_page(self, pdf_path, index, dpi, languages):
+        """Rasterise and OCR one PDF page; returns (text, languages)"""
+        started = time.perf_counter()
+        try:
+            result = self._pages([rasterize_pdf_page(pdf_path, index, dpi)], languages)[0]
+        except Exception as e:
+            self.stats.record(1, time.perf_counter() - started, ok=False, error=e)
+            raise
+        self.stats.record(1, time.perf_counter() - started, ok=True)
+        return result
+
+    async def recognize_progressive(self, pdf_path, page_count, accept):
+        """OCR a PDF in page_priority() order until `await accept(text)` returns True.
+
+        text holds the pages read so far in document order; up to OCR_PROGRESSIVE_PREFETCH
+        further pages are OCR'd while accept() runs. Returns (text, pages read).
+        """
+        loop = asyncio.get_running_loop()
+        dpi = self.dpi or await loop.run_in_executor(OCR_EXECUTOR, pdf_page_dpi, pdf_path, PDF_OCR_DPI)
+        languages = self.languages if self.languages == "auto" else usable_languages(self.languages)
+        waiting = deque(page_priority(page_count))
+        in_flight = deque()
+        texts = {}
+
+        def read_ahead(limit):
+            while waiting and len(in_flight) < limit:
+                index = waiting.popleft()
+                in_flight.append((index, loop.run_in_executor(
+                    OCR_EXECUTOR, tracing.run_in_context(self.recognize_page, pdf_path, index, dpi, languages))))
+
+        with tracing.span("ocr_progressive", backend=self.name, pages=page_count):
+            # The first page read picks the language for the rest, as in recognize_images()
+            read_ahead(1)
+            try:
+                while in_flight:
+                    index, future = in_flight.popleft()
+                    texts[index], picked = await future
+                    if len(texts) == 1 and self.languages == "auto":
+                        languages = picked
+                        LANGUAGE_SELECTIONS.inc(languages=languages)
+                    read_ahead(1 + OCR_PROGRESSIVE_PREFETCH)
+                    if await accept("\n".join(texts[page] for page in sorted(texts)).strip()):
+                        break
+            finally:
+                # Pages already being OCR'd finish in the background; their results are dropped
+                for _, future in in_flight:
+                    future.cancel()
+        return "\n".join(texts[page] for page in sorted(texts)).strip(), len(texts)
+
+class StubTextractClient:
+    """Offline stand-in for the boto3 Textract client (TEXTRACT_STUB=1)"""
+
+    def __init__(self, latency_seconds=None, text=None):
+        if latency_seconds is None:
+            latency_seconds = float(os.getenv("TEXTRACT_STUB_LATENCY_MS", "200")) / 1000.0
+        self.latency_seconds = latency_seconds
+        self.text = text if text is not None else os.getenv("TEXTRACT_STUB_TEXT", "STUB TEXTRACT LINE\nTotal: 0.00")
+        self.calls = 0
+
+    def detect_document_text(self, Document):
+        self.calls += 1
+        time.sleep(self.latency_seconds)
+        payload = Document.get("Bytes", b"")
+        blocks = [{"BlockType": "PAGE"}]
+        for line in self.text.splitlines():
+            blocks.append({"BlockType": "LINE", "Text": line})
+        blocks.append({"BlockType": "LINE", "Text": f"bytes={len(payload)}"})
+        return {"Blocks": blocks}
+
+_textract_client = None
+_textract_client_lock = threading.Lock()
+
+def get_textract_client():
+    """Shared Textract client (boto3 clients are thread-safe and pool connections)"""
+    global _textract_client
+    if _textract_client is not None:
+        return _textract_client
+    with _textract_client_lock:
+        if _textract_client is not None:
+            return _textract_client
+        if os.getenv("TEXTRACT_STUB") == "1":
+            _textract_client = StubTextractClient()
+            return _textract_client
+        aws_key = os.getenv("AWS_ACCESS_KEY_ID")
+        aws_secret = os.getenv("AWS_SECRET_ACCESS_KEY")
+        region = os.getenv("AWS_REGION") or "ap-south-1"
+        if aws_key and aws_secret:
+            import boto3
+            from botocore.config import Config
+            _textract_client = boto3.client('textract',
+                aws_access_key_id=aws_key,
+                aws_secret_access_key=aws_secret,
+                region_name=region,
+                config=Config(max_pool_connections=TextractBackend.page_concurrency, retries={"mode": "adaptive"}),
+            )
+        return _textract_client
+
+class TextractBackend(OCRBackend):
+    name = "textract"
+    cost_per_page = float(os.getenv("TEXTRACT_COST_PER_PAGE", "0.0015"))
+    prior_seconds_per_page = 1.0
+    page_concurrency = int(os.getenv("TEXTRACT_PAGE_CONCURRENCY", "8"))
+
+    def __init__(self):
+        super().__init__()
+        # Separate pool for per-page API calls so they never wait on OCR_EXECUTOR
+        self._page_executor = ThreadPoolExecutor(max_workers=self.page_concurrency, thread_name_prefix="textract")
+
+    def is_available(self) -> bool:
+        return get_textract_client() is not None
+
+    def detect_bytes(self, payload: bytes) -> str:
+        with metrics.OCR_PAGE_SECONDS.time(backend=self.name), tracing.span("textract_page"):
+            response = get_textract_client().detect_document_text(Document={'Bytes': payload})
+        blocks = response.get("Blocks", [])
+        return "\n".join(block.get("Text", "") for block in blocks if block["BlockType"] == "LINE")
+
+    def recognize_file(self, file_path: str, extension: str) -> str:
+        if extension != ".pdf":
+            with open(file_path, 'rb') as file:
+                return self.detect_bytes(file.read())
+        # The synchronous Textract API accepts one page per call, so send pages in parallel
+        pages = []
+        for image in rasterize_pdf(file_path):
+            buffer = io.BytesIO()
+            image.save(buffer, format="PNG")
+            pages.append(buffer.getvalue())
+        futures = [self._page_executor.submit(tracing.run_in_context(self.detect_bytes, page)) for page in pages]
+        return "\n".join(future.result() for future in futures).strip()
+
+class OCRRegistry:
+    """Named collection of OCR backends"""
+
+    def __init__(self):
+        self._backends = {}
+
+    def register(self, backend: OCRBackend):
+        self._backends[backend.name] = backend
+        return backend
+
+    def get(self, name: str) -> OCRBackend:
+        return self._backends[name]
+
+    def all(self):
+        return list(self._backends.values())
+
+    def available(self):
+        return [backend for backend in self._backends.values() if backend.is_available()]
+
+    def stats(self):
+        return {
+            backend.name: {**backend.stats.snapshot(), "available": backend.is_available(), "cost_per_page": backend.cost_per_page}
+            for backend in self._backends.values()
+        }
+
+class OCRRouter:
+    """Pick the OCR backend for a document and fall back through the rest on failure"""
+
+    def __init__(self, registry: OCRRegistry, latency_budget_seconds=None, max_cost_per_document=None, max_error_rate=None):
+        self.registry = registry
+        self.latency_budget_seconds = latency_budget_seconds if latency_budget_seconds is not None else float(os.getenv("OCR_LATENCY_BUDGET_S", "20"))
+        self.max_cost_per_document = max_cost_per_document if max_cost_per_document is not None else float(os.getenv("OCR_MAX_COST_PER_DOC", "0.10"))
+        self.max_error_rate = max_error_rate if max_error_rate is not None else float(os.getenv("OCR_MAX_ERROR_RATE", "0.5"))
+
+    def rank(self, page_count: int):
+        """Backends in the order they should be tried for a document of page_count pages"""
+        candidates = []
+        for backend in self.registry.available():
+            seconds, cost = backend.estimate(page_count)
+            candidates.append((backend, seconds, cost))
+        if not candidates:
+            return []
+        healthy = [c for c in candidates if c[0].stats.error_rate <= self.max_error_rate] or candidates
+        affordable = [c for c in healthy if c[2] <= self.max_cost_per_document] or healthy
+        within_budget = [c for c in affordable if c[1] <= self.latency_budget_seconds]
+        if within_budget:
+            # Cheapest backend that still meets the latency budget
+            best = min(within_budget, key=lambda c: (c[2], c[1]))
+        else:
+            best = min(affordable, key=lambda c: c[1])
+        rest = sorted((c for c in candidates if c[0] is not best[0]), key=lambda c: c[1])
+        return [best[0]] + [c[0] for c in rest]
+
+    async def recognize(self, file_path: str, extension: str) -> str:
+        page_count = await count_pages_async(file_path, extension)
+        last_error = None
+        for backend in self.rank(page_count):
+            try:
+                text = await backend.recognize(file_path, extension, page_count)
+            except Exception as e:
+                logging.warning(f"OCR backend {backend.name} failed: {e}")
+                last_error = e
+                continue
+            if text and text.strip():
+                return text
+            logging.warning(f"OCR backend {backend.name} returned no text, trying next backend.")
+        if last_error:
+            raise last_error
+        return ""
+
+ocr_registry = OCRRegistry()
+ocr_registry.register(TesseractBackend())
+ocr_registry.register(TextractBackend())
+ocr_router = OCRRouter(ocr_registry)
+
+def _backend_gauge(field):
+    return lambda: {(name,): stats[field] or 0 for name, stats in ocr_registry.stats().items()}
+
+metrics.REGISTRY.gauge("finance_ai_ocr_queue_depth", "OCR jobs waiting for an executor thread",
+                       callback=lambda: OCR_EXECUTOR._work_queue.qsize())
+metrics.REGISTRY.gauge("finance_ai_ocr_backend_seconds_per_page", "Measured OCR seconds per page (EWMA)",
+                       ["backend"], callback=_backend_gauge("seconds_per_page"))
+metrics.REGISTRY.gauge("finance_ai_ocr_backend_error_rate", "Recent OCR error rate (EWMA)",
+                       ["backend"], callback=_backend_gauge("error_rate"))
+metrics.REGISTRY.gauge("finance_ai_ocr_backend_pages", "Pages processed per OCR backend",
+                       ["backend"], callback=_backend_gauge("pages"))
@@ -0,0 +1,196 @@
+# Image preprocessing for Tesseract OCR.
+# Pages are converted to grayscale, deskewed, cropped to the inked area, rescaled
+# so text lines land at a target pixel height and binarised (Otsu) before
+# recognition. PDFs are rasterised at a DPI chosen from the page size, and a
+# cheap English first pass picks the Tesseract language(s) for the document.
+import os
+import re
+import logging
+import importlib.util
+from functools import lru_cache
+
+# numpy and PIL are imported on first use (see ocr_backends.warm_up())
+
+OCR_PREPROCESS = os.getenv("OCR_PREPROCESS", "1") == "1"
+# "auto" detects per document; any fixed value (e.g. "eng+nld") is passed to tesseract as-is
+OCR_LANGUAGES = os.getenv("OCR_LANGUAGES", "auto")
+OCR_TARGET_LINE_PX = int(os.getenv("OCR_TARGET_LINE_PX", "24"))
+OCR_MAX_SIDE_PX = int(os.getenv("OCR_MAX_SIDE_PX", "4000"))
+OCR_MIN_DPI = int(os.getenv("OCR_MIN_DPI", "100"))
+OCR_MAX_DPI = int(os.getenv("OCR_MAX_DPI", "300"))
+# Pixel budget per page: an A4 page at 200 dpi
+OCR_TARGET_MEGAPIXELS = float(os.getenv("OCR_TARGET_MEGAPIXELS", "3.9"))
+OCR_MAX_SKEW_DEGREES = float(os.getenv("OCR_MAX_SKEW_DEGREES", "5"))
+# Directory holding the *.traineddata files (tesseract's own default when unset)
+TESSDATA_PREFIX = os.getenv("TESSDATA_PREFIX")
+
+# --- DPI SELECTION ---
+def choose_dpi(width_points, height_points):
+    """Rasterisation DPI for a page of the given size (PDF points) within the pixel budget"""
+    area_square_inches = (width_points / 72.0) * (height_points / 72.0)
+    if area_square_inches <= 0:
+        return OCR_MAX_DPI
+    dpi = (OCR_TARGET_MEGAPIXELS * 1e6 / area_square_inches) ** 0.5
+    return int(max(OCR_MIN_DPI, min(OCR_MAX_DPI, dpi)))
+
+def pdf_page_dpi(pdf_path, default=150):
+    """DPI for a whole PDF, chosen from its largest page (default if sizes are unknown)"""
+    import pdfplumber
+    try:
+        with pdfplumber.open(pdf_path) as pdf:
+            sizes = [(float(page.width), float(page.height)) for page in pdf.pages]
+    except Exception as e:
+        logging.warning(f"Could not read PDF page sizes: {e}")
+        return default
+    if not sizes:
+        return default
+    width, height = max(sizes, key=lambda size: size[0] * size[1])
+    return choose_dpi(width, height)
+# --- END DPI SELECTION ---
+
+# --- IMAGE PIPELINE ---
+def otsu_threshold(pixels):
+    """Otsu's threshold for a uint8 grayscale array"""
+    import numpy as np
+    histogram = np.bincount(pixels.ravel(), minlength=256).astype(np.float64)
+    total = histogram.sum()
+    if total == 0:
+        return 128
+    levels = np.arange(256)
+    weight_background = np.cumsum(histogram)
+    weight_foreground = total - weight_background
+    cumulative_mean = np.cumsum(histogram * levels)
+    mean_background = cumulative_mean / np.maximum(weight_background, 1)
+    mean_foreground = (cumulative_mean[-1] - cumulative_mean) / np.maximum(weight_foreground, 1)
+    between = weight_background * weight_foreground * (mean_background - mean_foreground) ** 2
+    return int(np.argmax(between))
+
+def binarize(gray):
+    """Boolean ink mask (True = dark pixel) of a grayscale PIL image.
+
+    A pixel is ink when it is darker than both the global Otsu threshold and its
+    neighbourhood mean, so grey backgrounds and uneven lighting in photos are not ink.
+    """
+    import numpy as np
+    from PIL import ImageFilter
+    pixels = np.asarray(gray, dtype=np.uint8)
+    radius = max(8, min(gray.size) // 60)
+    local_mean = np.asarray(gray.filter(ImageFilter.BoxBlur(radius)), dtype=np.int16)
+    return (pixels <= otsu_threshold(pixels)) & (pixels.astype(np.int16) < local_mean - 10)
+
+def estimate_line_height(ink):
+    """Median height in pixels of the text lines in an ink mask (None when no text found)"""
+    import numpy as np
+    rows = ink.mean(axis=1) > 0.002
+    if not rows.any():
+        return None
+    # Lengths of consecutive inked row runs
+    edges = np.diff(np.concatenate(([0], rows.astype(np.int8), [0])))
+    heights = np.flatnonzero(edges == -1) - np.flatnonzero(edges == 1)
+    heights = heights[heights >= 4]
+    if not len(heights):
+        return None
+    return float(np.median(heights))
+
+def estimate_skew(ink, max_degrees=OCR_MAX_SKEW_DEGREES, step=0.5):
+    """Rotation angle (degrees) that maximises the variance of the row projection profile"""
+    import numpy as np
+    from PIL import Image
+    mask = Image.fromarray((ink * 255).astype(np.uint8))
+    # A small copy is enough to measure the angle
+    mask.thumbnail((800, 800))
+    best_angle, best_score = 0.0, -1.0
+    for angle in np.arange(-max_degrees, max_degrees + step / 2, step):
+        profile = np.asarray(mask.rotate(float(angle), resample=Image.NEAREST, fillcolor=0)).sum(axis=1, dtype=np.float64)
+        score = float(np.var(profile))
+        if score > best_score:
+            best_angle, best_score = float(angle), score
+    return best_angle
+
+def crop_margins(ink, padding=10):
+    """(left, top, right, bottom) box around the inked area plus padding, or None if blank"""
+    import numpy as np
+    rows = np.flatnonzero(ink.any(axis=1))
+    columns = np.flatnonzero(ink.any(axis=0))
+    if not len(rows) or not len(columns):
+        return None
+    height, width = ink.shape
+    return (max(0, columns[0] - padding), max(0, rows[0] - padding),
+            min(width, columns[-1] + 1 + padding), min(height, rows[-1] + 1 + padding))
+
+def preprocess_image(image):
+    """Grayscale, deskew, crop, rescale to OCR_TARGET_LINE_PX text lines and binarise a page image"""
+    import numpy as np
+    from PIL import Image, ImageOps
+    gray = ImageOps.exif_transpose(image).convert("L")
+    # Bound the work on full-resolution phone photos before measuring anything
+    if max(gray.size) > OCR_MAX_SIDE_PX:
+        gray.thumbnail((OCR_MAX_SIDE_PX, OCR_MAX_SIDE_PX), Image.LANCZOS)
+
+    ink = binarize(gray)
+    angle = estimate_skew(ink)
+    if angle:
+        background = int(np.median(np.asarray(gray)))
+        gray = gray.rotate(angle, resample=Image.BICUBIC, expand=True, fillcolor=background)
+        ink = binarize(gray)
+
+    box = crop_margins(ink)
+    if box is not None:
+        gray = gray.crop(box)
+        ink = ink[box[1]:box[3], box[0]:box[2]]
+
+    # Line heights are only meaningful once the lines are horizontal
+    line_height = estimate_line_height(ink)
+    if line_height:
+        scale = max(0.25, min(3.0, OCR_TARGET_LINE_PX / line_height))
+        if abs(scale - 1.0) > 0.15:
+            size = (max(1, round(gray.width * scale)), max(1, round(gray.height * scale)))
+            ink = binarize(gray.resize(size, Image.LANCZOS))
+    return Image.fromarray(np.where(ink, 0, 255).astype(np.uint8))
+# --- END IMAGE PIPELINE ---
+
+# --- LANGUAGE SELECTION ---
+# Frequent Dutch words and invoice vocabulary that rarely occur in English text
+DUTCH_MARKERS = {
+    "de", "het", "een", "van", "en", "voor", "met", "niet", "zijn", "bij", "op", "naar", "uw", "wij",
+    "factuur", "factuurnummer", "factuurdatum", "totaal", "bedrag", "btw", "datum", "omschrijving",
+    "aantal", "prijs", "betaling", "vervaldatum", "klant", "leverancier", "rekening", "incl", "excl",
+}
+ENGLISH_MARKERS = {
+    "the", "and", "of", "to", "for", "with", "is", "on", "your", "we", "from",
+    "invoice", "total", "amount", "date", "due", "description", "quantity", "price", "payment", "bill",
+}
+_WORD = re.compile(r"[a-zà-ÿ]+")
+
+def detect_language(text):
+    """'eng', 'nld' or 'eng+nld' from marker-word counts in a first-pass OCR result"""
+    words = _WORD.findall((text or "").lower())
+    dutch = sum(1 for word in words if word in DUTCH_MARKERS)
+    english = sum(1 for word in words if word in ENGLISH_MARKERS)
+    if dutch == 0:
+        return "eng"
+    if english == 0 or dutch >= 3 * english:
+        return "nld"
+    if dutch * 4 < english:
+        return "eng"
+    return "eng+nld"
+
+@lru_cache(maxsize=1)
+def installed_languages():
+    try:
+        if importlib.util.find_spec("tesserocr") is not None:
+            import tesserocr
+            _, languages = tesserocr.get_languages(TESSDATA_PREFIX) if TESSDATA_PREFIX else tesserocr.get_languages()
+            return frozenset(languages)
+        import pytesseract
+        return frozenset(pytesseract.get_languages(config=""))
+    except Exception as e:
+        logging.warning(f"Could not list tesseract languages: {e}")
+        return frozenset({"eng"})
+
+def usable_languages(languages):
+    """Drop traineddata that is not installed (falls back to eng)"""
+    available = installed_languages()
+    kept = [language for language in languages.split("+") if language in available]
+    return "+".join(kept) or "eng"
+# --- END LANGUAGE SELECTION ---
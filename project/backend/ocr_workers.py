@@ -0,0 +1,168 @@
+# Long-lived Tesseract worker processes.
+# Each worker loads the language models once through tesserocr (in-process
+# libtesseract bindings) and receives page images as raw in-memory buffers, so a
+# page costs its recognition time instead of a tesseract process start, a temp
+# file and a model load. Workers are replaced after OCR_WORKER_MAX_PAGES pages to
+# bound memory. Without tesserocr the workers fall back to pytesseract.
+import os
+import time
+import shutil
+import logging
+import functools
+import threading
+import importlib.util
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+from ocr_preprocess import TESSDATA_PREFIX, preprocess_image, detect_language, usable_languages
+
+OCR_WORKER_PROCESSES = int(os.getenv("OCR_WORKER_PROCESSES", str(os.cpu_count() or 2)))
+OCR_WORKER_MAX_PAGES = int(os.getenv("OCR_WORKER_MAX_PAGES", "200"))
+# "tesserocr", "pytesseract" or "auto" (tesserocr when installed)
+OCR_ENGINE = os.getenv("OCR_ENGINE", "auto")
+
+@functools.lru_cache(maxsize=None)
+def tesserocr_available():
+    """tesserocr is installed and its engine initialises with the installed language data (probed once)"""
+    if importlib.util.find_spec("tesserocr") is None:
+        return False
+    try:
+        import tesserocr
+        _, languages = tesserocr.get_languages(TESSDATA_PREFIX) if TESSDATA_PREFIX else tesserocr.get_languages()
+        if not languages:
+            logging.warning("tesserocr is installed but finds no language data")
+            return False
+        options = {"lang": "eng" if "eng" in languages else languages[0]}
+        if TESSDATA_PREFIX:
+            options["path"] = TESSDATA_PREFIX
+        with tesserocr.PyTessBaseAPI(**options):
+            return True
+    except Exception as e:
+        logging.warning(f"tesserocr is installed but does not initialise: {e}")
+        return False
+
+@functools.lru_cache(maxsize=None)
+def tesseract_binary_available():
+    """The tesseract binary runs and lists at least one language (probed once)"""
+    if shutil.which("tesseract") is None:
+        return False
+    try:
+        import pytesseract
+        return bool([language for language in pytesseract.get_languages() if language != "osd"])
+    except Exception as e:
+        logging.warning(f"tesseract is installed but does not run: {e}")
+        return False
+
+def resolve_engine(engine=OCR_ENGINE):
+    if engine == "auto":
+        return "tesserocr" if tesserocr_available() else "pytesseract"
+    return engine
+
+# --- PAGE RECOGNITION (worker processes, or OCR threads when the pool is disabled) ---
+# Initialised tesserocr engines per (languages, psm); they are not thread-safe, so one set per thread
+_engines = threading.local()
+
+def _engine(languages, psm):
+    engines = _engines.__dict__.setdefault("by_key", {})
+    api = engines.get((languages, psm))
+    if api is None:
+        import tesserocr
+        options = {"lang": languages, "psm": psm}
+        if TESSDATA_PREFIX:
+            options["path"] = TESSDATA_PREFIX
+        api = engines[(languages, psm)] = tesserocr.PyTessBaseAPI(**options)
+    return api
+
+def _recognize(image, languages, psm, engine):
+    if engine == "tesserocr":
+        api = _engine(languages, psm)
+        api.SetImage(image)
+        return api.GetUTF8Text()
+    import pytesseract
+    return pytesseract.image_to_string(image, config=f"--psm {psm} -l {languages}")
+
+def recognize_image(image, languages, preprocess, psm, engine):
+    """OCR one page image; returns (text, languages, seconds).
+
+    languages="auto" reads the page in English first and picks the language(s) from that text.
+    """
+    started = time.perf_counter()
+    if preprocess:
+        image = preprocess_image(image)
+    if languages == "auto":
+        text = _recognize(image, "eng", psm, engine)
+        languages = usable_languages(detect_language(text))
+        if languages != "eng":
+            text = _recognize(image, languages, psm, engine)
+    else:
+        text = _recognize(image, languages, psm, engine)
+    return text, languages, time.perf_counter() - started
+
+def recognize_page(mode, size, data, languages, preprocess, psm, engine):
+    """recognize_image for a page sent to a worker process as raw pixel bytes"""
+    from PIL import Image
+    return recognize_image(Image.frombytes(mode, size, data), languages, preprocess, psm, engine)
+# --- END PAGE RECOGNITION ---
+
+class OCRWorkerPool:
+    """Process pool of Tesseract workers, started on first use"""
+
+    def __init__(self, processes=OCR_WORKER_PROCESSES, max_pages_per_worker=OCR_WORKER_MAX_PAGES):
+        self.processes = processes
+        self.max_pages_per_worker = max_pages_per_worker
+        self.pages = 0
+        self._executor = None
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return self.processes > 0
+
+    def executor(self):
+        with self._lock:
+            if self._executor is None:
+                # spawn: forking a process that already runs the event loop and thread pools is unsafe,
+                # and max_tasks_per_child (worker recycling) requires it
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.processes,
+                    mp_context=multiprocessing.get_context("spawn"),
+                    max_tasks_per_child=self.max_pages_per_worker or None,
+                )
+            return self._executor
+
+    def submit(self, image, languages, preprocess, psm, engine):
+        """Future resolving to (text, languages, seconds) for one page image"""
+        if image.mode not in ("1", "L", "RGB"):
+            image = image.convert("RGB")
+        with self._lock:
+            self.pages += 1
+        return self.executor().submit(recognize_page, image.mode, image.size, image.tobytes(), languages, preprocess, psm, engine)
+
+    def warm_up(self, languages="eng", psm=6, engine=None):
+        """Start the workers and load the models ahead of the first document"""
+        from PIL import Image
+        blank = Image.new("L", (64, 64), 255)
+        engine = engine or resolve_engine()
+        futures = [self.submit(blank, languages, False, psm, engine) for _ in range(self.processes)]
+        for future in futures:
+            try:
+                future.result()
+            except Exception as e:
+                logging.warning(f"OCR worker warm-up failed: {e}")
+
+    def shutdown(self, wait=False):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=wait, cancel_futures=True)
+
+    def stats(self):
+        return {
+            "processes": self.processes,
+            "max_pages_per_worker": self.max_pages_per_worker,
+            "engine": resolve_engine(),
+            "started": self._executor is not None,
+            "pages": self.pages,
+        }
+
+ocr_worker_pool = OCRWorkerPool()
@@ -0,0 +1,316 @@
+# Posting rules compiled from ACCOUNTING_MAP.
+# compile_posting_rules() turns the nested map into an indexed rule table once at
+# start-up: category aliases ('invoices' -> 'sales-invoice'), field synonyms
+# ('vendor' -> 'Supplier Name') and a table of balanced journal legs per category.
+# PostingRules.post() then turns any number of extracted documents or
+# transactions into double-entry journal lines in one vectorised pandas pass.
+# Bank rows follow their type; inventory and restock credits post as a sale and
+# as goods received on account (CREDIT_POSTINGS).
+import re
+import logging
+
+from amounts import parse_amounts
+
+# pandas and numpy are imported on first use to keep application start-up fast
+
+# Categories returned by the document analyzer (and used by transactions) -> ACCOUNTING_MAP keys
+CATEGORY_ALIASES = {
+    'invoices': 'sales-invoice',
+    'invoice': 'sales-invoice',
+    'sales-invoices': 'sales-invoice',
+    'bills': 'purchase-invoice',
+    'bill': 'purchase-invoice',
+    'purchase-invoices': 'purchase-invoice',
+    'bank-transactions': 'bank-statement',
+    'bank-transaction': 'bank-statement',
+    'bank-statements': 'bank-statement',
+    'item-restocks': 'inventory',
+    'receipt': 'receipts',
+    'payment': 'payments',
+    'fixed-assets': 'fixed-asset-purchase',
+    # General entries move cash in the direction of their type, as in build_financial_statements
+    'manual-journals': 'bank-statement',
+    'general-ledgers': 'bank-statement',
+    'general-entries': 'bank-statement',
+}
+
+# Extracted-data field names -> field roles resolved per category
+FIELD_SYNONYMS = {
+    'amount': 'amount', 'total': 'amount', 'total_amount': 'amount', 'final_amount': 'amount',
+    'grand_total': 'amount', 'net_amount': 'amount',
+    'vendor': 'party', 'supplier': 'party', 'customer': 'party', 'vendor_customer': 'party',
+    'vendor_name': 'party', 'supplier_name': 'party', 'customer_name': 'party', 'payee': 'party', 'payer': 'party',
+    'tax': 'tax', 'vat': 'tax', 'gst': 'tax', 'tax_amount': 'tax', 'vat_amount': 'tax', 'gst_amount': 'tax', 'sales_tax': 'tax',
+    'discount': 'discount', 'discount_amount': 'discount',
+    'freight': 'freight', 'shipping': 'freight', 'delivery': 'freight',
+}
+ROLE_KEYWORDS = {
+    'party': ('name',),
+    'tax': ('gst', 'vat', 'tax'),
+    'discount': ('discount',),
+    'freight': ('freight',),
+}
+
+# Field carrying the document amount, and what balances it: a field of the same
+# category, a (category, field) elsewhere in the map, or one of SETTLEMENT_ACCOUNTS.
+# Primary fields with a split 'Debit / Credit' side balance themselves (None).
+POSTING_TEMPLATES = {
+    'sales-invoice': ('Invoice Amount', 'Customer Name'),
+    'purchase-invoice': ('Bill Amount', 'Supplier Name'),
+    'bank-statement': ('Bank Balance', 'Suspense Account'),
+    'receipts': ('Customer Payment', None),
+    'payments': ('Vendor Payment', None),
+    'payroll': ('Gross Salary', 'Net Pay Transferred'),
+    'fixed-asset-purchase': ('Asset Cost', ('bank-statement', 'Bank Balance')),
+    'asset-sale': ('Sale Proceeds', ('bank-statement', 'Bank Balance')),
+    'capital-infusion': ('Owner Capital Introduced', 'Deposited to Bank'),
+    'drawings': ('Owner Withdrawal', ('bank-statement', 'Bank Balance')),
+    'depreciation': ('Annual Depreciation Expense', 'Accumulated Depreciation'),
+    'prepaid-expense': ('Amount Paid', ('bank-statement', 'Bank Balance')),
+    'accrued-expense': ('Expense Incurred But Unpaid', ('payments', 'Direct Expense')),
+    'inventory': ('Purchase of Goods', ('bank-statement', 'Bank Balance')),
+    'tax-payments': ('GST/TDS/Income Tax Paid', ('bank-statement', 'Bank Balance')),
+}
+SETTLEMENT_ACCOUNTS = {
+    'Suspense Account': {'chart_type': 'Suspense', 'account': 'Suspense Account', 'balance_sheet': None, 'pnl': None, 'cash_flow': None},
+}
+# Categories whose direction follows the transaction type ('debit' = money out)
+TYPE_SENSITIVE = {'bank-statement'}
+
+# Short account names used inside split entries -> the full account names used elsewhere
+ACCOUNT_ALIASES = {
+    'Debtors': 'Accounts Receivable (Debtors)',
+    'Creditors': 'Accounts Payable (Creditors)',
+    'Bank': 'Bank Account',
+    'Bank / Cash': 'Bank Account',
+}
+
+DEBIT, CREDIT = 1, -1
+# Share of an inventory sale taken out of stock as cost of goods sold (statement_totals assumes the same)
+INVENTORY_COST_RATIO = 0.8
+# Credit rows of these categories are not purchases and post with their own legs ((category, field) of the
+# map, side): an inventory credit is a sale (cash in, revenue, and the goods out of stock into COGS, as
+# statement_totals books it); a restock credit is goods received on account (stock up, owed to the supplier)
+CREDIT_POSTINGS = {
+    'inventory': ('inventory-sale', [
+        ('gross', ('bank-statement', 'Bank Balance'), DEBIT),
+        ('gross', ('sales-invoice', 'Invoice Amount'), CREDIT),
+        ('cost', ('inventory', 'Inventory Consumed'), DEBIT),
+        ('cost', ('inventory', 'Purchase of Goods'), CREDIT),
+    ]),
+    'item-restocks': ('inventory-received', [
+        ('gross', ('inventory', 'Purchase of Goods'), DEBIT),
+        ('gross', ('purchase-invoice', 'Supplier Name'), CREDIT),
+    ]),
+}
+LEG_COLUMNS = ['category', 'leg', 'basis', 'account', 'side', 'chart_type', 'balance_sheet', 'pnl', 'cash_flow']
+LINE_COLUMNS = ['entry', 'date', 'description', 'source_category', 'category', 'leg', 'account',
+                'chart_type', 'balance_sheet', 'pnl', 'cash_flow', 'debit', 'credit']
+
+def field_key(name):
+    return re.sub(r'[^a-z0-9]+', '_', str(name).lower()).strip('_')
+
+def category_key(name):
+    return re.sub(r'[^a-z0-9]+', '-', str(name).lower()).strip('-')
+
+def _side(trial_balance):
+    return {'Debit': DEBIT, 'Credit': CREDIT}.get((trial_balance or '').strip())
+
+def _canonical_account(name):
+    name = re.sub(r'\s*[↑↓]\s*', '', name).strip()
+    return ACCOUNT_ALIASES.get(name, name)
+
+def _split_legs(rule):
+    """Legs of a 'Debit / Credit' entry such as 'Debtors ↓ / Bank ↑': increases of assets are debits"""
+    legs = []
+    charts = [part.strip() for part in rule['chart_type'].split('/')]
+    for index, part in enumerate(rule['account'].split('/')):
+        chart = charts[min(index, len(charts) - 1)]
+        decrease = '↓' in part or '↓' in chart or 'Reduction' in chart
+        debit_normal = chart.startswith(('Asset', 'Expense'))
+        legs.append((_canonical_account(part), DEBIT if debit_normal != decrease else CREDIT, chart.split('(')[0].strip()))
+    return legs
+
+class PostingRules:
+    """Indexed posting rules; build with compile_posting_rules(ACCOUNTING_MAP)"""
+
+    def __init__(self, accounting_map, categories, fields, legs):
+        self.accounting_map = accounting_map
+        self._categories = categories
+        self._fields = fields
+        self._legs = legs
+        self._legs_frame = None
+
+    @property
+    def legs(self):
+        """Journal leg table (DataFrame with LEG_COLUMNS), built on first use"""
+        if self._legs_frame is None:
+            import pandas as pd
+            self._legs_frame = pd.DataFrame(self._legs, columns=LEG_COLUMNS)
+        return self._legs_frame
+
+    def resolve_category(self, name):
+        """ACCOUNTING_MAP key for a category name or alias (None if unknown)"""
+        return self._categories.get(category_key(name)) if name else None
+
+    def lookup(self, category, field):
+        """(map field, ACCOUNTING_MAP entry) for a field name or synonym in a category, or None"""
+        category = self.resolve_category(category)
+        if category is None:
+            return None
+        return self._fields.get((category, field_key(field)))
+
+    def accounting_info(self, category, extracted_data):
+        """ACCOUNTING_MAP entries for the extracted fields of one document"""
+        info = {}
+        for field in extracted_data:
+            match = self.lookup(category, field)
+            if match is not None:
+                info[field] = {'field': match[0], **match[1]}
+        return info
+
+    def post(self, records):
+        """Balanced journal lines for many documents/transactions in one pass.
+
+        Records are transactions ({category, amount, type, date, description, ...}) or
+        analyzed documents ({category, extractedData: {...}}). Returns (lines, unposted)
+        DataFrames; every posted record's lines have equal debits and credits.
+        """
+        import numpy as np
+        import pandas as pd
+        frame = pd.DataFrame.from_records([
+            {**record['extractedData'], 'category': record.get('category')} if isinstance(record.get('extractedData'), dict) else record
+            for record in records
+        ])
+        if frame.empty:
+            return pd.DataFrame(columns=LINE_COLUMNS), frame
+
+        def column(role, default=None):
+            # The column named after the role, else the first one named by a synonym
+            if role in frame:
+                return frame[role]
+            for name in frame.columns:
+                if FIELD_SYNONYMS.get(field_key(name)) == role:
+                    return frame[name]
+            return pd.Series(default, index=frame.index, dtype=object)
+
+        source = frame['category'] if 'category' in frame else pd.Series(None, index=frame.index, dtype=object)
+        normalized = source.astype(str).str.lower().str.replace(r'[^a-z0-9]+', '-', regex=True).str.strip('-')
+        category = normalized.map(self._categories)
+        amount = parse_amounts(column('amount'))
+        tax = parse_amounts(column('tax', 0.0)).fillna(0.0).abs()
+        kind = frame['type'].astype(str).str.lower() if 'type' in frame else pd.Series('', index=frame.index)
+        credit_category = normalized.map({source: posting for source, (posting, _) in CREDIT_POSTINGS.items()})
+        category = category.mask((kind == 'credit') & credit_category.isin(self.legs['category']), credit_category)
+        direction = np.sign(amount) * np.where(category.isin(TYPE_SENSITIVE) & (kind == 'debit'), -1, 1)
+
+        postable = category.notna() & amount.notna() & (amount != 0)
+        unposted = frame.loc[~postable].assign(reason=np.where(category[~postable].isna(), 'no posting rule for category', 'missing or zero amount'))
+
+        entries = pd.DataFrame({
+            'entry': frame.index[postable],
+            'date': frame['date'][postable] if 'date' in frame else None,
+            'description': frame['description'][postable] if 'description' in frame else None,
+            'source_category': source[postable],
+            'category': category[postable],
+            'gross': amount[postable].abs(),
+            'tax': np.minimum(tax[postable], amount[postable].abs()),
+            'direction': direction[postable],
+        })
+        lines = entries.merge(self.legs, on='category', how='inner', sort=False)
+        basis = np.select(
+            [lines['basis'] == 'net', lines['basis'] == 'tax', lines['basis'] == 'cost'],
+            [lines['gross'] - lines['tax'], lines['tax'], lines['gross'] * INVENTORY_COST_RATIO],
+            default=lines['gross'],
+        )
+        signed = (basis * lines['side'] * lines['direction']).round(2)
+        lines['debit'] = signed.clip(lower=0)
+        lines['credit'] = (-signed).clip(lower=0)
+        lines = lines.loc[signed != 0, LINE_COLUMNS]
+        return lines.sort_values(['entry', 'leg'], kind='stable').reset_index(drop=True), unposted
+
+    @staticmethod
+    def to_records(frame):
+        """JSON-ready list of dicts (NaN -> None)"""
+        return frame.astype(object).where(frame.notna(), None).to_dict('records')
+
+    @staticmethod
+    def trial_balance(lines):
+        """Net debit/credit per account from journal lines, in build_financial_statements row format"""
+        if lines.empty:
+            return []
+        totals = lines.groupby('account', sort=True)[['debit', 'credit']].sum()
+        net = (totals['debit'] - totals['credit']).round(2)
+        return [
+            {"account": account, "debit": float(max(value, 0.0)), "credit": float(max(-value, 0.0))}
+            for account, value in net.items() if value != 0
+        ]
+
+def compile_posting_rules(accounting_map):
+    """Index ACCOUNTING_MAP by category alias and field synonym and build the journal leg table"""
+    categories = {category_key(name): name for name in accounting_map}
+    for alias, target in CATEGORY_ALIASES.items():
+        if target in accounting_map:
+            categories[category_key(alias)] = target
+
+    fields = {}
+    legs = []
+    for category, category_fields in accounting_map.items():
+        for name, rule in category_fields.items():
+            fields[(category, field_key(name))] = (name, rule)
+        primary, contra = POSTING_TEMPLATES.get(category, (next(iter(category_fields), None), None))
+        roles = {'amount': primary}
+        if isinstance(contra, str) and contra in category_fields:
+            roles['party'] = contra
+        for role, keywords in ROLE_KEYWORDS.items():
+            for name in category_fields:
+                if role not in roles and name != primary and any(word in name.lower() for word in keywords):
+                    roles[role] = name
+        for synonym, role in FIELD_SYNONYMS.items():
+            if role in roles:
+                fields.setdefault((category, synonym), (roles[role], category_fields[roles[role]]))
+
+        if primary is not None:
+            legs.extend(_category_legs(accounting_map, category, primary, contra, roles.get('tax')))
+    for posting, leg_fields in CREDIT_POSTINGS.values():
+        if all(field in accounting_map.get(map_category, {}) for _, (map_category, field), _ in leg_fields):
+            legs.extend(_credit_legs(accounting_map, posting, leg_fields))
+    return PostingRules(accounting_map, categories, fields, legs)
+
+def _credit_legs(accounting_map, posting, leg_fields):
+    """Journal legs of a CREDIT_POSTINGS entry"""
+    legs = []
+    for index, (basis, (map_category, field), side) in enumerate(leg_fields):
+        rule = accounting_map[map_category][field]
+        legs.append((posting, index, basis, _canonical_account(rule['account']), side,
+                     rule['chart_type'], rule['balance_sheet'], rule['pnl'], rule['cash_flow']))
+    return legs
+
+def _category_legs(accounting_map, category, primary, contra, tax_field):
+    """Journal legs (LEG_COLUMNS tuples) that post one document of a category"""
+    category_fields = accounting_map[category]
+    rule = category_fields[primary]
+    side = _side(rule['trial_balance'])
+    if side is None:
+        return [(category, index, 'gross', account, leg_side, chart, rule['balance_sheet'], None, rule['cash_flow'])
+                for index, (account, leg_side, chart) in enumerate(_split_legs(rule))]
+    if isinstance(contra, tuple):
+        contra_rule = accounting_map[contra[0]][contra[1]]
+    elif contra in category_fields:
+        contra_rule = category_fields[contra]
+    elif contra in SETTLEMENT_ACCOUNTS:
+        contra_rule = SETTLEMENT_ACCOUNTS[contra]
+    else:
+        logging.warning(f"No balancing account for posting category '{category}'")
+        return []
+    # Tax is split out of the amount only when it sits on the same side (output tax on sales, input tax on purchases)
+    has_tax = tax_field is not None and _side(category_fields[tax_field]['trial_balance']) == side
+    legs = [(category, 0, 'net' if has_tax else 'gross', _canonical_account(rule['account']), side,
+             rule['chart_type'], rule['balance_sheet'], rule['pnl'], rule['cash_flow'])]
+    if has_tax:
+        tax_rule = category_fields[tax_field]
+        legs.append((category, 1, 'tax', _canonical_account(tax_rule['account']), side,
+                     tax_rule['chart_type'], tax_rule['balance_sheet'], tax_rule['pnl'], tax_rule['cash_flow']))
+    legs.append((category, 2, 'gross', _canonical_account(contra_rule['account']), -side,
+                 contra_rule['chart_type'], contra_rule['balance_sheet'], contra_rule['pnl'], contra_rule['cash_flow']))
+    return legs
@@ -0,0 +1,159 @@
+# On-demand profiling of live requests, armed from the admin endpoints in main.py.
+# An admin arms a session for "the next N requests to <route>"; matching requests
+# are captured with cProfile (pstats dump) or a wall-clock stack sampler that also
+# sees OCR/LLM worker threads (collapsed stacks, loadable by flamegraph tools).
+import os
+import sys
+import time
+import uuid
+import logging
+import cProfile
+import tempfile
+import threading
+from collections import Counter
+
+PROFILE_DIR = os.getenv("PROFILE_DIR") or os.path.join(tempfile.gettempdir(), "finance_ai_profiles")
+PROFILE_MODES = ("cprofile", "sampler")
+
+class StackSampler:
+    """Samples the stacks of every thread at a fixed interval while running"""
+
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.samples = Counter()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _run(self):
+        own_id = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+                    frame = frame.f_back
+                self.samples[";".join(reversed(stack))] += 1
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def collapsed(self):
+        return "\n".join(f"{stack} {count}" for stack, count in self.samples.most_common()) + "\n"
+
+class ProfileSession:
+    def __init__(self, route, count, mode):
+        self.id = uuid.uuid4().hex[:12]
+        self.route = route
+        self.remaining = count
+        self.mode = mode
+        self.created_at = time.time()
+        self.captures = []
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "route": self.route,
+            "remaining": self.remaining,
+            "mode": self.mode,
+            "created_at": self.created_at,
+            "captures": self.captures,
+        }
+
+class Profiler:
+    """Holds armed sessions; at most one capture runs at a time"""
+
+    def __init__(self, directory=PROFILE_DIR):
+        self.directory = directory
+        self.sessions = {}
+        self._lock = threading.Lock()
+        self._capturing = False
+
+    def arm(self, route, count, mode="cprofile"):
+        if mode not in PROFILE_MODES:
+            raise ValueError(f"mode must be one of {PROFILE_MODES}")
+        session = ProfileSession(route, count, mode)
+        with self._lock:
+            self.sessions[session.id] = session
+        return session
+
+    def disarm(self, session_id):
+        with self._lock:
+            return self.sessions.pop(session_id, None)
+
+    def claim(self, route):
+        """Reserve a capture slot for a request to route, or None if nothing is armed"""
+        with self._lock:
+            if self._capturing:
+                return None
+            for session in self.sessions.values():
+                if session.route == route and session.remaining > 0:
+                    session.remaining -= 1
+                    self._capturing = True
+                    return session
+        return None
+
+    async def capture(self, session, request_id, call):
+        """Run the awaitable factory call() under the session's profiler"""
+        try:
+            started = time.perf_counter()
+            if session.mode == "cprofile":
+                profiler = cProfile.Profile()
+                profiler.enable()
+            else:
+                profiler = StackSampler()
+                profiler.start()
+            try:
+                return await call()
+            finally:
+                if session.mode == "cprofile":
+                    profiler.disable()
+                else:
+                    profiler.stop()
+                self._save(session, request_id, profiler, time.perf_counter() - started)
+        finally:
+            # Free the capture slot even when profiling or saving failed
+            with self._lock:
+                self._capturing = False
+
+    def _save(self, session, request_id, profiler, duration):
+        """Write one capture to the session; a failed write is logged, not raised into the request"""
+        extension = "pstats" if session.mode == "cprofile" else "collapsed"
+        filename = f"{session.id}-{len(session.captures)}.{extension}"
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            if session.mode == "cprofile":
+                profiler.dump_stats(os.path.join(self.directory, filename))
+            else:
+                with open(os.path.join(self.directory, filename), "w") as f:
+                    f.write(profiler.collapsed())
+        except OSError as e:
+            logging.warning(f"Failed to save profile {filename}: {e}")
+            return
+        with self._lock:
+            session.captures.append({
+                "file": filename,
+                "request_id": request_id,
+                "duration_seconds": round(duration, 4),
+            })
+
+    def path_for(self, filename):
+        """Absolute path of a capture file, or None if it does not belong to a session"""
+        with self._lock:
+            known = {c["file"] for s in self.sessions.values() for c in s.captures}
+        if filename not in known:
+            return None
+        return os.path.join(self.directory, filename)
+
+    def list(self):
+        with self._lock:
+            return [session.to_dict() for session in self.sessions.values()]
+
+profiler = Profiler()
@@ -0,0 +1,317 @@
+# Bank reconciliation: bank credits against invoices, bank debits against bills.
+# Pass one is a sort-merge join: documents are sorted by (entity, amount, date)
+# and every payment looks up, with two binary searches per cent of amount
+# tolerance, the documents of its entity and amount dated inside its date
+# window. Candidate pairs are ranked by amount difference, then vendor
+# similarity (share of the document's vendor words found in the payment's text),
+# then date distance, and matched one-to-one in rounds of mutual best choices;
+# a payment naming a different party never matches on amount alone.
+# Pass two applies the payments left over to open documents of the same vendor
+# whose outstanding amount covers them, oldest document first, so several
+# partial payments can settle one document. Everything but pass two's
+# allocation (which only sees the leftovers) is vectorised.
+import os
+import re
+import time
+import zlib
+
+import metrics
+from amounts import parse_amounts
+from data_validation import parse_dates
+from duplicates import vendor_of
+
+# pandas and numpy are imported on first use to keep application start-up fast
+
+RECONCILE_AMOUNT_TOLERANCE = float(os.getenv("RECONCILE_AMOUNT_TOLERANCE", "0.01"))
+# A payment may be dated up to this many days after its document (or RECONCILE_EARLY_DAYS before it)
+RECONCILE_DATE_WINDOW_DAYS = int(os.getenv("RECONCILE_DATE_WINDOW_DAYS", "120"))
+RECONCILE_EARLY_DAYS = int(os.getenv("RECONCILE_EARLY_DAYS", "7"))
+# Documents considered per payment on each side of its date; bounds the work on runs of equal amounts
+RECONCILE_MAX_CANDIDATES = int(os.getenv("RECONCILE_MAX_CANDIDATES", "16"))
+# Partial payments have no amount to match on, so they need this much of the vendor name in the payment text
+RECONCILE_MIN_VENDOR_SIMILARITY = float(os.getenv("RECONCILE_MIN_VENDOR_SIMILARITY", "0.5"))
+# 1 lets an amount match stand when the payment text names a different party (e.g. a payment processor)
+RECONCILE_MATCH_OTHER_PARTIES = os.getenv("RECONCILE_MATCH_OTHER_PARTIES", "0") == "1"
+VENDOR_WORDS = 4
+PAYMENT_WORDS = 8
+# Words that say nothing about who was paid
+STOP_WORDS = {"the", "and", "of", "ltd", "llc", "inc", "co", "corp", "gmbh", "bv", "plc", "sa", "ref", "payment",
+              "transfer", "invoice", "bill", "card", "sepa", "online", "direct", "debit", "credit", "to", "from"}
+
+RECONCILED = metrics.REGISTRY.counter(
+    "finance_ai_reconciled_payments_total",
+    "Bank transactions matched to invoices or bills, by match kind (exact amount or partial payment)",
+    ["match"],
+)
+
+_NON_LETTER = re.compile(r"[^a-z]+")
+
+def _word_hashes(texts, width):
+    """(rows x width) uint32 hashes of the first meaningful words of each text (digits dropped, 0 pads)"""
+    import numpy as np
+    import pandas as pd
+    # References and amounts differ on every bank line; without them the texts repeat, so only uniques are split
+    codes, uniques = pd.factorize(pd.Series(texts, dtype=object).fillna("").astype(str).str.lower()
+                                  .str.replace(_NON_LETTER.pattern, " ", regex=True))
+    table = np.zeros((len(uniques) + 1, width), dtype=np.uint32)
+    for code, text in enumerate(uniques):
+        words = [word for word in text.split() if word not in STOP_WORDS and len(word) > 1][:width]
+        table[code, :len(words)] = [zlib.crc32(word.encode()) or 1 for word in words]
+    return table[codes]
+
+def _vendor_similarity(document_words, payment_words):
+    """Share of each document's vendor words found in the paired payment's words (0 without vendor words)"""
+    import numpy as np
+    present = document_words != 0
+    found = ((document_words[:, :, None] == payment_words[:, None, :]) & present[:, :, None]).any(axis=2)
+    return found.sum(axis=1) / np.maximum(present.sum(axis=1), 1)
+
+def _distinct(values):
+    """Sorted distinct values (sorting beats np.unique's hashing on large integer arrays)"""
+    import numpy as np
+    ordered = np.sort(values)
+    return ordered[np.r_[True, ordered[1:] != ordered[:-1]]] if len(ordered) else ordered
+
+def _first_of_each(keys):
+    """Positions of the first occurrence of every distinct key"""
+    import numpy as np
+    order = np.argsort(keys, kind="stable")
+    ordered = keys[order]
+    return order[np.r_[True, ordered[1:] != ordered[:-1]]] if len(ordered) else order
+
+def _pairs(starts, stops):
+    """(owner, position) for every position in each [start, stop) range"""
+    import numpy as np
+    counts = np.maximum(stops - starts, 0)
+    owners = np.repeat(np.arange(len(starts)), counts)
+    positions = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts) + np.repeat(starts, counts)
+    return owners, positions
+
+class _DayIndex:
+    """Documents sorted by (key, date) under one int64 sort key: key code * day span + day"""
+
+    def __init__(self, keys, days):
+        import numpy as np
+        self.unique = _distinct(keys)
+        self.first_day = int(days.min())
+        self.day_span = int(days.max()) - self.first_day + 2
+        sort_keys = np.searchsorted(self.unique, keys) * self.day_span + (days - self.first_day)
+        self.order = np.argsort(sort_keys, kind="stable")
+        self.sort_keys = sort_keys[self.order]
+
+    def window(self, keys, days, window_days, early_days, max_candidates, nearest):
+        """[low, high) positions (in self.order) of the documents with each key dated in a payment's window.
+
+        At most max_candidates on each side of the payment date (nearest=True) or the oldest
+        max_candidates (nearest=False); empty ranges for keys without documents.
+        """
+        import numpy as np
+        code = np.minimum(np.searchsorted(self.unique, keys), len(self.unique) - 1)
+        found = self.unique[code] == keys
+        base = code * self.day_span
+        days = days - self.first_day
+        # Day bounds clipped to the span so a search never runs into the next key's documents
+        def position(day, side):
+            return np.searchsorted(self.sort_keys, base + np.clip(day, -1, self.day_span - 1), side=side)
+        low, high = position(np.maximum(days - window_days, 0), "left"), position(days + early_days, "right")
+        if nearest:
+            # The documents dated nearest the payment when a run of equal amounts is long
+            middle = position(days, "right")
+            low, high = np.maximum(low, middle - max_candidates), np.minimum(high, middle + max_candidates)
+        else:
+            high = np.minimum(high, low + max_candidates)
+        return np.where(found, low, 0), np.where(found, high, 0)
+
+def _exact_matches(groups, cents, days, documents, payments, document_words, payment_words, tolerance_cents,
+                   window_days, early_days, max_candidates, match_other_parties):
+    """One-to-one (document, payment) row pairs within the amount tolerance and date window"""
+    import numpy as np
+    empty = np.empty(0, dtype=np.int64)
+    if not len(documents) or not len(payments):
+        return empty, empty
+    index = _DayIndex(groups[documents] * (1 << 40) + cents[documents], days[documents])
+    # Searching in key order keeps the binary searches cache-friendly
+    in_key_order = np.lexsort((days[payments], cents[payments], groups[payments]))
+    payments, payment_words = payments[in_key_order], payment_words[in_key_order]
+    owners, positions = [], []
+    for delta in range(-tolerance_cents, tolerance_cents + 1):
+        low, high = index.window(groups[payments] * (1 << 40) + cents[payments] + delta, days[payments],
+                                 window_days, early_days, max_candidates, nearest=True)
+        owner, position = _pairs(low, high)
+        owners.append(owner)
+        positions.append(position)
+    pay_index, document_index = np.concatenate(owners), index.order[np.concatenate(positions)]
+    if not len(pay_index):
+        return empty, empty
+    document_rows, payment_rows = documents[document_index], payments[pay_index]
+    similarity = _vendor_similarity(document_words[document_index], payment_words[pay_index])
+    if not match_other_parties:
+        # A payment naming someone other than the document's party is not its payment, whatever the amount
+        named = (document_words[document_index, 0] != 0) & (payment_words[pay_index, 0] != 0)
+        keep = (similarity > 0) | ~named
+        pay_index, document_index, similarity = pay_index[keep], document_index[keep], similarity[keep]
+        document_rows, payment_rows = document_rows[keep], payment_rows[keep]
+    difference = np.abs(cents[document_rows] - cents[payment_rows])
+    distance = np.abs(days[payment_rows] - days[document_rows])
+    ranked = np.lexsort((document_index, pay_index, distance, -similarity, difference))
+    pay_index, document_index = pay_index[ranked], document_index[ranked]
+
+    # Rounds of mutual best choices: a pair is taken when it is its document's best remaining
+    # pair and, among those, its payment's best; the overall best pair is always taken
+    alive = np.ones(len(ranked), dtype=bool)
+    document_used = np.zeros(len(documents), dtype=bool)
+    payment_used = np.zeros(len(payments), dtype=bool)
+    taken = []
+    while alive.any():
+        live = np.flatnonzero(alive)
+        best_for_document = np.sort(live[_first_of_each(document_index[live])])
+        accepted = best_for_document[_first_of_each(pay_index[best_for_document])]
+        taken.append(accepted)
+        document_used[document_index[accepted]] = True
+        payment_used[pay_index[accepted]] = True
+        alive &= ~document_used[document_index] & ~payment_used[pay_index]
+    accepted = np.concatenate(taken) if taken else empty
+    return documents[document_index[accepted]], payments[pay_index[accepted]]
+
+def _partial_matches(groups, cents, days, outstanding, documents, payments, document_words, payment_words,
+                     tolerance_cents, window_days, early_days, max_candidates, min_similarity):
+    """(document, payment, cents) allocations of leftover payments to open documents of the same vendor"""
+    import numpy as np
+    usable = document_words[:, 0] != 0
+    documents, document_words = documents[usable], document_words[usable]
+    if not len(documents) or not len(payments):
+        return []
+    # Join (entity, first vendor word) of the documents against every word of the payment text
+    index = _DayIndex(groups[documents] * (1 << 32) + document_words[:, 0], days[documents])
+    owners, positions = [], []
+    for column in range(payment_words.shape[1]):
+        words = payment_words[:, column]
+        low, high = index.window(groups[payments] * (1 << 32) + words, days[payments],
+                                 window_days, early_days, max_candidates, nearest=False)
+        owner, position = _pairs(np.where(words != 0, low, 0), np.where(words != 0, high, 0))
+        owners.append(owner)
+        positions.append(position)
+    # A document may be found through several of a payment's words
+    pair_codes = _distinct(np.concatenate(owners) * len(documents) + index.order[np.concatenate(positions)])
+    pay_index, document_index = np.divmod(pair_codes, len(documents))
+    covered = cents[payments[pay_index]] < outstanding[documents[document_index]] + tolerance_cents
+    pay_index, document_index = pay_index[covered], document_index[covered]
+    similar = _vendor_similarity(document_words[document_index], payment_words[pay_index]) >= min_similarity
+    document_rows, payment_rows = documents[document_index[similar]], payments[pay_index[similar]]
+    # Payments in date order, each to its oldest document that still has enough outstanding
+    ranked = np.lexsort((days[document_rows], days[payment_rows]))
+    allocations, applied = [], set()
+    for document, payment in zip(document_rows[ranked].tolist(), payment_rows[ranked].tolist()):
+        if payment in applied or cents[payment] > outstanding[document] + tolerance_cents:
+            continue
+        amount = min(int(cents[payment]), int(outstanding[document]))
+        outstanding[document] -= amount
+        applied.add(payment)
+        allocations.append((document, payment, amount))
+    return allocations
+
+def reconcile(transactions, groups=None, amount_tolerance=RECONCILE_AMOUNT_TOLERANCE, window_days=RECONCILE_DATE_WINDOW_DAYS,
+              early_days=RECONCILE_EARLY_DAYS, max_candidates=RECONCILE_MAX_CANDIDATES,
+              min_similarity=RECONCILE_MIN_VENDOR_SIMILARITY, match_other_parties=RECONCILE_MATCH_OTHER_PARTIES):
+    """Match bank transactions to invoices (credits) and bills (debits).
+
+    groups (optional integer codes per row, e.g. entities) keeps matches inside a group.
+    Returns (paid, matched, stats): paid is the amount settled per row (for an invoice or
+    bill the sum of its payments, for a bank transaction the amount it settled) and matched
+    the row of the document each bank transaction was applied to (-1 for none and for documents).
+    """
+    import numpy as np
+    import pandas as pd
+    started = time.perf_counter()
+    count = len(transactions)
+    category_codes, category_names = pd.factorize(pd.Series([transaction.get("category", "") for transaction in transactions], dtype=object))
+    def rows_of(category):
+        code = list(category_names).index(category) if category in category_names else -2
+        return category_codes == code
+    credit = np.array([transaction.get("type", "debit") == "credit" for transaction in transactions], dtype=bool)
+    amounts = parse_amounts(pd.Series([transaction.get("amount", 0) for transaction in transactions])).abs()
+    cents = (amounts * 100).round().fillna(-1).astype(np.int64).to_numpy()
+    dates = parse_dates(pd.Series([transaction.get("date") for transaction in transactions], dtype=object))
+    days = (dates - pd.Timestamp("1970-01-01")).dt.days.to_numpy()
+    dated = ~np.isnan(days)
+    days = np.nan_to_num(days).astype(np.int64)
+    groups = np.zeros(count, dtype=np.int64) if groups is None else np.asarray(groups, dtype=np.int64)
+    usable = dated & (cents > 0)
+    bank_rows = rows_of("bank-transactions")
+    bank = bank_rows & usable
+    tolerance_cents = int(round(amount_tolerance * 100))
+
+    paid_cents = np.zeros(count, dtype=np.int64)
+    matched = np.full(count, -1, dtype=np.int64)
+    outstanding = np.where(usable, cents, 0)
+    stats = {"exact_matches": 0, "partial_payments": 0}
+    for category, payments in (("invoices", bank & credit), ("bills", bank & ~credit)):
+        documents = np.flatnonzero(rows_of(category) & usable)
+        payments = np.flatnonzero(payments)
+        if not len(documents) or not len(payments):
+            continue
+        texts = [vendor_of(transactions[row]) or transactions[row].get("description") for row in documents.tolist()]
+        document_words = _word_hashes(texts, VENDOR_WORDS)
+        texts = [transactions[row].get("description") or vendor_of(transactions[row]) for row in payments.tolist()]
+        payment_words = _word_hashes(texts, PAYMENT_WORDS)
+        document_rows, payment_rows = _exact_matches(groups, cents, days, documents, payments, document_words, payment_words,
+                                                     tolerance_cents, window_days, early_days, max_candidates,
+                                                     match_other_parties)
+        settled = np.minimum(cents[payment_rows], cents[document_rows])
+        paid_cents[document_rows] += settled
+        paid_cents[payment_rows] = settled
+        outstanding[document_rows] -= settled
+        matched[payment_rows] = document_rows
+        stats["exact_matches"] += len(document_rows)
+
+        open_documents = np.flatnonzero(paid_cents[documents] == 0)
+        left_payments = np.flatnonzero(matched[payments] < 0)
+        allocations = _partial_matches(groups, cents, days, outstanding, documents[open_documents], payments[left_payments],
+                                       document_words[open_documents], payment_words[left_payments], tolerance_cents,
+                                       window_days, early_days, max_candidates, min_similarity)
+        for document, payment, amount in allocations:
+            paid_cents[document] += amount
+            paid_cents[payment] = amount
+            matched[payment] = document
+        stats["partial_payments"] += len(allocations)
+
+    documents = rows_of("invoices") | rows_of("bills")
+    remaining = np.where(documents & usable, cents - paid_cents, 0)
+    stats.update({
+        "rows": count,
+        "documents_paid": int((documents & usable & (paid_cents > 0) & (remaining <= tolerance_cents)).sum()),
+        "documents_partially_paid": int((documents & (paid_cents > 0) & (remaining > tolerance_cents)).sum()),
+        "documents_unpaid": int((documents & (paid_cents == 0)).sum()),
+        "unmatched_bank_transactions": int((bank_rows & (matched < 0)).sum()),
+        "seconds": round(time.perf_counter() - started, 3),
+    })
+    RECONCILED.inc(stats["exact_matches"], match="exact")
+    RECONCILED.inc(stats["partial_payments"], match="partial")
+    return paid_cents / 100.0, matched, stats
+
+def payment_status(amount, paid, tolerance=RECONCILE_AMOUNT_TOLERANCE):
+    if paid <= 0:
+        return "unpaid"
+    return "paid" if abs(amount) - paid <= tolerance else "partial"
+
+def annotate(transactions, paid, matched):
+    """Write reconciliation results into the transaction dicts.
+
+    Invoices and bills get payment_status, amount_paid, amount_outstanding and the ids of the
+    bank transactions that paid them; matched bank transactions get reconciled_with and reconciled_amount.
+    """
+    import numpy as np
+    payments = {}
+    for payment in np.flatnonzero(matched >= 0).tolist():
+        document = int(matched[payment])
+        payments.setdefault(document, []).append(transactions[payment].get("id", f"row-{payment}"))
+        transactions[payment]["reconciled_with"] = transactions[document].get("id", f"row-{document}")
+        transactions[payment]["reconciled_amount"] = float(paid[payment])
+    amounts = parse_amounts([transaction.get("amount", 0) for transaction in transactions]).fillna(0.0).abs().to_numpy()
+    for row, transaction in enumerate(transactions):
+        if transaction.get("category") in ("invoices", "bills"):
+            transaction["payment_status"] = payment_status(amounts[row], paid[row])
+            transaction["amount_paid"] = float(paid[row])
+            transaction["amount_outstanding"] = round(float(max(0.0, amounts[row] - paid[row])), 2)
+            transaction["reconciled_with"] = payments.get(row, [])
+    return transactions
@@ -0,0 +1,284 @@
+# Full-text and field search over analysed documents.
+# Every analysed document's key fields (vendor, amount, date, category) and a text
+# snippet are appended to SEARCH_INDEX_PATH (the full extracted text only with
+# SEARCH_INDEX_FULL_TEXT=1) and its text is indexed in memory: an inverted
+# index of text tokens and one of vendor tokens (token -> ascending document
+# numbers, 4 bytes each), plus columns for amount, date and category with sorted
+# range indexes over amount and date. A query turns each filter into a boolean
+# mask over document numbers (postings and range-index slices are scattered into
+# it), ANDs the masks and reads the page off the sorted index of the sort field,
+# so a search costs a few vectorised passes even at hundreds of thousands of
+# documents. Documents appended to the file by other processes (e.g. the bulk
+# analysis workers) are picked up on the next search.
+import os
+import json
+import threading
+from array import array
+from datetime import date, datetime
+
+import metrics
+from amounts import parse_amount
+from duplicates import normalise_text, vendor_of
+
+# numpy is imported on first use to keep application start-up fast
+
+SEARCH_INDEX_ENABLED = os.getenv("SEARCH_INDEX_ENABLED", "1") == "1"
+# Append-only JSON lines of indexed documents, re-read at start-up; empty keeps the index in memory only
+SEARCH_INDEX_PATH = os.getenv("SEARCH_INDEX_PATH", "search_index.jsonl")
+# Text kept per document for result snippets
+SEARCH_INDEX_SNIPPET_CHARS = int(os.getenv("SEARCH_INDEX_SNIPPET_CHARS", "600"))
+# Documents hold personal and financial data, so their full text is only written to SEARCH_INDEX_PATH
+# on request; without it, documents re-read at start-up are searchable by their fields and snippet
+SEARCH_INDEX_FULL_TEXT = os.getenv("SEARCH_INDEX_FULL_TEXT", "0") == "1"
+SEARCH_MAX_PAGE_SIZE = int(os.getenv("SEARCH_MAX_PAGE_SIZE", "100"))
+SORT_FIELDS = ("date", "amount")
+
+SEARCH_QUERIES = metrics.REGISTRY.counter(
+    "finance_ai_search_queries_total",
+    "Document searches",
+)
+SEARCH_SECONDS = metrics.REGISTRY.histogram(
+    "finance_ai_search_duration_seconds",
+    "Time to answer a document search (filters, sort and page)",
+)
+
+def tokens(text):
+    return set(normalise_text(text).split())
+
+def day_number(value):
+    """Ordinal of an ISO date (YYYY-MM-DD...), or None"""
+    try:
+        return date.fromisoformat(str(value)[:10]).toordinal()
+    except (TypeError, ValueError):
+        return None
+
+def _column(values, dtype):
+    """numpy copy of an array.array (a view would pin its buffer and block appends)"""
+    import numpy as np
+    return np.frombuffer(values, dtype=dtype).copy() if len(values) else np.zeros(0, dtype=dtype)
+
+class SearchIndex:
+    """Inverted text and vendor indexes plus amount/date range indexes over analysed documents"""
+
+    def __init__(self, path=SEARCH_INDEX_PATH, enabled=SEARCH_INDEX_ENABLED, snippet_chars=SEARCH_INDEX_SNIPPET_CHARS,
+                 full_text=SEARCH_INDEX_FULL_TEXT):
+        self.path = path
+        self.enabled = enabled
+        self.snippet_chars = snippet_chars
+        self.full_text = full_text
+        self._lock = threading.RLock()
+        self._documents = []                  # document number -> stored fields
+        self._text = {}                       # token -> array('i') of document numbers
+        self._vendor = {}
+        self._amounts = array('d')            # NaN without an amount
+        self._days = array('i')               # -1 without a date
+        self._categories = array('i')         # code in self._category_codes
+        self._category_codes = {}
+        self._alive = array('b')              # 0 once a newer analysis of the same content replaced it
+        self._by_digest = {}
+        self._seen = set()                    # (sha256, indexed_at) of every record indexed
+        self._ranges = {}                     # field -> (sorted values, document numbers); rebuilt when stale
+        self._indexed = {field: 0 for field in SORT_FIELDS}
+        self._offset = 0                      # bytes of SEARCH_INDEX_PATH already indexed
+
+    # --- INDEXING ---
+    def _index(self, record):
+        """Add one stored record (under self._lock)"""
+        key = (record["sha256"], record["indexed_at"])
+        if key in self._seen:
+            return  # our own append, seen again when re-reading the file
+        self._seen.add(key)
+        previous = self._by_digest.get(record["sha256"])
+        if previous is not None:
+            # The latest analysis of a file wins
+            if self._documents[previous]["indexed_at"] > record["indexed_at"]:
+                return
+            self._alive[previous] = 0
+        number = len(self._documents)
+        text = record.pop("text", None)
+        if text is None:
+            text = record.get("snippet") or ""  # stored without its full text
+        record["snippet"] = text[:self.snippet_chars]
+        self._documents.append(record)
+        self._by_digest[record["sha256"]] = number
+        for token in tokens(text) | tokens(record.get("filename")) | tokens(record.get("description")):
+            self._text.setdefault(token, array('i')).append(number)
+        for token in tokens(record.get("vendor")):
+            self._vendor.setdefault(token, array('i')).append(number)
+        amount = parse_amount(record.get("amount"))
+        day = day_number(record.get("date"))
+        self._amounts.append(float("nan") if amount is None else amount)
+        self._days.append(-1 if day is None else day)
+        category = (record.get("category") or "").lower()
+        self._categories.append(self._category_codes.setdefault(category, len(self._category_codes)))
+        self._alive.append(1)
+
+    def add(self, digest, filename, text, result):
+        """Index an analysed document (the /analyze-document/ result) and append it to SEARCH_INDEX_PATH"""
+        if not self.enabled:
+            return
+        extracted = result.get("extractedData") or {}
+        record = {
+            "sha256": digest,
+            "filename": filename,
+            "category": result.get("category"),
+            "dashboard_category": result.get("dashboardCategory"),
+            "vendor": vendor_of(extracted),
+            "amount": parse_amount(extracted.get("amount")),
+            "date": extracted.get("date") or None,
+            "description": extracted.get("description"),
+            "indexed_at": datetime.now().isoformat(),
+        }
+        stored = {**record, "text": text} if self.full_text else {**record, "snippet": (text or "")[:self.snippet_chars]}
+        line = (json.dumps(stored, default=str, ensure_ascii=False) + "\n").encode()
+        record["text"] = text
+        with self._lock:
+            self._load()
+            self._index(record)
+            if self.path:
+                # One O_APPEND write per document, so concurrent writers never interleave lines
+                fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+                try:
+                    os.write(fd, line)
+                    end = os.lseek(fd, 0, os.SEEK_CUR)
+                    if end - len(line) == self._offset:
+                        self._offset = end
+                finally:
+                    os.close(fd)
+
+    def _load(self):
+        """Index records appended to SEARCH_INDEX_PATH since the last read (under self._lock)"""
+        if not self.path or not os.path.exists(self.path) or os.path.getsize(self.path) <= self._offset:
+            return
+        with open(self.path, "rb") as f:
+            f.seek(self._offset)
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break  # a write in progress; read it next time
+                self._offset += len(line)
+                try:
+                    self._index(json.loads(line))
+                except (ValueError, KeyError):
+                    continue
+
+    def load(self):
+        with self._lock:
+            self._load()
+    # --- END INDEXING ---
+
+    # --- SEARCH ---
+    def _range(self, field):
+        """(sorted values, document numbers) of the documents with a value for field, merging new documents in"""
+        import numpy as np
+        column = self._amounts if field == "amount" else self._days
+        values, numbers = self._ranges.get(field, (np.zeros(0, dtype=np.float64 if field == "amount" else np.int32), np.zeros(0, dtype=np.int64)))
+        start = self._indexed[field]
+        if start < len(column):
+            new = np.arange(start, len(column))
+            new_values = _column(column[start:], values.dtype)
+            keep = ~np.isnan(new_values) if field == "amount" else new_values >= 0
+            new, new_values = new[keep], new_values[keep]
+            order = np.argsort(new_values, kind="stable")
+            positions = np.searchsorted(values, new_values[order], side="right")
+            values, numbers = np.insert(values, positions, new_values[order]), np.insert(numbers, positions, new[order])
+            self._ranges[field] = (values, numbers)
+            self._indexed[field] = len(column)
+        return values, numbers
+
+    def _postings_mask(self, index, query_tokens, count):
+        """Documents containing every token; None for no tokens"""
+        import numpy as np
+        if not query_tokens:
+            return None
+        mask = None
+        for token in sorted(query_tokens, key=lambda token: len(index.get(token, ()))):
+            postings = index.get(token)
+            if not postings:
+                return np.zeros(count, dtype=bool)
+            hits = np.zeros(count, dtype=bool)
+            hits[_column(postings, np.int32)] = True
+            mask = hits if mask is None else mask & hits
+        return mask
+
+    def search(self, query=None, vendor=None, category=None, amount_min=None, amount_max=None,
+               date_from=None, date_to=None, sort="-date", page=1, page_size=20):
+        """One page of matching documents, newest first by default; sort is date, amount, -date or -amount.
+
+        query and vendor match documents containing all their words; ranges are inclusive.
+        Raises ValueError for an unknown sort field or an invalid date.
+        """
+        import numpy as np
+        field = sort.lstrip("-")
+        if field not in SORT_FIELDS:
+            raise ValueError(f"sort must be one of {', '.join(SORT_FIELDS)} (prefix - for descending)")
+        bounds = {}
+        for name, value in (("date_from", date_from), ("date_to", date_to)):
+            if value:
+                bounds[name] = day_number(value)
+                if bounds[name] is None:
+                    raise ValueError(f"{name} must be an ISO date (YYYY-MM-DD)")
+        page, page_size = max(1, page), min(max(1, page_size), SEARCH_MAX_PAGE_SIZE)
+        SEARCH_QUERIES.inc()
+        with SEARCH_SECONDS.time(), self._lock:
+            self._load()
+            count = len(self._documents)
+            mask = _column(self._alive, np.int8).astype(bool)
+            for index, words in ((self._text, tokens(query)), (self._vendor, tokens(vendor))):
+                matches = self._postings_mask(index, words, count)
+                if matches is not None:
+                    mask &= matches
+            if category:
+                code = self._category_codes.get(category.lower())
+                if code is None:
+                    mask[:] = False
+                else:
+                    mask &= _column(self._categories, np.int32) == code
+            for name, low, high in (("amount", amount_min, amount_max), ("date", bounds.get("date_from"), bounds.get("date_to"))):
+                if low is None and high is None:
+                    continue
+                values, numbers = self._range(name)
+                start = 0 if low is None else np.searchsorted(values, low, side="left")
+                stop = len(values) if high is None else np.searchsorted(values, high, side="right")
+                in_range = np.zeros(count, dtype=bool)
+                in_range[numbers[start:stop]] = True
+                mask &= in_range
+            total = int(mask.sum())
+            # Sorted by the sort field; documents without a value for it come last
+            values, numbers = self._range(field)
+            ordered = numbers[mask[numbers]]
+            if sort.startswith("-"):
+                ordered = ordered[::-1]
+            first = (page - 1) * page_size
+            selected = ordered[first:first + page_size]
+            if len(selected) < page_size:
+                with_value = np.zeros(count, dtype=bool)
+                with_value[numbers] = True
+                missing = np.flatnonzero(mask & ~with_value)
+                skip = max(0, first - len(ordered))
+                selected = np.concatenate([selected, missing[skip:skip + page_size - len(selected)]])
+            results = [self._result(int(number), query) for number in selected]
+        return {"total": total, "page": page, "page_size": page_size, "sort": sort, "results": results}
+
+    def _result(self, number, query):
+        document = dict(self._documents[number])
+        snippet = document.pop("snippet")
+        words = normalise_text(query).split() if query else []
+        lowered = snippet.lower()
+        hit = min((position for position in (lowered.find(word) for word in words) if position >= 0), default=0)
+        start = max(0, hit - 80)
+        document["snippet"] = ("..." if start else "") + " ".join(snippet[start:start + 240].split())
+        return document
+    # --- END SEARCH ---
+
+    def stats(self):
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "path": self.path,
+                "documents": int(sum(self._alive)),
+                "versions": len(self._documents),
+                "tokens": len(self._text),
+                "vendor_tokens": len(self._vendor),
+            }
+
+search_index = SearchIndex()
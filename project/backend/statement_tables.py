@@ -0,0 +1,366 @@
+# Table extraction for digital (text) PDF bank statements.
+# Every page is read as positioned words (pdfplumber), the column header row
+# (date / description / debit / credit / balance, or one signed amount column)
+# fixes the column boundaries and each line is split into cells by x position;
+# ruled tables found by pdfplumber's table finder are used cell by cell. Rows
+# become transactions without an LLM call. Running balances are checked per page
+# and across page boundaries: only pages that do not reconcile (or have no
+# recognisable table) are handed to the LLM. Pages are read in parallel by worker
+# processes.
+import os
+import re
+import logging
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+import metrics
+from amounts import detect_decimal_separator, parse_amounts
+
+# pandas is imported on first use to keep application start-up fast
+
+STATEMENT_PAGE_WORKERS = int(os.getenv("STATEMENT_PAGE_WORKERS", str(os.cpu_count() or 2)))
+# Pages per worker task; shorter statements are read in the calling thread
+STATEMENT_PAGES_PER_TASK = int(os.getenv("STATEMENT_PAGES_PER_TASK", "8"))
+STATEMENT_BALANCE_TOLERANCE = float(os.getenv("STATEMENT_BALANCE_TOLERANCE", "0.01"))
+
+STATEMENT_PAGES = metrics.REGISTRY.counter(
+    "finance_ai_statement_pages_total",
+    "Bank statement pages by how their transactions were extracted",
+    ["source"],
+)
+
+# Header captions per column role (lower case, punctuation stripped)
+COLUMN_HEADERS = {
+    "date": {"date", "booking date", "transaction date", "posting date", "value date", "posted", "datum", "boekdatum"},
+    "description": {"description", "details", "transaction details", "narrative", "particulars", "transaction",
+                    "memo", "payee", "omschrijving", "naam omschrijving"},
+    "debit": {"debit", "debits", "withdrawal", "withdrawals", "paid out", "money out", "payments", "out", "af"},
+    "credit": {"credit", "credits", "deposit", "deposits", "paid in", "money in", "receipts", "in", "bij"},
+    "amount": {"amount", "bedrag", "transaction amount"},
+    "balance": {"balance", "running balance", "saldo"},
+}
+_HEADER_ROLES = {caption: role for role, captions in COLUMN_HEADERS.items() for caption in captions}
+_CAPTION_PUNCTUATION = re.compile(r"[^\w ]+")
+_DATE = re.compile(r"^(?:\d{4}[-/.]\d{1,2}[-/.]\d{1,2}|\d{1,2}[-/.]\d{1,2}[-/.]\d{2,4}|\d{1,2}[ -][A-Za-z]{3,9}\.?[ -]\d{2,4})$")
+_AMOUNT = re.compile(r"^[-+(]?\s*[^\d\s]{0,3}\s*\d[\d.,' ]*\)?\s*(?:-|CR|DR|[A-Z]{3})?$", re.IGNORECASE)
+_NUMERIC_DATE = re.compile(r"^(\d{1,2})[-/.](\d{1,2})[-/.](\d{4})$")
+_OPENING = re.compile(r"\b(?:opening balance|balance brought forward|brought forward|previous balance|beginsaldo)\b", re.IGNORECASE)
+_CLOSING = re.compile(r"\b(?:closing balance|balance carried forward|carried forward|new balance|eindsaldo)\b", re.IGNORECASE)
+
+# --- PAGE READING (worker processes, or the calling thread for short statements) ---
+def _phrases(words):
+    """Words on one line joined into phrases: a gap wider than ~half the font size separates cells"""
+    phrases = []
+    for word in sorted(words, key=lambda word: word["x0"]):
+        if phrases and word["x0"] - phrases[-1][1] <= 0.5 * (word["bottom"] - word["top"]):
+            x0, _, text = phrases[-1]
+            phrases[-1] = (x0, word["x1"], f"{text} {word['text']}")
+        else:
+            phrases.append((word["x0"], word["x1"], word["text"]))
+    return phrases
+
+def read_page(page):
+    """Positioned phrases per line, plus any ruled tables, of one pdfplumber page"""
+    lines, current, bottom = [], [], None
+    for word in sorted(page.extract_words(), key=lambda word: (round(word["top"]), word["x0"])):
+        # Words whose tops are within a third of the line height share a line
+        if current and abs(word["top"] - current[0]["top"]) > (bottom - current[0]["top"]) / 3:
+            lines.append((current[0]["top"], _phrases(current)))
+            current = []
+        current.append(word)
+        bottom = word["bottom"]
+    if current:
+        lines.append((current[0]["top"], _phrases(current)))
+    # The table finder needs ruling lines; text-only layouts skip it
+    tables = page.extract_tables() if page.lines or page.rects else []
+    return {"lines": lines, "tables": tables}
+
+def read_pages(pdf_path, indices):
+    """read_page() for the given 0-based page indices of a PDF"""
+    import pdfplumber
+    with pdfplumber.open(pdf_path) as pdf:
+        return [read_page(pdf.pages[index]) for index in indices]
+# --- END PAGE READING ---
+
+class StatementReaderPool:
+    """Process pool reading statement pages, started on first use"""
+
+    def __init__(self, processes=STATEMENT_PAGE_WORKERS, pages_per_task=STATEMENT_PAGES_PER_TASK):
+        self.processes = processes
+        self.pages_per_task = pages_per_task
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def executor(self):
+        with self._lock:
+            if self._executor is None:
+                # spawn for the same reason as the OCR workers: never fork the running server
+                self._executor = ProcessPoolExecutor(max_workers=self.processes, mp_context=multiprocessing.get_context("spawn"))
+            return self._executor
+
+    def read(self, pdf_path, page_count):
+        """read_page() output for every page, in page order"""
+        if self.processes <= 1 or page_count <= self.pages_per_task:
+            return read_pages(pdf_path, range(page_count))
+        chunks = [range(start, min(start + self.pages_per_task, page_count)) for start in range(0, page_count, self.pages_per_task)]
+        futures = [self.executor().submit(read_pages, pdf_path, list(chunk)) for chunk in chunks]
+        return [page for future in futures for page in future.result()]
+
+    def shutdown(self, wait=False):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=wait, cancel_futures=True)
+
+statement_reader_pool = StatementReaderPool()
+
+# --- TABLE RECONSTRUCTION ---
+def header_role(text):
+    return _HEADER_ROLES.get(" ".join(_CAPTION_PUNCTUATION.sub(" ", text).lower().split()))
+
+def _is_layout(roles):
+    return "date" in roles and ("amount" in roles or "debit" in roles or "credit" in roles)
+
+def find_layout(lines):
+    """(line number, [(role, x0, x1)]) of the column header line, or None"""
+    for number, (_, phrases) in enumerate(lines):
+        columns = [(header_role(text), x0, x1) for x0, x1, text in phrases]
+        roles = [role for role, _, _ in columns if role]
+        if len(roles) >= 3 and len(set(roles)) == len(roles) and _is_layout(roles):
+            return number, [column for column in columns if column[0]]
+    return None
+
+def _regions(layout):
+    """Column x ranges: boundaries halfway between neighbouring header captions"""
+    layout = sorted(layout, key=lambda column: column[1])
+    regions = []
+    for i, (role, x0, x1) in enumerate(layout):
+        left = (layout[i - 1][2] + x0) / 2 if i else float("-inf")
+        right = (x1 + layout[i + 1][1]) / 2 if i + 1 < len(layout) else float("inf")
+        regions.append((role, left, right))
+    return regions
+
+def _cells(phrases, regions):
+    """{role: text} for one line: each phrase goes to the column it overlaps most"""
+    cells = {}
+    for x0, x1, text in phrases:
+        role = max(regions, key=lambda region: min(x1, region[2]) - max(x0, region[1]))[0]
+        cells[role] = f"{cells[role]} {text}" if role in cells else text
+    return cells
+
+def _table_rows(table):
+    """{role: text} rows of a ruled table whose first row is a recognised header"""
+    roles = [header_role(cell or "") for cell in table[0]]
+    if not _is_layout([role for role in roles if role]):
+        return None
+    return [{role: (cell or "").replace("\n", " ").strip() for role, cell in zip(roles, row) if role and cell}
+            for row in table[1:]]
+
+def page_rows(page, layout=None):
+    """Raw rows of one page: (rows, layout), each row {role: text} with 'kind' transaction/opening/closing.
+
+    layout is the previous page's column header, used when this page does not repeat it.
+    """
+    for table in page["tables"]:
+        rows = _table_rows(table) if table else None
+        if rows is not None:
+            return _group(rows), layout
+    lines = page["lines"]
+    found = find_layout(lines)
+    if found is not None:
+        number, layout = found
+        lines = lines[number + 1:]
+    if layout is None:
+        return [], None
+    regions = _regions(layout)
+    cells, last_top, line_height = [], None, None
+    for top, phrases in lines:
+        row = _cells(phrases, regions)
+        # A line far below the table body (page footer) is not a wrapped description
+        row["_gap"] = None if last_top is None else top - last_top
+        if line_height is None and last_top is not None:
+            line_height = top - last_top
+        last_top = top
+        cells.append(row)
+    return _group(cells, line_height), layout
+
+def _group(cells, line_height=None):
+    """Fold lines into rows: a date or an amount starts a row, description-only lines continue it"""
+    rows = []
+    for cell in cells:
+        gap = cell.pop("_gap", None)
+        date = cell.get("date", "")
+        amounts = {role: cell[role] for role in ("debit", "credit", "amount", "balance") if _AMOUNT.match(cell.get(role, ""))}
+        description = cell.get("description", "")
+        if _OPENING.search(description) or _CLOSING.search(description):
+            if "balance" in amounts:
+                rows.append({"kind": "opening" if _OPENING.search(description) else "closing", "balance": amounts["balance"]})
+            continue
+        if _DATE.match(date) or set(amounts) - {"balance"}:
+            rows.append({"kind": "transaction", "date": date if _DATE.match(date) else "", "description": description, **amounts})
+        elif description and rows and rows[-1]["kind"] == "transaction" and set(cell) <= {"description"} \
+                and (gap is None or line_height is None or gap <= 2 * line_height):
+            rows[-1]["description"] = f"{rows[-1]['description']} {description}".strip()
+    return rows
+# --- END TABLE RECONSTRUCTION ---
+
+# --- BALANCE CHECK AND ASSEMBLY ---
+def signed_change(debit, credit, amount):
+    """Balance change of a row: debit and credit columns are unsigned, an amount column is signed (NaN = empty)"""
+    change = 0.0
+    if credit == credit:
+        change += abs(credit)
+    if debit == debit:
+        change -= abs(debit)
+    if amount == amount:
+        change += amount
+    return round(change, 2)
+
+def statement_dates(texts, decimal="."):
+    """Parsed dates (a datetime Series) of a statement's date cells, day/month order detected per document.
+
+    The order comes from values where one part exceeds 12; comma-decimal statements default to day first.
+    """
+    import pandas as pd
+    from data_validation import parse_dates
+    texts = pd.Series(texts, dtype=object).fillna("").astype(str).str.strip()
+    parts = texts.str.extract(_NUMERIC_DATE)
+    first, second = pd.to_numeric(parts[0], errors="coerce"), pd.to_numeric(parts[1], errors="coerce")
+    day_first, month_first = int((first > 12).sum()), int((second > 12).sum())
+    order = r"\3-\2-\1" if day_first > month_first or (day_first == month_first and decimal == ",") else r"\3-\1-\2"
+    return parse_dates(texts.str.replace(_NUMERIC_DATE.pattern, order, regex=True))
+
+def _values(pages, role, decimal):
+    import pandas as pd
+    texts = [row.get(role) for rows in pages for row in rows]
+    return iter(parse_amounts(pd.Series(texts, dtype=object), decimal).tolist())
+
+def to_transactions(pages):
+    """Parse the raw rows of every page: amounts with one decimal convention for the document"""
+    amount_texts = [row[role] for rows in pages for row in rows for role in ("debit", "credit", "amount", "balance") if row.get(role)]
+    decimal = detect_decimal_separator(amount_texts)
+    columns = {role: _values(pages, role, decimal) for role in ("debit", "credit", "amount", "balance")}
+    dates = iter(statement_dates([row.get("date") for rows in pages for row in rows], decimal).tolist())
+    parsed_pages, last_date = [], None
+    for rows in pages:
+        parsed = []
+        for row in rows:
+            debit, credit, amount, balance = (next(columns[role]) for role in ("debit", "credit", "amount", "balance"))
+            day = next(dates)
+            balance = None if balance != balance else balance
+            if row["kind"] != "transaction":
+                parsed.append({"kind": row["kind"], "balance": balance})
+                continue
+            # Statements often print the date only on the first transaction of a day
+            day = last_date if day != day or day is None else day.date().isoformat()
+            last_date = day
+            parsed.append({"kind": "transaction", "date": day, "description": row["description"],
+                           "change": signed_change(debit, credit, amount), "balance": balance})
+        parsed_pages.append(parsed)
+    return parsed_pages
+
+def _direction(parsed_pages):
+    """+1 when the statement runs oldest first, -1 when newest first (by which order the balances reconcile)"""
+    rows = [row for parsed in parsed_pages for row in parsed if row["kind"] == "transaction" and row["balance"] is not None]
+    forward = backward = 0
+    for previous, row in zip(rows, rows[1:]):
+        forward += abs(previous["balance"] + row["change"] - row["balance"]) <= STATEMENT_BALANCE_TOLERANCE
+        backward += abs(row["balance"] + previous["change"] - previous["balance"]) <= STATEMENT_BALANCE_TOLERANCE
+    return -1 if backward > forward else 1
+
+def check_balances(parsed_pages):
+    """Pages (0-based) whose running balances do not reconcile, within a page or across the boundary"""
+    direction = _direction(parsed_pages)
+    failed, carried = set(), None
+    for index, parsed in enumerate(parsed_pages):
+        if direction < 0:
+            # Newest-first statements are checked in date order; their forward markers do not apply
+            rows, balance = [row for row in parsed[::-1] if row["kind"] == "transaction"], None
+        else:
+            rows, balance = parsed, carried
+        opened = False
+        for row in rows:
+            mismatch = balance is not None and row["balance"] is not None
+            if row["kind"] == "transaction":
+                expected = None if balance is None else balance + row["change"]
+                if mismatch and abs(expected - row["balance"]) > STATEMENT_BALANCE_TOLERANCE:
+                    failed.add(index)
+                    # Without a brought-forward line either page may have lost the row at the boundary
+                    if index and not opened and row is next(r for r in rows if r["kind"] == "transaction"):
+                        failed.add(index - 1)
+                balance = row["balance"] if row["balance"] is not None else expected
+                continue
+            if mismatch and abs(balance - row["balance"]) > STATEMENT_BALANCE_TOLERANCE:
+                failed.add(index)
+            if row["balance"] is not None:
+                balance = row["balance"]
+            opened = opened or row["kind"] == "opening"
+        carried = balance if direction > 0 else None
+    return failed
+
+def transaction_record(row, page, number, source):
+    """Transaction dict in the shape of the frontend's TransactionData"""
+    return {
+        "id": f"p{page + 1}-{number}",
+        "date": row["date"],
+        "description": row["description"],
+        "amount": abs(row["change"]),
+        "category": "bank-transactions",
+        "type": "credit" if row["change"] >= 0 else "debit",
+        "running_balance": row["balance"],
+        "page": page + 1,
+        "source": source,
+    }
+
+def extract_statement(pdf_path, page_count, pool=statement_reader_pool):
+    """Table extraction of a statement; returns (page_transactions, failed_pages, page_texts).
+
+    page_transactions holds the transactions read from each page's table; failed_pages are the
+    0-based pages without a table or with balances that do not reconcile, and page_texts the
+    plain text of those pages for the LLM fallback.
+    """
+    pages = pool.read(pdf_path, page_count)
+    raw_pages, layout = [], None
+    for page in pages:
+        rows, layout = page_rows(page, layout)
+        raw_pages.append(rows)
+    parsed_pages = to_transactions(raw_pages)
+    failed = check_balances(parsed_pages)
+    failed |= {index for index, parsed in enumerate(parsed_pages) if not any(row["kind"] == "transaction" for row in parsed)
+               and any(phrases for _, phrases in pages[index]["lines"])}
+    page_transactions = [
+        [transaction_record(row, index, number, "table")
+         for number, row in enumerate((row for row in parsed if row["kind"] == "transaction"), start=1)]
+        for index, parsed in enumerate(parsed_pages)
+    ]
+    page_texts = {index: "\n".join("    ".join(text for _, _, text in phrases) for _, phrases in pages[index]["lines"])
+                  for index in sorted(failed)}
+    logging.info(f"Statement tables: {page_count} pages, {len(failed)} need the LLM")
+    return page_transactions, sorted(failed), page_texts
+
+def unreconciled_pages(page_transactions):
+    """check_balances() over final transaction records (table and LLM pages merged), as 1-based page numbers"""
+    parsed_pages = [[{"kind": "transaction", "balance": record["running_balance"],
+                      "change": record["amount"] if record["type"] == "credit" else -record["amount"]}
+                     for record in records] for records in page_transactions]
+    return [index + 1 for index in sorted(check_balances(parsed_pages))]
+
+def llm_transactions(payload, page):
+    """Transactions from the LLM's JSON for one page ({"transactions": [{date, description, debit, credit, balance}]})"""
+    import pandas as pd
+    rows = [row for row in (payload or {}).get("transactions", []) if isinstance(row, dict)]
+    if not rows:
+        return []
+    values = {role: parse_amounts(pd.Series([row.get(role) for row in rows], dtype=object)).tolist()
+              for role in ("debit", "credit", "amount", "balance")}
+    dates = statement_dates([row.get("date") for row in rows]).tolist()
+    out = []
+    for i, row in enumerate(rows):
+        debit, credit, amount, balance = (values[role][i] for role in ("debit", "credit", "amount", "balance"))
+        parsed = {"date": None if dates[i] != dates[i] else dates[i].date().isoformat(),
+                  "description": str(row.get("description") or "").strip(), "change": signed_change(debit, credit, amount),
+                  "balance": None if balance != balance else balance}
+        out.append(transaction_record(parsed, page, len(out) + 1, "llm"))
+    return out
+# --- END BALANCE CHECK AND ASSEMBLY ---
@@ -0,0 +1,10 @@
+import os
+import sys
+
+# The backend modules import each other as top-level modules
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Keep test runs from writing audit logs, a search index or trace output
+os.environ.setdefault("AUDIT_LOG_ENABLED", "0")
+os.environ.setdefault("SEARCH_INDEX_PATH", "")
+os.environ.setdefault("TRACING_ENABLED", "0")
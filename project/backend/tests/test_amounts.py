@@ -0,0 +1,48 @@
+import math
+
+import pytest
+
+from amounts import detect_decimal_separator, parse_amount, parse_amounts
+
+CASES = [
+    ("1,234.56", 1234.56),
+    ("1.234,56 EUR", 1234.56),
+    ("(500.00)", -500.0),
+    ("1,234.56 DR", -1234.56),
+    ("1,234.56 CR", 1234.56),
+    ("$ 12", 12.0),
+    ("$.50", 0.5),
+    ("-42", -42.0),
+    ("42-", -42.0),
+    ("1 234,5", 1234.5),
+    ("Rs. 500", 500.0),
+    ("Rs.1,200", 1200.0),
+    ("Rs. 1,200.00", 1200.0),
+    ("INR 1,20,000.50", 120000.5),
+    ("₹ 2,500", 2500.0),
+    ("Rs. 1,200.00 Dr.", -1200.0),
+    ("-Rs. 75", -75.0),
+]
+
+@pytest.mark.parametrize("text, expected", CASES)
+def test_parse_amount(text, expected):
+    assert parse_amount(text) == pytest.approx(expected)
+
+@pytest.mark.parametrize("value", [None, "", "n/a", True, float("nan")])
+def test_parse_amount_unreadable(value):
+    assert parse_amount(value) is None
+
+def test_parse_amounts_matches_parse_amount():
+    texts = [text for text, _ in CASES]
+    parsed = parse_amounts(texts).tolist()
+    assert parsed == pytest.approx([parse_amount(text) for text in texts])
+
+def test_parse_amounts_column_convention():
+    # "1.500" alone is ambiguous; the rest of the column says the comma is the decimal separator
+    column = ["1.500", "2.345,10", "12,5"]
+    assert detect_decimal_separator(column) == ","
+    assert parse_amounts(column).tolist() == pytest.approx([1500.0, 2345.1, 12.5])
+
+def test_parse_amounts_mixed_types():
+    parsed = parse_amounts([10, "2,000.00", None, "x", 3.5]).tolist()
+    assert parsed[:2] == [10.0, 2000.0] and math.isnan(parsed[2]) and math.isnan(parsed[3]) and parsed[4] == 3.5
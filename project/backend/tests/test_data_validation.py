@@ -0,0 +1,67 @@
+from data_validation import merge_corrections, parse_review, rule_check
+
+TODAY = "2024-06-30"
+
+def transaction(id, **fields):
+    return {"id": id, "date": "2024-03-01", "description": "Office supplies", "amount": 120.0, "type": "debit",
+            "category": "bills", "dashboardCategory": "Expenses", **fields}
+
+def issue_types(issues):
+    return {(issue["transaction_id"], issue["type"]) for issue in issues}
+
+def test_rule_check_flags_each_rule():
+    transactions = [
+        transaction("t1"),
+        transaction("t2", date="2025-01-01"),
+        transaction("t3", date="not a date"),
+        transaction("t4", amount="abc"),
+        transaction("t5", amount=-40.0, type="credit", description="Refund"),
+        transaction("t6", category="receipts", description="Taxi"),
+        transaction("t7", type="transfer", description="Move"),
+        transaction("t8", dashboardCategory="Revenue", description="Rent"),
+        transaction("t1"),
+        transaction("t9"),
+    ]
+    _, issues, corrections = rule_check(transactions, today=TODAY)
+    assert issue_types(issues) == {
+        ("t2", "future_date"), ("t3", "invalid_date"), ("t4", "amount_error"),
+        ("t5", "negative_amount"), ("t5", "category_mismatch"), ("t6", "category_mismatch"),
+        ("t7", "category_mismatch"), ("t8", "dashboard_mismatch"),
+        ("t1", "duplicate"), ("t9", "possible_duplicate"),
+    }
+    fixes = {(correction["row"], correction["field"], correction["new_value"], correction["action"]) for correction in corrections}
+    assert fixes == {(4, "type", "debit", "other"), (6, "type", "credit", "other"),
+                     (7, "dashboardCategory", "Expenses", "other"), (8, "id", "t1", "removed_duplicate")}
+
+def test_clean_rows_raise_nothing():
+    _, issues, corrections = rule_check([transaction("a"), transaction("b", amount=75.5, description="Paper")], today=TODAY)
+    assert issues == [] and corrections == []
+
+def test_missing_ids_are_added_and_merged_back():
+    transactions = [transaction(None), transaction("b", type="transfer", description="Move")]
+    frame, issues, corrections = rule_check(transactions, today=TODAY)
+    assert ("row-0", "missing_reference") in issue_types(issues)
+    corrected = merge_corrections(transactions, frame, corrections)
+    assert [row["id"] for row in corrected] == ["row-0", "b"] and corrected[1]["type"] == "credit"
+
+def test_merge_removes_same_id_duplicates_only():
+    transactions = [transaction("a"), transaction("a"), transaction("b")]
+    frame, _, corrections = rule_check(transactions, today=TODAY)
+    assert [row["id"] for row in merge_corrections(transactions, frame, corrections)] == ["a", "b"]
+
+def test_parse_review_keeps_reviewed_rows_and_coerces_values():
+    transactions = [transaction("a"), transaction("b")]
+    frame, _, _ = rule_check(transactions, today=TODAY)
+    response = """Here you go: {"issues": [{"transaction_id": "a", "type": "amount_outlier", "severity": "urgent"},
+                                           {"transaction_id": "zzz", "type": "other"}],
+                  "corrections": [{"transaction_id": "a", "field": "amount", "new_value": "1,250.00"},
+                                  {"transaction_id": "a", "field": "date", "new_value": "03/04/2024"},
+                                  {"transaction_id": "a", "field": "type", "new_value": "sideways"},
+                                  {"transaction_id": "a", "field": "id", "new_value": "x"},
+                                  {"transaction_id": "b", "field": "amount", "new_value": "1"}]}"""
+    issues, corrections = parse_review(response, {"a": 0}, frame)
+    assert [(issue["transaction_id"], issue["severity"], issue["source"]) for issue in issues] == [("a", "medium", "ai")]
+    assert [(correction["field"], correction["new_value"]) for correction in corrections] == [("amount", 1250.0), ("date", "2024-03-04")]
+    corrected = merge_corrections(transactions, frame, corrections)
+    assert corrected[0]["amount"] == 1250.0 and corrected[1] == transactions[1]
+    assert parse_review("no json here", {"a": 0}, frame) == ([], [])
@@ -0,0 +1,33 @@
+import numpy as np
+
+from duplicates import _candidate_pairs, find_duplicates
+
+def test_candidate_pairs_match_brute_force():
+    rng = np.random.default_rng(7)
+    day = rng.integers(-1, 60, 400)
+    cents = rng.integers(-1, 3000, 400)
+    left, right = _candidate_pairs(day, cents, tolerance_cents=3, window_days=3, max_scan=400)
+    found = set(zip(left.tolist(), right.tolist()))
+    expected = {(a, b) for a in range(400) for b in range(a + 1, 400)
+                if min(day[a], day[b], cents[a], cents[b]) >= 0
+                and abs(int(cents[a]) - int(cents[b])) <= 3 and abs(int(day[a]) - int(day[b])) <= 3}
+    assert found == expected
+
+def test_find_duplicates_clusters_exact_and_fuzzy_matches():
+    records = [
+        {"id": "a", "date": "2024-03-01", "amount": "120.00", "description": "Office Depot paper"},
+        {"id": "b", "date": "2024-03-01", "amount": 120, "description": "OFFICE DEPOT PAPER"},
+        {"id": "c", "date": "2024-03-02", "amount": "$120.00", "description": "Office Depot papers"},
+        {"id": "d", "date": "2024-03-01", "amount": 121, "description": "Office Depot paper"},
+        {"id": "e", "date": "2024-04-01", "amount": 120, "description": "Office Depot paper"},
+        {"id": "f", "date": "2024-03-01", "amount": 120, "description": "Uber trip"},
+    ]
+    clusters, stats = find_duplicates(records, date_window_days=3, amount_tolerance=0.01, min_similarity=0.85)
+    assert [cluster["ids"] for cluster in clusters] == [["a", "b", "c"]]
+    assert clusters[0]["keep"] == "a" and clusters[0]["match"] == "fuzzy" and clusters[0]["amount"] == 120.0
+    assert stats["duplicate_rows"] == 2
+
+def test_exact_duplicates_without_fuzzy_neighbours():
+    records = [{"date": "2024-03-01", "amount": 50, "description": "Coffee"} for _ in range(3)]
+    clusters, _ = find_duplicates(records)
+    assert clusters[0]["ids"] == ["row-0", "row-1", "row-2"] and clusters[0]["match"] == "exact"
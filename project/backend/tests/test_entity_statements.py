@@ -0,0 +1,78 @@
+import random
+
+import pytest
+
+import entity_statements
+from entity_statements import TOTALS, UNASSIGNED_ENTITY, consolidate, group_totals
+from main import statement_totals
+
+CATEGORIES = ["invoices", "bills", "bank-transactions", "inventory", "item-restocks", "manual-journals",
+              "general-ledgers", "general-entries", "fixed-assets", "long-term-debt", "other", ""]
+VENDORS = ["Acme Corp", "Globex", "Initech", "Umbrella Ltd"]
+
+def random_transactions(seed, count=400):
+    rng = random.Random(seed)
+    transactions = []
+    for row in range(count):
+        vendor = rng.choice(VENDORS)
+        transaction = {
+            "id": f"t{row}",
+            "entity_id": rng.choice(["north", "south", "west", None, ""]),
+            "category": rng.choice(CATEGORIES),
+            "type": rng.choice(["credit", "debit"]),
+            "amount": rng.choice([round(rng.uniform(1, 3000), 2), rng.choice([250.0, 500.0, 1000.0])]),
+            "date": f"2024-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}",
+            "description": f"{vendor.upper()} {rng.choice(['PAYMENT', 'TRANSFER', 'INV'])} {rng.randint(1, 99)}",
+        }
+        if rng.random() < 0.5:
+            transaction["vendor"] = vendor
+        if rng.random() < 0.05:
+            del transaction["category"]
+        transactions.append(transaction)
+    return transactions
+
+def by_entity(transactions):
+    entities = {}
+    for transaction in transactions:
+        entities.setdefault(transaction.get("entity_id") or UNASSIGNED_ENTITY, []).append(transaction)
+    return entities
+
+def category_summary(transactions):
+    """The transaction summary generate_financial_statements builds for one entity"""
+    summary = {}
+    for transaction in transactions:
+        values = summary.setdefault(transaction.get("category", "other"), {"count": 0, "total": 0})
+        values["count"] += 1
+        values["total"] += transaction.get("amount", 0)
+    return summary
+
+@pytest.mark.parametrize("seed", range(5))
+def test_group_totals_match_statement_totals(seed):
+    transactions = random_transactions(seed)
+    entities, totals, summaries = group_totals(transactions)
+    groups = by_entity(transactions)
+    expected = {entity: statement_totals(rows) for entity, rows in groups.items()}
+    assert entities == list(expected)
+    for entity, entity_totals, summary in zip(entities, totals, summaries):
+        assert entity_totals == pytest.approx(expected[entity], abs=1e-6)
+        expected_summary = category_summary(groups[entity])
+        assert summary.keys() == expected_summary.keys()
+        for category, values in summary.items():
+            assert values["count"] == expected_summary[category]["count"]
+            assert values["total"] == pytest.approx(expected_summary[category]["total"])
+    combined, categories = consolidate(totals, summaries)
+    assert combined == pytest.approx({name: sum(totals[name] for totals in expected.values()) for name in TOTALS}, abs=1e-6)
+    assert sum(values["count"] for values in categories.values()) == len(transactions)
+
+def test_partitioned_totals_match_the_single_pass(monkeypatch):
+    transactions = random_transactions(11)
+    serial = group_totals(transactions)
+    monkeypatch.setattr(entity_statements, "ENTITY_STATEMENT_PARALLEL_ROWS", 0)
+    monkeypatch.setattr(entity_statements, "ENTITY_STATEMENT_WORKERS", 2)
+    try:
+        entities, totals, summaries = group_totals(transactions)
+    finally:
+        entity_statements.shutdown(wait=True)
+    assert entities == serial[0] and summaries == serial[2]
+    for parallel, single in zip(totals, serial[1]):
+        assert parallel == pytest.approx(single, abs=1e-6)
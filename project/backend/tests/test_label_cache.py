@@ -0,0 +1,43 @@
+from label_cache import LabelCache, canonicalize, direction, normalise_label
+
+def cache():
+    return LabelCache(threshold=0.8, audit_rate=0.0, enabled=True)
+
+def test_canonicalize_masks_dates_amounts_and_references():
+    assert canonicalize("AWS INVOICE #88213 10/03") == canonicalize("AWS INVOICE #88214 11/03")
+    assert canonicalize("Coffee 2024-03-10 $4.50") == "coffee <date> <amount>"
+
+def test_canonicalize_keeps_the_sign_of_amounts():
+    assert canonicalize("ACME CORP 1,200.00") != canonicalize("ACME CORP -1,200.00")
+    assert direction(canonicalize("ACME CORP -1,200.00")) == {"out"}
+    assert direction(canonicalize("Rs. -500 ACME")) == {"out"}
+
+def test_exact_and_near_hits():
+    labels = cache()
+    labels.store("UBER TRIP 4413 SAN FRANCISCO CA 03/10", "Expenses")
+    assert labels.lookup("UBER TRIP 9921 SAN FRANCISCO CA 04/11") == ("Expenses", 1.0)
+    labels.store("AMAZON WEB SERVICES MONTHLY CLOUD HOSTING SUBSCRIPTION EU WEST", "Expenses")
+    label, similarity = labels.lookup("AMAZON WEB SERVICES MONTHLY CLOUD HOSTING SUBSCRIPTIONS EU WEST")
+    assert label == "Expenses" and 0.8 <= similarity < 1.0
+
+def test_near_hits_never_cross_direction():
+    labels = cache()
+    labels.store("NEFT CR ACME CORPORATION PRIVATE LIMITED MUMBAI", "Revenue")
+    assert labels.lookup("NEFT DR ACME CORPORATION PRIVATE LIMITED MUMBAI") is None
+    assert labels.lookup("NEFT CR ACME CORPORATION PRIVATE LIMITED MUMBAI")[0] == "Revenue"
+    labels.store("ACME CORPORATION PAYMENT 1,200.00", "Revenue")
+    assert labels.lookup("ACME CORPORATION PAYMENT -1,200.00") is None
+    assert labels.lookup("REFUND ACME CORPORATION PAYMENT 1,200.00") is None
+
+def test_only_dashboard_labels_are_stored():
+    labels = cache()
+    labels.store("ACME CORP", "Category: Revenue.")
+    assert labels.lookup("ACME CORP") is None
+    labels.store("ACME CORP", ' "revenue". ')
+    assert labels.lookup("ACME CORP") == ("Revenue", 1.0)
+    assert normalise_label("net  burn") == "Net Burn"
+
+def test_long_texts_are_not_cached():
+    labels = cache()
+    labels.store("x" * 1000, "Revenue")
+    assert labels.lookup("x" * 1000) is None
@@ -0,0 +1,21 @@
+import asyncio
+
+import pytest
+
+import llm_resilience
+from llm_resilience import CircuitBreaker, call_with_resilience
+
+class BadRequest(Exception):
+    status_code = 400
+
+def test_non_retryable_error_releases_the_probe_without_closing_the_circuit(monkeypatch):
+    breaker = CircuitBreaker(failure_threshold=1, cooldown_seconds=0)
+    breaker.record_failure()
+    monkeypatch.setattr(llm_resilience, "BREAKER", breaker)
+
+    async def rejected():
+        raise BadRequest("invalid request")
+    with pytest.raises(BadRequest):
+        asyncio.run(call_with_resilience(rejected, timeout=1, max_retries=0))
+    assert breaker.state == "half_open"
+    assert breaker.allow()  # the next request may probe again
@@ -0,0 +1,26 @@
+import asyncio
+
+from llm_scheduler import LLMScheduler
+
+def test_cancelling_one_waiter_leaves_the_shared_call_running():
+    async def scenario():
+        scheduler, calls = LLMScheduler(), []
+
+        async def call():
+            calls.append(1)
+            await asyncio.sleep(0.05)
+            return "ok"
+        owner = asyncio.create_task(scheduler.coalesce("key", call))
+        await asyncio.sleep(0)
+        waiter = asyncio.create_task(scheduler.coalesce("key", call))
+        await asyncio.sleep(0.01)
+        owner.cancel()
+        assert await waiter == "ok" and len(calls) == 1
+
+        # The last waiter leaving cancels the call and frees the key
+        alone = asyncio.create_task(scheduler.coalesce("key", call))
+        await asyncio.sleep(0.01)
+        alone.cancel()
+        await asyncio.sleep(0)
+        assert scheduler._loop_state().pending == {}
+    asyncio.run(scenario())
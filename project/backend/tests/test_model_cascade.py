@@ -0,0 +1,53 @@
+import json
+
+import pytest
+
+import model_cascade
+from model_cascade import escalation_reason, vote
+
+def document(category, amount, vendor="Acme", confidence=0.9):
+    return json.dumps({"category": category, "confidence": confidence,
+                       "extractedData": {"amount": amount, "vendor": vendor, "description": f"Order from {vendor}"}})
+
+def test_labels_vote_on_the_label_not_the_wording():
+    assert vote("classify", ["Revenue", "revenue.", " Revenue "])[1] == "unanimous"
+    response, outcome = vote("classify", ["Expenses", "Revenue", "Expenses"])
+    assert (response, outcome) == ("Expenses", "majority")
+
+def test_documents_with_the_same_fields_agree_despite_wording():
+    responses = [document("invoices", 1200, vendor="Acme Corp"), document("invoices", "1,200.00", vendor="ACME")]
+    assert vote("analyze_document", responses)[1] == "amounts_agree"
+
+def test_documents_disagree_on_category_or_amount():
+    assert vote("analyze_document", [document("invoices", 100), document("bills", 100)])[1] == "majority"
+    assert vote("analyze_document", [document("invoices", 100), document("invoices", 180)])[1] == "amounts_differ"
+
+def test_final_amounts_within_tolerance():
+    agree = [json.dumps({"final_amount": 99.99}), json.dumps({"final_amount": "100.00", "confidence": 0.9})]
+    assert vote("final_amount", agree) == (agree[1], "amounts_agree")
+    differ = [json.dumps({"final_amount": 100}), json.dumps({"final_amount": 110})]
+    assert vote("final_amount", differ)[1] == "amounts_differ"
+    assert vote("final_amount", ["no json", "still none"])[1] == "unverified"
+
+def test_free_form_tasks_are_unverified():
+    assert vote("professional_notes", ["a", "b"]) == ("a", "unverified")
+
+@pytest.mark.parametrize("task, response, agreed, reason", [
+    ("classify", "Revenue", True, None),
+    ("classify", "Revenue", False, "disagreement"),
+    ("classify", "Category: Revenue", True, "schema"),
+    ("final_amount", json.dumps({"final_amount": 10, "confidence": 0.2}), True, "low_confidence"),
+    ("analyze_document", document("invoices", 10), True, None),
+    ("professional_notes", "anything", True, None),
+])
+def test_escalation_reason(task, response, agreed, reason):
+    assert escalation_reason(task, response, agreed) == reason
+
+def test_empty_tiers_are_rejected(monkeypatch):
+    monkeypatch.setattr(model_cascade, "LLM_MODEL_TIERS", [])
+    with pytest.raises(ValueError):
+        model_cascade._check_tiers()
+    monkeypatch.setattr(model_cascade, "LLM_MODEL_TIERS", ["gpt-4"])
+    monkeypatch.setenv("LLM_MODEL_TIERS_CLASSIFY", " , ")
+    with pytest.raises(ValueError):
+        model_cascade._check_tiers()
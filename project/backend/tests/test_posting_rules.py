@@ -0,0 +1,59 @@
+import pytest
+
+from main import ACCOUNTING_MAP
+from posting_rules import compile_posting_rules
+
+RULES = compile_posting_rules(ACCOUNTING_MAP)
+
+def post(*records):
+    lines, unposted = RULES.post(list(records))
+    return lines, unposted
+
+def balances(lines):
+    return {account: round(debit - credit, 2) for account, debit, credit in
+            lines.groupby('account')[['debit', 'credit']].sum().itertuples()}
+
+def test_every_entry_balances():
+    lines, unposted = post(
+        {'category': 'invoices', 'type': 'credit', 'amount': 118, 'gst': 18},
+        {'category': 'bills', 'type': 'debit', 'amount': '1,000.00'},
+        {'category': 'bank-transactions', 'type': 'debit', 'amount': 20},
+        {'category': 'inventory', 'type': 'credit', 'amount': 100},
+        {'category': 'item-restocks', 'type': 'credit', 'amount': 30},
+    )
+    assert unposted.empty
+    per_entry = lines.groupby('entry')[['debit', 'credit']].sum()
+    assert (per_entry['debit'] - per_entry['credit']).abs().max() < 0.005
+    assert set(per_entry.index) == {0, 1, 2, 3, 4}
+
+def test_sales_invoice_splits_output_tax():
+    lines, _ = post({'category': 'invoices', 'type': 'credit', 'amount': 118, 'gst': 18})
+    assert balances(lines) == {'Sales Revenue': -100.0, 'Output Tax Payable': -18.0, 'Accounts Receivable (Debtors)': 118.0}
+
+def test_bank_direction_follows_type():
+    money_in, _ = post({'category': 'bank-transactions', 'type': 'credit', 'amount': 20})
+    money_out, _ = post({'category': 'bank-transactions', 'type': 'debit', 'amount': 20})
+    assert balances(money_in)['Bank Account'] == 20.0
+    assert balances(money_out)['Bank Account'] == -20.0
+
+def test_inventory_credit_is_a_sale():
+    # As statement_totals books it: cash and revenue for the amount, 80% of it out of stock into COGS
+    lines, _ = post({'category': 'inventory', 'type': 'credit', 'amount': 100})
+    assert balances(lines) == {'Bank Account': 100.0, 'Sales Revenue': -100.0, 'COGS': 80.0, 'Inventory': -80.0}
+
+def test_inventory_debit_is_a_purchase():
+    lines, _ = post({'category': 'inventory', 'type': 'debit', 'amount': 50})
+    assert balances(lines) == {'Inventory': 50.0, 'Bank Account': -50.0}
+
+def test_restock_credit_is_received_on_account():
+    lines, _ = post({'category': 'item-restocks', 'type': 'credit', 'amount': 30})
+    assert balances(lines) == {'Inventory': 30.0, 'Accounts Payable (Creditors)': -30.0}
+
+@pytest.mark.parametrize("record, reason", [
+    ({'category': 'unknown-thing', 'amount': 10}, 'no posting rule for category'),
+    ({'category': 'invoices', 'amount': 0}, 'missing or zero amount'),
+    ({'category': 'invoices', 'amount': 'n/a'}, 'missing or zero amount'),
+])
+def test_unposted(record, reason):
+    lines, unposted = post(record)
+    assert lines.empty and unposted['reason'].tolist() == [reason]
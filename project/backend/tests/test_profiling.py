@@ -0,0 +1,23 @@
+import asyncio
+
+from profiling import Profiler
+
+async def handler():
+    return "response"
+
+def test_capture_slot_is_freed_when_saving_fails(tmp_path):
+    blocker = tmp_path / "not-a-directory"
+    blocker.write_text("")
+    profiler = Profiler(directory=str(blocker))
+    profiler.arm("/route", 2)
+    session = profiler.claim("/route")
+    assert asyncio.run(profiler.capture(session, "request-1", handler)) == "response"
+    assert session.captures == []
+    assert profiler.claim("/route") is session
+
+def test_capture_is_recorded(tmp_path):
+    profiler = Profiler(directory=str(tmp_path))
+    session = profiler.arm("/route", 1, mode="sampler")
+    asyncio.run(profiler.capture(profiler.claim("/route"), "request-1", handler))
+    assert [capture["file"] for capture in session.captures] == [f"{session.id}-0.collapsed"]
+    assert (tmp_path / session.captures[0]["file"]).exists()
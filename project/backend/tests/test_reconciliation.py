@@ -0,0 +1,61 @@
+from reconciliation import annotate, reconcile
+
+def invoice(id, vendor, amount, date, category="invoices"):
+    return {"id": id, "category": category, "type": "credit" if category == "invoices" else "debit",
+            "vendor": vendor, "amount": amount, "date": date}
+
+def payment(id, description, amount, date, type="credit"):
+    return {"id": id, "category": "bank-transactions", "type": type, "description": description, "amount": amount, "date": date}
+
+def test_exact_matches_follow_the_named_party():
+    transactions = [
+        invoice("i1", "Acme Corp", 1000, "2024-01-10"),
+        invoice("i2", "Globex", 1000, "2024-01-12"),
+        payment("p1", "TRANSFER FROM GLOBEX", "1,000.00", "2024-01-20"),
+        payment("p2", "ACME CORP INV 1", 1000, "2024-01-21"),
+        payment("p3", "INITECH", 1000, "2024-01-22"),
+    ]
+    paid, matched, stats = reconcile(transactions)
+    assert paid.tolist() == [1000.0, 1000.0, 1000.0, 1000.0, 0.0]
+    assert matched.tolist() == [-1, -1, 1, 0, -1]
+    assert stats["exact_matches"] == 2 and stats["documents_paid"] == 2 and stats["unmatched_bank_transactions"] == 1
+
+def test_credits_pay_invoices_and_debits_pay_bills_inside_the_date_window():
+    transactions = [
+        invoice("b1", "Globex", 300, "2024-03-01", category="bills"),
+        payment("p1", "GLOBEX", 300, "2024-03-05", type="credit"),
+        payment("p2", "GLOBEX", 300, "2024-01-01", type="debit"),
+        payment("p3", "GLOBEX", 300, "2024-12-01", type="debit"),
+    ]
+    paid, matched, _ = reconcile(transactions, window_days=120, early_days=7)
+    assert matched.tolist() == [-1, -1, -1, -1] and paid[0] == 0.0
+    transactions.append(payment("p4", "GLOBEX", 300, "2024-02-27", type="debit"))
+    assert reconcile(transactions, window_days=120, early_days=7)[1].tolist() == [-1, -1, -1, -1, 0]
+
+def test_partial_payments_settle_one_document():
+    transactions = [
+        invoice("b1", "Globex Supplies", 900, "2024-02-01", category="bills"),
+        payment("p1", "GLOBEX SUPPLIES PART 1", 400, "2024-02-10", type="debit"),
+        payment("p2", "GLOBEX SUPPLIES PART 2", 500, "2024-02-20", type="debit"),
+    ]
+    paid, matched, stats = reconcile(transactions)
+    assert paid.tolist() == [900.0, 400.0, 500.0] and matched.tolist() == [-1, 0, 0]
+    assert stats["partial_payments"] == 2 and stats["documents_paid"] == 1
+    annotated = annotate(transactions, paid, matched)
+    assert annotated[0]["payment_status"] == "paid" and annotated[0]["reconciled_with"] == ["p1", "p2"]
+    assert annotated[1]["reconciled_with"] == "b1" and annotated[1]["reconciled_amount"] == 400.0
+
+def test_matches_stay_inside_a_group():
+    transactions = [invoice("i1", "Acme", 250, "2024-05-01"), payment("p1", "ACME", 250, "2024-05-02")]
+    assert reconcile(transactions, groups=[0, 1])[1].tolist() == [-1, -1]
+    assert reconcile(transactions, groups=[1, 1])[1].tolist() == [-1, 0]
+
+def test_annotate_marks_partial_and_unpaid_documents():
+    transactions = [
+        invoice("i1", "Acme", 500, "2024-05-01"),
+        invoice("i2", "Initech", 80, "2024-05-01"),
+        payment("p1", "ACME PART", 200, "2024-05-03"),
+    ]
+    paid, matched, _ = reconcile(transactions)
+    annotated = annotate(transactions, paid, matched)
+    assert [(row["payment_status"], row["amount_outstanding"]) for row in annotated[:2]] == [("partial", 300.0), ("unpaid", 80.0)]
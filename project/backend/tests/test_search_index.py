@@ -0,0 +1,29 @@
+import json
+
+from search_index import SearchIndex
+
+RESULT = {
+    "category": "Expenses",
+    "dashboardCategory": "Cloud",
+    "extractedData": {"vendor": "Amazon Web Services", "amount": "$1,200.00", "date": "2024-03-10", "description": "Hosting"},
+}
+TEXT = "Invoice for cloud hosting. " + "filler " * 200 + "Account holder passport number X1234567"
+
+def test_full_text_is_not_stored_by_default(tmp_path):
+    path = tmp_path / "index.jsonl"
+    index = SearchIndex(path=str(path), enabled=True, snippet_chars=100)
+    index.add("digest", "invoice.pdf", TEXT, RESULT)
+    stored = json.loads(path.read_text())
+    assert "text" not in stored and "X1234567" not in path.read_text()
+    assert stored["snippet"] == TEXT[:100]
+    # Searchable by its full text in this process, and by fields and snippet after a restart
+    assert index.search(query="passport")["total"] == 1
+    restarted = SearchIndex(path=str(path), enabled=True, snippet_chars=100)
+    assert restarted.search(query="passport")["total"] == 0
+    assert restarted.search(query="cloud hosting", vendor="amazon", amount_min=1000)["total"] == 1
+
+def test_full_text_is_stored_on_request(tmp_path):
+    path = tmp_path / "index.jsonl"
+    SearchIndex(path=str(path), enabled=True, full_text=True).add("digest", "invoice.pdf", TEXT, RESULT)
+    assert json.loads(path.read_text())["text"] == TEXT
+    assert SearchIndex(path=str(path), enabled=True).search(query="passport")["total"] == 1
@@ -0,0 +1,96 @@
+# Lightweight request-scoped span tracing exported as structured JSON log lines.
+# The request id and current span live in contextvars, so nested spans (and work
+# submitted with run_in_context) are attributed to the request that caused them.
+import os
+import sys
+import json
+import time
+import uuid
+import inspect
+import logging
+import functools
+import contextvars
+from contextlib import contextmanager
+
+TRACING_ENABLED = os.getenv("TRACING_ENABLED", "1") == "1"
+
+_request_id = contextvars.ContextVar("request_id", default=None)
+_current_span = contextvars.ContextVar("current_span", default=None)
+
+trace_logger = logging.getLogger("finance_ai.trace")
+trace_logger.propagate = False
+if not trace_logger.handlers:
+    _handler = logging.FileHandler(os.getenv("TRACE_LOG_FILE")) if os.getenv("TRACE_LOG_FILE") else logging.StreamHandler(sys.stderr)
+    _handler.setFormatter(logging.Formatter("%(message)s"))
+    trace_logger.addHandler(_handler)
+    trace_logger.setLevel(logging.INFO)
+
+def new_request_id():
+    return uuid.uuid4().hex
+
+def get_request_id():
+    return _request_id.get()
+
+def set_request_id(request_id):
+    """Bind a request id to the current context; returns a token for reset_request_id"""
+    return _request_id.set(request_id)
+
+def reset_request_id(token):
+    _request_id.reset(token)
+
+def emit(record: dict):
+    if TRACING_ENABLED:
+        trace_logger.info(json.dumps(record, default=str))
+
+@contextmanager
+def span(name, **attributes):
+    """Time a block and log it as a span under the current request and parent span"""
+    if not TRACING_ENABLED:
+        yield {}
+        return
+    parent = _current_span.get()
+    record = {
+        "type": "span",
+        "name": name,
+        "request_id": _request_id.get(),
+        "span_id": uuid.uuid4().hex[:16],
+        "parent_id": parent["span_id"] if parent else None,
+        "start": time.time(),
+        "attributes": attributes,
+    }
+    token = _current_span.set(record)
+    started = time.perf_counter()
+    try:
+        yield record
+        record["status"] = "ok"
+    except BaseException as e:
+        record["status"] = "error"
+        record["error"] = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        record["duration_ms"] = round((time.perf_counter() - started) * 1000, 3)
+        _current_span.reset(token)
+        emit(record)
+
+def traced(name=None):
+    """Decorator wrapping a sync or async function in a span"""
+    def decorator(func):
+        span_name = name or func.__name__
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with span(span_name):
+                    return await func(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(span_name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def run_in_context(func, *args):
+    """Callable for executors that runs func inside a copy of the caller's context"""
+    context = contextvars.copy_context()
+    return functools.partial(context.run, func, *args)